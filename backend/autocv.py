@@ -1,51 +1,49 @@
 import os
 import re
-import requests
 from pydantic import BaseModel
 from fastapi import FastAPI, HTTPException, Response, Depends, Cookie
-from .sqdb import init_db, get_db, ChatSession, UserSession
-from sqlalchemy.orm import Session
+from .sqdb import init_db, get_async_db, run_write, touch_user_session, ChatSession
+from .sessions import init_session_store, session_from_cookie
+from .blobs import add_message, split_prefix
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import datetime
-import uuid
-import json
-from langgraph.store.memory import InMemoryStore
-from .prompts import (
-    cv_prompt_sezione1,
-    cv_prompt_sezione2,
-    cv_prompt_sezione3,
-    cv_prompt_sezione4,
-    cv_prompt_sezione5,
-    cv_prompt_sezione6,
-    cv_prompt_sezione7,
-    judge_prompt_sezione1,
-    judge_prompt_sezione2,
-    judge_prompt_sezione3,
-    judge_prompt_sezione4,
-    judge_prompt_sezione5,
-    judge_prompt_sezione6,
-    judge_prompt_sezione7,
-    judge_final_prompt,
-)
+from . import memory_stores
+from .memory_stores import SessionMemoryStores
+from .prompts import judge_final_prompt
+from .pipeline import SECTIONS
+from . import llm_cache, prompt_templates
+from .validators import prejudge, outcome
+from .history import HISTORY_MAX_TURNS, load_turns, turns_from_texts, section_histories
+from .tokens import estimate_tokens
 from pathlib import Path
+from typing import List, Optional, Tuple
+import asyncio
+from contextlib import asynccontextmanager
+from .regolo import (
+    CV_CREATOR_MODEL, RegoloError, regolo_call_async, aclose_clients, check_config,
+)
 
 
-REGOLO_API_URL = os.getenv("REGOLO_API_URL", "https://api.regolo.ai/v1/completions")
-REGOLO_API_KEY = os.getenv("REGOLO_API_KEY")
-if not REGOLO_API_KEY:
-    raise ValueError("REGOLO_API_KEY environment variable is required")
-CV_CREATOR_MODEL = os.getenv("CV_CREATOR_MODEL", "gpt-oss-120b")
-
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Configurazione e tabelle all'avvio del processo, non all'import del modulo
+    check_config()
+    await asyncio.to_thread(init_db)
+    await asyncio.to_thread(init_session_store)
+    # File dati dei prompt, tokenizer e langgraph caricati qui in un thread, non alla prima richiesta
+    await asyncio.to_thread(prompt_templates.warm_up)
+    await asyncio.to_thread(memory_stores.warm_up)
+    yield
+    await aclose_clients()
 
-app = FastAPI()
 
-headers = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {REGOLO_API_KEY}",
-}
+app = FastAPI(lifespan=lifespan)
 
 
 class QueryRequest(BaseModel):
     question: str
+    no_cache: bool = False  # salta la cache delle risposte LLM per questa richiesta
 
 
 class QueryResponse(BaseModel):
@@ -55,147 +53,201 @@ class QueryResponse(BaseModel):
     feedback: str
 
 
-data_dir = Path(__file__).parent.parent / "data"
+# Prompt composti da prompt_templates (prefissi statici in cache, token contati in
+# /admin/prompt_templates); i campioni GOLD STANDARD (cvs/N.txt) servono alla cache dei verdetti
+sample_text = prompt_templates.sample_text
+
 
-with open(data_dir / "header.txt", "r", encoding="utf-8") as file:
-    example_contract_text1 = file.read()
-with open(data_dir / "subject.txt", "r", encoding="utf-8") as file:
-    example_contract_text2 = file.read()
-with open(data_dir / "Contract.txt", "r", encoding="utf-8") as file:
-    example_contract_text3 = file.read()
-with open(data_dir / "laws_n_regs.txt", "r", encoding="utf-8") as file:
-    example_contract_text4 = file.read()
-with open(data_dir / "signature.txt", "r", encoding="utf-8") as file:
-    example_contract_text5 = file.read()
-with open(data_dir / "privacy_notice.txt", "r", encoding="utf-8") as file:
-    example_contract_text6 = file.read()
-with open(data_dir / "withdrawal.txt", "r", encoding="utf-8") as file:
-    example_contract_text7 = file.read()
+output_dir = Path(__file__).parent.parent / "output"
 
 
-cvs_dir = Path(__file__).parent.parent / "cvs"
 
-sample_texts = {}
-for i in range(1, 8):
-    sample_path = cvs_dir / f"{i}.txt"
+async def call_regolo_completion_async(model: str, prompt: str, temperature=0.7, cache: bool = True) -> str:
     try:
-        with open(sample_path, "r", encoding="utf-8") as f:
-            sample_texts[i] = f.read()
-    except FileNotFoundError:
-        sample_texts[i] = ""
+        return await regolo_call_async(model, prompt, temperature, cache=cache)
+    except RegoloError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
 
-output_dir = Path(__file__).parent.parent / "output"
+# Numero massimo di chiamate Regolo in volo per singola richiesta /autocv
+AUTOCV_MAX_CONCURRENCY = max(1, int(os.getenv("AUTOCV_MAX_CONCURRENCY", 7)))
 
 
-names_tokens_path = data_dir / "names_tokens.json"
+async def _gather_completions(prompts: List[str], done_message: str, cache: bool = True) -> List[str]:
+    """Esegue le completion in parallelo (al massimo AUTOCV_MAX_CONCURRENCY alla volta), mantenendo l'ordine."""
+    semaphore = asyncio.Semaphore(AUTOCV_MAX_CONCURRENCY)
 
+    async def _one(idx: int, prompt: str) -> str:
+        async with semaphore:
+            text = await call_regolo_completion_async(CV_CREATOR_MODEL, prompt, cache=cache)
+        print(done_message.format(idx))
+        return text
 
-def call_regolo_completion(model: str, prompt: str, temperature=0.7) -> str:
-    data = {
-        "model": model,
-        "prompt": prompt,
-        "temperature": temperature,
-    }
-    response = requests.post(REGOLO_API_URL, headers=headers, json=data)
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail=f"Regolo API error: {response.text}")
-    json_response = response.json()
-    if "choices" in json_response and len(json_response["choices"]) > 0 and "text" in json_response["choices"][0]:
-        return json_response["choices"][0]["text"].strip()
-    else:
-        raise HTTPException(status_code=500, detail="Invalid response from Regolo API")
+    return await asyncio.gather(*(_one(idx, p) for idx, p in enumerate(prompts, start=1)))
+
+
+async def _judge_section(section: int, section_text: str, cache: bool = True) -> str:
+    """Note del giudice per la sezione; un testo già giudicato riusa il verdetto in cache."""
+    verdict = prejudge(section, section_text, sample_text(section))
+    await asyncio.to_thread(llm_cache.record_prejudge, outcome(verdict))
+    if verdict is not None:
+        return verdict.notes
+    if cache:
+        verdict = await llm_cache.aget_verdict(section, section_text, sample_text(section))
+        if verdict is not None:
+            return verdict[1]
+    judge_text = await call_regolo_completion_async(
+        CV_CREATOR_MODEL, prompt_templates.judge_prompt(section, section_text), cache=cache
+    )
+    if cache:
+        score_val = _extract_score(judge_text)
+        await llm_cache.aput_verdict(section, section_text, sample_text(section), score_val or 0.0, judge_text)
+    return judge_text
+
+
+# "barrier": ogni tentativo genera tutte le sezioni, poi le giudica tutte.
+# "pipelined": in ogni tentativo ogni sezione fa genera -> giudica senza attendere le altre.
+# Le due modalità accettano il documento con la stessa regola (_document_accepted).
+AUTOCV_MODE = os.getenv("AUTOCV_MODE", "barrier").lower()
+if AUTOCV_MODE not in ("barrier", "pipelined"):
+    raise ValueError(f"AUTOCV_MODE non valido: {AUTOCV_MODE!r} (attesi 'barrier' o 'pipelined')")
+# In modalità pipelined, se il documento non è accettato, si rigenerano solo le sezioni sotto questo punteggio
+AUTOCV_SECTION_TARGET = float(os.getenv("AUTOCV_SECTION_TARGET", 9.5))
+
+# Pesi normalizzati delle sezioni (sommano a 1) e soglie di accettazione del documento
+SECTION_WEIGHTS = [0.03846, 0.03846, 0.38462, 0.26923, 0.03846, 0.11538, 0.11538]
+MIN_SECTION_SCORE = 5
+MIN_WEIGHTED_SCORE = 9.5
+
+
+def _extract_score(judge_text: str) -> Optional[float]:
+    match = re.search(r"Punteggio\s*[:\-]?\s*([0-9]*\.?[0-9]+)", judge_text, re.I)
+    return float(match.group(1)) if match else None
+
+
+def _weighted_score(scores: List[float]) -> float:
+    return sum(s * w for s, w in zip(scores, SECTION_WEIGHTS))
+
+
+def _document_accepted(scores: List[float]) -> bool:
+    """Tutte le sezioni almeno MIN_SECTION_SCORE e media ponderata almeno MIN_WEIGHTED_SCORE."""
+    return all(s >= MIN_SECTION_SCORE for s in scores) and _weighted_score(scores) >= MIN_WEIGHTED_SCORE
+
+
+async def _pipeline_section(
+    section: int,
+    user_info: str,
+    conversation_history: str,
+    semaphore: asyncio.Semaphore,
+    feedback: Optional[str],
+    cache: bool = True,
+) -> Tuple[str, str, float]:
+    """Un tentativo su una sezione: genera e giudica subito; ritorna (testo, giudizio, punteggio)."""
+    prompt = prompt_templates.generation_prompt(section, user_info, conversation_history, feedback)
+    async with semaphore:
+        section_text = await call_regolo_completion_async(CV_CREATOR_MODEL, prompt, cache=cache)
+    async with semaphore:
+        judge_text = await _judge_section(section, section_text, cache)
+    score_val = _extract_score(judge_text) or 0.0
+    return section_text, judge_text, score_val
+
+
+async def _run_pipelined(user_info: str, histories: List[str], max_attempts: int,
+                         cache: bool = True) -> Tuple[List[str], List[str], List[float], int]:
+    """
+    Tentativi come in modalità barrier e stessa regola di accettazione, ma senza barriera tra
+    generazione e giudizio; dal secondo tentativo si rigenerano solo le sezioni sotto
+    AUTOCV_SECTION_TARGET (tutte se nessuna lo è), ognuna con il proprio feedback.
+    Ritorna (testi, giudizi, punteggi, tentativi).
+    """
+    semaphore = asyncio.Semaphore(AUTOCV_MAX_CONCURRENCY)
+    texts, judges, scores = [""] * len(SECTIONS), [""] * len(SECTIONS), [0.0] * len(SECTIONS)
+    pending = list(SECTIONS)
+    attempts = 0
+    while attempts < max_attempts:
+        attempts += 1
+        results = await asyncio.gather(*(
+            _pipeline_section(
+                section, user_info, histories[section - 1], semaphore,
+                judges[section - 1] or None, cache,
+            )
+            for section in pending
+        ))
+        for section, (text, judge_text, score_val) in zip(pending, results):
+            texts[section - 1], judges[section - 1], scores[section - 1] = text, judge_text, score_val
+            print(f"Sezione {section}, tentativo {attempts}: punteggio {score_val}")
+        if _document_accepted(scores):
+            break
+        pending = [s for s in SECTIONS if scores[s - 1] < AUTOCV_SECTION_TARGET] or list(SECTIONS)
+    return texts, judges, scores, attempts
+
+
+def _save_output(document: str) -> Path:
+    output_dir.mkdir(exist_ok=True)
+    output_file = output_dir / "Assunzione.txt"
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(document)
+    return output_file
+
+
+def _save_chat(db, session_token: str, user_msg: ChatSession, system_prompt: str, judge_msg: ChatSession) -> None:
+    db.add(user_msg)
+    # Il primo prompt (per tracciabilità) nei blob: il template statico si salva una volta sola
+    add_message(
+        db, session_token, "System", system_prompt,
+        split_prefix(system_prompt, prompt_templates.generation_prefix(1)),
+    )
+    db.add(judge_msg)
 
 
-# Memory store per session token
-user_memory_stores = {}
+# Memory store per session token (LRU + scadenza per inattività)
+user_memory_stores = SessionMemoryStores()
 
 
 @app.post("/autocv", response_model=QueryResponse)
 async def autocv_request(
     request: QueryRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     response: Response = None,
     session_token: str = Cookie(default=None),
 ):
-    init_db()
-
+    # Le funzioni DB sincrone condivise girano con run_sync sulla sessione async,
+    # così una richiesta lenta non ferma l'event loop per le altre
     print("=== INIZIO GESTIONE RICHIESTA AUTOCV ===")
 
-    # Load existing tokens from file or create empty dict
-    names_tokens = {}
-    try:
-        with open(names_tokens_path, "r") as f:
-            names_tokens = json.load(f)
-    except FileNotFoundError:
-        names_tokens = {}
-
     # Manage session token
-    if session_token and session_token in names_tokens:
-        token = session_token
-        print(f"Token di sessione esistente rilevato: {token}, lo riutilizzo")
-    else:
-        token = str(uuid.uuid4())
-        names_tokens[token] = True
-        with open(names_tokens_path, "w") as f:
-            json.dump(names_tokens, f)
-        if response:
-            response.set_cookie(key="session_token", value=token, httponly=True)
-        print(f"Nuovo token di sessione creato ed impostato nel cookie: {token}")
-
-    session_token = token
+    # Le scritture (brevi) vanno sul pool sincrono in un thread, vedi run_write
+    session_token = await asyncio.to_thread(run_write, session_from_cookie, session_token, response)
 
     # Create or update UserSession
-    user_session = db.query(UserSession).filter(UserSession.user_id == session_token).first()
-    now = datetime.datetime.now()
-    if user_session is None:
-        user_session = UserSession(
-            user_id=session_token,
-            start_time=now,
-            last_access_time=now,
-        )
-        db.add(user_session)
+    if await asyncio.to_thread(run_write, touch_user_session, session_token):
         print("Nuova sessione utente creata")
     else:
-        user_session.last_access_time = now
         print("Sessione utente aggiornata")
-    db.commit()
 
     user_namespace = (session_token, "memories")
 
     # Load conversation history
-    last_message_obj = (
-        db.query(ChatSession.session_id)
-        .order_by(ChatSession.id.desc())
-        .limit(1)
-        .one_or_none()
+    last_session_id = await db.scalar(
+        select(ChatSession.session_id).order_by(ChatSession.id.desc()).limit(1)
     )
 
-    if last_message_obj is None or last_message_obj[0] != session_token:
-        chat_msgs = (
-            db.query(ChatSession.message)
-            .filter(ChatSession.session_id == session_token)
-            .filter(ChatSession.type != "System")
-            .order_by(ChatSession.id.desc())
-            .limit(30)
-            .all()
-        )
-        conversation_history = "\n".join(m[0] for m in reversed(chat_msgs))
-        user_memory_stores[session_token] = InMemoryStore()
-        memory_store = user_memory_stores[session_token]
+    if last_session_id != session_token:
+        turns = await db.run_sync(load_turns, session_token)
+        memory_store = user_memory_stores.get(session_token, fresh=True)
         print("Storico conversazioni caricato da DB")
     else:
         memory_store = user_memory_stores.get(session_token)
-        if memory_store is None:
-            memory_store = InMemoryStore()
-            user_memory_stores[session_token] = memory_store
-        messages = memory_store.search(user_namespace, limit=30)
-        conversation_history = "\n".join(msg.value.get("text", "") for msg in messages)
+        messages = memory_store.search(user_namespace, limit=HISTORY_MAX_TURNS)
+        turns = turns_from_texts(msg.value.get("text", "") for msg in messages)
         print("Storico conversazioni caricato da memoria in sessione")
 
-    print(f"Storico conversazioni:\n{conversation_history}\n")
+    # Uno storico per sezione, troncato al budget di token della sezione
+    histories = section_histories(turns)
+    print("Storico conversazioni, token per sezione:", [estimate_tokens(h) for h in histories])
 
     user_info = request.question
+    use_cache = not request.no_cache
 
     max_attempts = 3
     attempts = 0
@@ -203,156 +255,76 @@ async def autocv_request(
     score = 0.0
     current_cv = ""
 
-    while attempts < max_attempts:
+    if AUTOCV_MODE == "pipelined":
+        print("\nModalità pipelined: ogni sezione viene generata e giudicata in autonomia...")
+        section_texts, judge_texts, scores, attempts = await _run_pipelined(
+            user_info, histories, max_attempts, use_cache
+        )
+        current_cv = "\n\n".join(section_texts)
+        judge_text = "\n\n".join(judge_texts)
+        print(f"Punteggio medio ponderato calcolato: {_weighted_score(scores)}")
+        # Solo per lo storico: nessuna chiamata, quindi non entra nelle statistiche dei template
+        full_cv_prompt1 = "".join(prompt_templates.generation_prompt_parts(1, user_info, histories[0], None))
+        judge_final = await call_regolo_completion_async(
+            CV_CREATOR_MODEL, judge_final_prompt(judge_text), cache=use_cache
+        )
+
+    # Modalità barrier: tentativi sull'intero documento con il feedback di tutte le sezioni
+    while AUTOCV_MODE != "pipelined" and attempts < max_attempts:
         attempts += 1
         print(f"\n--- Avvio tentativo numero {attempts} ---")
 
         # Genera prompt di creazione sezione, passandogli feedback di giudice se presente
         print("Generazione prompt per ciascuna sezione del CV...")
-
-        full_cv_prompt1 = cv_prompt_sezione1(
-            user_info,
-            example_contract_text1,
-            conversation_history,
-            judge_feedback if judge_feedback else None,
-        )
-        print("Prompt sezione 1 generato")
-        full_cv_prompt2 = cv_prompt_sezione2(
-            user_info,
-            example_contract_text2,
-            conversation_history,
-            judge_feedback if judge_feedback else None,
-        )
-        print("Prompt sezione 2 generato")
-        full_cv_prompt3 = cv_prompt_sezione3(
-            user_info,
-            example_contract_text3,
-            conversation_history,
-            judge_feedback if judge_feedback else None,
-        )
-        print("Prompt sezione 3 generato")
-        full_cv_prompt4 = cv_prompt_sezione4(
-            user_info,
-            example_contract_text4,
-            conversation_history,
-            judge_feedback if judge_feedback else None,
-        )
-        print("Prompt sezione 4 generato")
-        full_cv_prompt5 = cv_prompt_sezione5(
-            user_info,
-            example_contract_text5,
-            conversation_history,
-            judge_feedback if judge_feedback else None,
-        )
-        print("Prompt sezione 5 generato")
-        full_cv_prompt6 = cv_prompt_sezione6(
-            user_info,
-            example_contract_text6,
-            conversation_history,
-            judge_feedback if judge_feedback else None,
-        )
-        print("Prompt sezione 6 generato")
-        full_cv_prompt7 = cv_prompt_sezione7(
-            user_info,
-            example_contract_text7,
-            conversation_history,
-            judge_feedback if judge_feedback else None,
-        )
-        print("Prompt sezione 7 generato")
+        full_cv_prompts = [
+            prompt_templates.generation_prompt(
+                section,
+                user_info,
+                histories[section - 1],
+                judge_feedback if judge_feedback else None,
+            )
+            for section in SECTIONS
+        ]
+        full_cv_prompt1 = full_cv_prompts[0]
 
         print("\nChiamate API Regolo per generare le sezioni del CV...")
-
-        current_cv_section1 = call_regolo_completion(CV_CREATOR_MODEL, full_cv_prompt1)
-        print("Sezione 1 ricevuta")
-        current_cv_section2 = call_regolo_completion(CV_CREATOR_MODEL, full_cv_prompt2)
-        print("Sezione 2 ricevuta")
-        current_cv_section3 = call_regolo_completion(CV_CREATOR_MODEL, full_cv_prompt3)
-        print("Sezione 3 ricevuta")
-        current_cv_section4 = call_regolo_completion(CV_CREATOR_MODEL, full_cv_prompt4)
-        print("Sezione 4 ricevuta")
-        current_cv_section5 = call_regolo_completion(CV_CREATOR_MODEL, full_cv_prompt5)
-        print("Sezione 5 ricevuta")
-        current_cv_section6 = call_regolo_completion(CV_CREATOR_MODEL, full_cv_prompt6)
-        print("Sezione 6 ricevuta")
-        current_cv_section7 = call_regolo_completion(CV_CREATOR_MODEL, full_cv_prompt7)
-        print("Sezione 7 ricevuta")
+        current_cv_sections = await _gather_completions(full_cv_prompts, "Sezione {} ricevuta", use_cache)
 
         print(f"Risposta ricevuta da Regolo API al tentativo {attempts}")
 
         # Unisci le sezioni per i prompt di giudizio
-        combined_cv_text = "\n\n".join(
-            [
-                current_cv_section1,
-                current_cv_section2,
-                current_cv_section3,
-                current_cv_section4,
-                current_cv_section5,
-                current_cv_section6,
-                current_cv_section7,
-            ]
-        )
+        combined_cv_text = "\n\n".join(current_cv_sections)
 
         print("\nChiamate API Regolo per valutare ogni sezione del CV...")
+        judge_semaphore = asyncio.Semaphore(AUTOCV_MAX_CONCURRENCY)
 
-        judge_text1 = call_regolo_completion(
-            CV_CREATOR_MODEL, judge_prompt_sezione1(current_cv_section1, sample_texts[1])
-        )
-        print("Valutazione sezione 1 ricevuta")
-        judge_text2 = call_regolo_completion(
-            CV_CREATOR_MODEL, judge_prompt_sezione2(current_cv_section2, sample_texts[2])
-        )
-        print("Valutazione sezione 2 ricevuta")
-        judge_text3 = call_regolo_completion(
-            CV_CREATOR_MODEL, judge_prompt_sezione3(current_cv_section3, sample_texts[3])
-        )
-        print("Valutazione sezione 3 ricevuta")
-        judge_text4 = call_regolo_completion(
-            CV_CREATOR_MODEL, judge_prompt_sezione4(current_cv_section4, sample_texts[4])
-        )
-        print("Valutazione sezione 4 ricevuta")
-        judge_text5 = call_regolo_completion(
-            CV_CREATOR_MODEL, judge_prompt_sezione5(current_cv_section5, sample_texts[5])
-        )
-        print("Valutazione sezione 5 ricevuta")
-        judge_text6 = call_regolo_completion(
-            CV_CREATOR_MODEL, judge_prompt_sezione6(current_cv_section6, sample_texts[6])
-        )
-        print("Valutazione sezione 6 ricevuta")
-        judge_text7 = call_regolo_completion(
-            CV_CREATOR_MODEL, judge_prompt_sezione7(current_cv_section7, sample_texts[7])
-        )
-        print("Valutazione sezione 7 ricevuta")
+        async def _judge_one(section: int, section_text: str) -> str:
+            async with judge_semaphore:
+                text = await _judge_section(section, section_text, use_cache)
+            print(f"Valutazione sezione {section} ricevuta")
+            return text
+
+        judge_texts = await asyncio.gather(*(
+            _judge_one(section, section_text)
+            for section, section_text in zip(SECTIONS, current_cv_sections)
+        ))
 
         # Unisci tutti i giudizi delle sezioni in un unico testo, separati da due newline
-        judge_text = "\n\n".join(
-            [
-                judge_text1,
-                judge_text2,
-                judge_text3,
-                judge_text4,
-                judge_text5,
-                judge_text6,
-                judge_text7,
-            ]
-        )
+        judge_text = "\n\n".join(judge_texts)
 
         current_cv = combined_cv_text
-        judge_final = call_regolo_completion(
-            CV_CREATOR_MODEL, judge_final_prompt(judge_text)
+        judge_final = await call_regolo_completion_async(
+            CV_CREATOR_MODEL, judge_final_prompt(judge_text), cache=use_cache
         )
 
         print(f"\nValutazione del documento al tentativo {attempts}")
 
         # Estrai punteggio da ciascun judge_textX
-        judge_texts = [judge_text1, judge_text2, judge_text3, judge_text4, judge_text5, judge_text6, judge_text7]
         scores = []
-        # Pesi normalizzati che sommano a 1
-        weights = [0.03846, 0.03846, 0.38462, 0.26923, 0.03846, 0.11538, 0.11538]
 
         for idx, jt in enumerate(judge_texts, start=1):
-            match = re.search(r"Punteggio\s*[:\-]?\s*([0-9]*\.?[0-9]+)", jt, re.I)
-            if match:
-                score_val = float(match.group(1))
+            score_val = _extract_score(jt)
+            if score_val is not None:
                 scores.append(score_val)
                 print(f"Punteggio estratto dalla sezione {idx}: {score_val}")
             else:
@@ -360,11 +332,11 @@ async def autocv_request(
                 scores.append(0.0)  # o altra scelta se preferisci
 
         # Calcolo media ponderata
-        weighted_score = sum(s * w for s, w in zip(scores, weights))
+        weighted_score = _weighted_score(scores)
 
         print(f"Punteggio medio ponderato calcolato: {weighted_score}")
 
-        if all(s >= 5 for s in scores) and weighted_score >= 9.5:
+        if _document_accepted(scores):
             print(f"Tutti i punteggi sono >= 5 e la media ponderata ({weighted_score}) è sufficiente. Esco dal ciclo.")
             break
         else:
@@ -375,13 +347,8 @@ async def autocv_request(
             judge_feedback = judge_text
 
 
-    output_dir = Path(__file__).parent.parent / "output"
-    output_dir.mkdir(exist_ok=True)
-    
-    output_file = output_dir / "Assunzione.txt"
     print("\nGenerazione ed salvataggio documento di assunzione")
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(current_cv)
+    output_file = await asyncio.to_thread(_save_output, current_cv)
     print(f"Documento salvato su {output_file}")
 
     memory_store.put(user_namespace, f"user{attempts}", {"text": f"User: {request.question}"})
@@ -394,12 +361,6 @@ async def autocv_request(
         message=str(request.question),
         created_at=datetime.datetime.now(),
     )
-    system_msg = ChatSession(
-        session_id=session_token,
-        type="System",
-        message=str(full_cv_prompt1),  # Save the first prompt for traceability
-        created_at=datetime.datetime.now(),
-    )
     judge_msg = ChatSession(
         session_id=session_token,
         type="Judge",
@@ -407,10 +368,12 @@ async def autocv_request(
         created_at=datetime.datetime.now(),
     )
 
-    db.add(user_msg)
-    db.add(system_msg)
-    db.add(judge_msg)
-    db.commit()
+    await asyncio.to_thread(run_write, _save_chat, session_token, user_msg, str(full_cv_prompt1), judge_msg)
 
     print("Tutti i dati salvati nel database, risposta in uscita.\n=== FINE GESTIONE AUTOCV ===")
     return QueryResponse(final_cv=current_cv, score=score, attempts=attempts, feedback=judge_final)
+
+
+@app.get("/admin/memory_stores")
+def admin_memory_stores():
+    return {"ok": True, "stats": user_memory_stores.stats()}
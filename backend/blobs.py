@@ -0,0 +1,158 @@
+# blobs.py
+# Corpi dei messaggi grandi (prompt System, documenti Assistant) salvati una sola volta per
+# contenuto nella tabella blobs, compressi con zstd (zlib se zstandard non è installato).
+# Le righe di messages tengono solo gli hash dei pezzi: un prompt è "prefisso statico + parte
+# dinamica", così il template comune a tutte le richieste occupa spazio una volta sola.
+import datetime
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from .sqdb import Blob, ChatSession
+
+try:
+    import zstandard
+except ImportError:  # pip install zstandard
+    zstandard = None
+
+# Tipi di messaggio salvati come blob; User e Judge restano in chiaro in messages.message
+BLOB_TYPES = ("System", "Assistant")
+BLOB_ZSTD_LEVEL = int(os.getenv("ZEROHR_BLOB_ZSTD_LEVEL", 10))
+BLOB_ZLIB_LEVEL = int(os.getenv("ZEROHR_BLOB_ZLIB_LEVEL", 6))
+# Testi decompressi tenuti in RAM (immutabili: l'hash identifica il contenuto)
+BLOB_CACHE_ENTRIES = int(os.getenv("ZEROHR_BLOB_CACHE_ENTRIES", 256))
+
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _compress(raw: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=BLOB_ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, BLOB_ZLIB_LEVEL)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("blob compresso con zstd ma 'zstandard' non è installato")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"codec blob sconosciuto: {codec!r}")
+
+
+def _cache_get(h: str) -> Optional[str]:
+    with _cache_lock:
+        text = _cache.get(h)
+        if text is not None:
+            _cache.move_to_end(h)
+        return text
+
+
+def _cache_put(h: str, text: str) -> None:
+    with _cache_lock:
+        _cache[h] = text
+        _cache.move_to_end(h)
+        while len(_cache) > BLOB_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _insert_ignore(db: Session, row: Dict) -> None:
+    """INSERT che non fa nulla se l'hash c'è già (anche se inserito in parallelo da un altro processo)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        if db.get(Blob, row["hash"]) is None:
+            db.add(Blob(**row))
+            db.flush()
+        return
+    db.execute(insert(Blob).values(**row).on_conflict_do_nothing(index_elements=["hash"]))
+
+
+def put_blob(db: Session, text: str) -> str:
+    """Salva il testo (se nuovo) e ritorna il suo hash; il commit resta al chiamante."""
+    h = content_hash(text)
+    # Lookup per chiave primaria: il contenuto già presente non si ricomprime né si riscrive.
+    # (La cache in RAM non basta: un blob messo in cache da una transazione poi annullata non è nel DB.)
+    if db.query(Blob.hash).filter(Blob.hash == h).first() is not None:
+        return h
+    raw = text.encode("utf-8")
+    codec, data = _compress(raw)
+    _insert_ignore(db, {
+        "hash": h, "codec": codec, "size": len(raw), "data": data, "created_at": datetime.datetime.now(),
+    })
+    _cache_put(h, text)
+    return h
+
+
+def get_blobs(db: Session, hashes: Iterable[str]) -> Dict[str, str]:
+    """Testi per hash, con una sola query per quelli non in cache."""
+    out: Dict[str, str] = {}
+    missing = []
+    for h in dict.fromkeys(hashes):
+        text = _cache_get(h)
+        if text is None:
+            missing.append(h)
+        else:
+            out[h] = text
+    if missing:
+        for h, codec, data in db.query(Blob.hash, Blob.codec, Blob.data).filter(Blob.hash.in_(missing)):
+            text = _decompress(codec, data).decode("utf-8")
+            _cache_put(h, text)
+            out[h] = text
+    return out
+
+
+def split_prefix(text: str, prefix: str) -> List[str]:
+    """[prefisso, resto] se il testo inizia con il prefisso (es. template statico), altrimenti [testo]."""
+    if prefix and text.startswith(prefix):
+        return [prefix, text[len(prefix):]]
+    return [text]
+
+
+def new_message(db: Session, session_id: str, type: str, text: str,
+                parts: Optional[Sequence[str]] = None) -> ChatSession:
+    """
+    Riga ChatSession da aggiungere alla sessione. I tipi in BLOB_TYPES finiscono nei blob:
+    parts (es. prefisso statico e parte dinamica del prompt) va passato se il testo ne è la
+    concatenazione, così i pezzi comuni a più messaggi si deduplicano.
+    """
+    row = ChatSession(session_id=session_id, type=type, created_at=datetime.datetime.now())
+    if type not in BLOB_TYPES:
+        row.message = text
+        return row
+    parts = [p for p in (parts if parts is not None else [text]) if p]
+    row.blob_hashes = ",".join(put_blob(db, p) for p in parts)
+    return row
+
+
+def add_message(db: Session, session_id: str, type: str, text: str,
+                parts: Optional[Sequence[str]] = None) -> ChatSession:
+    row = new_message(db, session_id, type, text, parts)
+    db.add(row)
+    return row
+
+
+def resolve_messages(db: Session, rows: Sequence[Tuple[str, Optional[str], Optional[str]]]) -> List[Tuple[str, str]]:
+    """(tipo, message, blob_hashes) -> (tipo, testo): le righe vecchie hanno il testo in message."""
+    hashes = [h for _, _, joined in rows if joined for h in joined.split(",")]
+    texts = get_blobs(db, hashes) if hashes else {}
+    out = []
+    for type_, message, joined in rows:
+        if joined:
+            message = "".join(texts.get(h, "") for h in joined.split(","))
+        out.append((type_, message or ""))
+    return out
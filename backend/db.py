@@ -0,0 +1,125 @@
+# db.py
+# Factory unica degli engine SQLAlchemy per sqdb (assunzioni.db) e sqdb_pipe (key_flow.db).
+# SQLite: WAL (i lettori non bloccano lo scrittore), synchronous=NORMAL, busy_timeout e mmap,
+# impostati su ogni nuova connessione del pool. Altri DB (Postgres): pool dimensionato per
+# API + thread dei worker Celery, con pre-ping e riciclo delle connessioni.
+# Gli endpoint async dell'API usano engine asincroni sugli stessi DB (aiosqlite / asyncpg),
+# creati solo al primo uso: i worker Celery restano sincroni e non importano quei driver.
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+
+# --- SQLite ---
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 10000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+# --- Pool (Postgres e SQLite su file) ---
+# Default: 7 thread di sezione per worker + richieste API concorrenti
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+
+def sqlite_pragmas():
+    """PRAGMA applicati a ogni connessione SQLite (journal_mode=WAL resta anche nel file)."""
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+# Driver asincroni per backend
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _is_memory(url) -> bool:
+    return url.database in (None, "", ":memory:")
+
+
+def _listen_pragmas(engine: Engine, in_memory: bool) -> None:
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for pragma in sqlite_pragmas():
+            if in_memory and "journal_mode" in pragma:
+                continue
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def _sqlite_engine(url) -> Engine:
+    in_memory = _is_memory(url)
+    kwargs = {
+        # Il timeout del driver copre anche il BEGIN, non solo le query
+        "connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    }
+    if in_memory:
+        # Un solo DB in RAM condiviso da tutti i thread
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(
+            poolclass=QueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    engine = create_engine(url, **kwargs)
+    _listen_pragmas(engine, in_memory)
+    return engine
+
+
+def make_engine(database_url: str) -> Engine:
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        return _sqlite_engine(url)
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def make_async_engine(database_url: str):
+    """Engine asincrono sullo stesso DB di make_engine, con gli stessi PRAGMA e limiti del pool."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Nessun driver async per {backend!r} (supportati: {', '.join(ASYNC_DRIVERS)})")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+
+    if backend == "sqlite":
+        in_memory = _is_memory(url)
+        kwargs = {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if in_memory:
+            kwargs["poolclass"] = StaticPool
+        else:
+            kwargs.update(
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+            )
+        engine = create_async_engine(url, **kwargs)
+        _listen_pragmas(engine.sync_engine, in_memory)
+        return engine
+
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
@@ -0,0 +1,187 @@
+# events.py
+# Canale eventi per run: i worker (o il motore inline) scrivono su uno stream Redis
+# per run, gli endpoint SSE lo rileggono dall'inizio e poi in attesa dei nuovi eventi.
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Collection, Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+
+# Stessa durata dei risultati Celery (result_expires)
+EVENTS_TTL = 900
+EVENTS_MAXLEN = 5000
+# Dopo quanti secondi senza eventi lo stream SSE viene chiuso
+EVENTS_IDLE_TIMEOUT = float(os.getenv("ZEROHR_EVENTS_IDLE_TIMEOUT", 600))
+# Intervallo dei commenti keep-alive SSE (secondi)
+EVENTS_KEEPALIVE = 15
+
+# Eventi che chiudono lo stream di una run
+TERMINAL_TYPES = ("done", "failed", "cancelled")
+# Eventi di avanzamento (senza il testo parziale delle sezioni)
+PROGRESS_TYPES = ("status",) + TERMINAL_TYPES
+
+# Le delta di testo vengono accorpate per non fare un XADD per ogni token
+DELTA_FLUSH_CHARS = 64
+DELTA_FLUSH_SECONDS = 0.1
+
+_redis_events = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=1, decode_responses=True)
+_aredis_events: Optional[aioredis.Redis] = None
+
+
+def _events_key(run_id: str) -> str:
+    return f"zerohr:events:{run_id}"
+
+
+def publish(run_id: str, event: Dict[str, Any]) -> None:
+    """Aggiunge un evento allo stream della run (best effort: non deve mai rompere la pipeline)."""
+    key = _events_key(run_id)
+    try:
+        pipe = _redis_events.pipeline()
+        pipe.xadd(key, {"data": json.dumps(event)}, maxlen=EVENTS_MAXLEN, approximate=True)
+        pipe.expire(key, EVENTS_TTL)
+        pipe.execute()
+    except Exception as e:
+        print("[EVENTS] publish error:", run_id, e)
+
+
+async def apublish(run_id: str, event: Dict[str, Any]) -> None:
+    """publish per il codice sull'event loop (motore inline, endpoint async): client redis.asyncio."""
+    key = _events_key(run_id)
+    try:
+        pipe = _get_async_redis().pipeline()
+        pipe.xadd(key, {"data": json.dumps(event)}, maxlen=EVENTS_MAXLEN, approximate=True)
+        pipe.expire(key, EVENTS_TTL)
+        await pipe.execute()
+    except Exception as e:
+        print("[EVENTS] publish error:", run_id, e)
+
+
+def _status_event(section: int, status: str, score: Optional[float], attempt: Optional[int]) -> Dict[str, Any]:
+    return {"type": "status", "section": section, "status": status, "score": score, "attempt": attempt}
+
+
+def publish_status(run_id: Optional[str], section: int, status: str,
+                   score: Optional[float] = None, attempt: Optional[int] = None) -> None:
+    """Cambio di stato di una sezione (in_creazione, in_giudizio, giudicato, failed, ...)."""
+    if not run_id:
+        return
+    publish(run_id, _status_event(section, status, score, attempt))
+
+
+async def apublish_status(run_id: Optional[str], section: int, status: str,
+                          score: Optional[float] = None, attempt: Optional[int] = None) -> None:
+    if not run_id:
+        return
+    await apublish(run_id, _status_event(section, status, score, attempt))
+
+
+class _DeltaBuffer:
+    """Accorpa i token di una sezione in eventi "delta" (al più uno ogni DELTA_FLUSH_CHARS/SECONDS)."""
+
+    def __init__(self, run_id: str, section: int, attempt: int = 0):
+        self.run_id = run_id
+        self.section = section
+        self.attempt = attempt
+        self._buffer = ""
+        self._last_flush = time.monotonic()
+
+    def _start_event(self) -> Dict[str, Any]:
+        return {"type": "section_start", "section": self.section, "attempt": self.attempt}
+
+    def _add(self, delta: str) -> bool:
+        """Accoda la delta; True se è ora di pubblicare."""
+        self._buffer += delta
+        return len(self._buffer) >= DELTA_FLUSH_CHARS or time.monotonic() - self._last_flush >= DELTA_FLUSH_SECONDS
+
+    def _take(self) -> Optional[Dict[str, Any]]:
+        event = {"type": "delta", "section": self.section, "text": self._buffer} if self._buffer else None
+        self._buffer = ""
+        self._last_flush = time.monotonic()
+        return event
+
+
+class DeltaRelay(_DeltaBuffer):
+    """Callback on_delta per lo streaming Regolo (worker Celery): accorpa i token e li pubblica sulla run."""
+
+    def __init__(self, run_id: str, section: int, attempt: int = 0):
+        super().__init__(run_id, section, attempt)
+        publish(run_id, self._start_event())
+
+    def __call__(self, delta: str) -> None:
+        if self._add(delta):
+            self.flush()
+
+    def flush(self) -> None:
+        event = self._take()
+        if event:
+            publish(self.run_id, event)
+
+
+class AsyncDeltaRelay(_DeltaBuffer):
+    """Come DeltaRelay ma per l'event loop: on_delta è una coroutine, regolo_call_async la attende."""
+
+    async def start(self) -> None:
+        await apublish(self.run_id, self._start_event())
+
+    async def __call__(self, delta: str) -> None:
+        if self._add(delta):
+            await self.flush()
+
+    async def flush(self) -> None:
+        event = self._take()
+        if event:
+            await apublish(self.run_id, event)
+
+
+def _get_async_redis() -> aioredis.Redis:
+    global _aredis_events
+    if _aredis_events is None:
+        _aredis_events = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=1, decode_responses=True)
+    return _aredis_events
+
+
+async def iter_events(
+    run_id: str, types: Optional[Collection[str]] = None
+) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    Rilegge gli eventi della run dal primo e resta in attesa dei successivi (solo quelli in types, se indicato).
+    Produce None a ogni intervallo di keep-alive; termina con un evento terminale o per inattività.
+    """
+    r = _get_async_redis()
+    key = _events_key(run_id)
+    last_id = "0"
+    idle_since = time.monotonic()
+    while True:
+        resp = await r.xread({key: last_id}, block=EVENTS_KEEPALIVE * 1000, count=100)
+        if not resp:
+            if time.monotonic() - idle_since > EVENTS_IDLE_TIMEOUT:
+                return
+            yield None
+            continue
+        idle_since = time.monotonic()
+        for _, entries in resp:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                event = json.loads(fields["data"])
+                if types is None or event.get("type") in types:
+                    yield event
+                if event.get("type") in TERMINAL_TYPES:
+                    return
+
+
+def format_sse(event: Optional[Dict[str, Any]]) -> str:
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(event)}\n\n"
+
+
+async def aclose() -> None:
+    global _aredis_events
+    if _aredis_events is not None:
+        await _aredis_events.aclose()
+    _aredis_events = None
@@ -0,0 +1,106 @@
+# history.py
+# Storico conversazione per i prompt di generazione, con budget di token per sezione:
+# si parte dai turni più recenti, i più vecchi vengono troncati o scartati, e al posto dei
+# contratti interi generati in precedenza si usa solo il testo della sezione (snapshot).
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .blobs import resolve_messages
+from .sqdb import ChatSession
+from .tokens import CHARS_PER_TOKEN, estimate_tokens
+
+SECTIONS = range(1, 8)
+
+# Budget massimo dello storico per prompt (token stimati)
+HISTORY_TOKENS = int(os.getenv("ZEROHR_HISTORY_TOKENS", 1200))
+# Turni letti dal DB al massimo (il budget poi decide quanti ne entrano davvero)
+HISTORY_MAX_TURNS = int(os.getenv("ZEROHR_HISTORY_MAX_TURNS", 30))
+# Quota del budget per sezione: oggetto e firma sono quasi fissi, i dettagli del contratto no
+SECTION_HISTORY_SHARE = {1: 0.5, 2: 0.25, 3: 1.0, 4: 0.5, 5: 0.25, 6: 0.5, 7: 0.25}
+# Quota massima del budget per il testo precedente della sezione
+PREVIOUS_TEXT_SHARE = 0.6
+# Sotto questo margine non conviene troncare un altro turno
+MIN_TURN_TOKENS = 24
+
+# (tipo, testo): tipo come in ChatSession ("User", "Assistant", "Judge", ...)
+Turn = Tuple[str, str]
+
+
+def section_budget(section: int) -> int:
+    return int(HISTORY_TOKENS * SECTION_HISTORY_SHARE.get(section, 1.0))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Taglia il testo entro max_tokens (stimati); keep="tail" conserva la parte finale."""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    chars = int(max_tokens * CHARS_PER_TOKEN)
+    while chars > 0:
+        cut = text[:chars] if keep == "head" else text[-chars:]
+        if estimate_tokens(cut) + 1 <= max_tokens:
+            return cut + " […]" if keep == "head" else "[…] " + cut
+        chars = int(chars * 0.9)
+    return ""
+
+
+def load_turns(db, session_id: str, limit: int = HISTORY_MAX_TURNS) -> List[Turn]:
+    """Ultimi turni non System della sessione, in ordine cronologico (i corpi nei blob vengono risolti)."""
+    rows = (
+        db.query(ChatSession.type, ChatSession.message, ChatSession.blob_hashes)
+        .filter(ChatSession.session_id == session_id)
+        .filter(ChatSession.type != "System")
+        .order_by(ChatSession.id.desc())
+        .limit(limit)
+        .all()
+    )
+    return resolve_messages(db, list(reversed(rows)))
+
+
+def turns_from_texts(texts: Iterable[str]) -> List[Turn]:
+    """Turni dal memory store di /autocv, salvati come "User: ..." / "System: <documento>"."""
+    out: List[Turn] = []
+    for text in texts:
+        role, sep, body = text.partition(": ")
+        if not sep:
+            role, body = "User", text
+        out.append(("Assistant" if role == "System" else role, body))
+    return out
+
+
+def build_history(turns: Sequence[Turn], budget: int, previous_text: Optional[str] = None) -> str:
+    """
+    Storico entro budget token: prima il testo precedente della sezione (se c'è, sostituisce i
+    documenti interi dei turni Assistant), poi i turni dal più recente finché c'è spazio.
+    """
+    parts: List[str] = []
+    remaining = budget
+    if previous_text:
+        kept = truncate_to_tokens(previous_text, int(budget * PREVIOUS_TEXT_SHARE))
+        if kept:
+            parts.append(f"Testo precedente di questa sezione:\n{kept}")
+            remaining -= estimate_tokens(parts[0])
+
+    recent: List[str] = []
+    for role, text in reversed(turns):
+        if previous_text and role == "Assistant":
+            continue
+        line = f"{role}: {text}"
+        cost = estimate_tokens(line)
+        if cost <= remaining:
+            recent.append(line)
+            remaining -= cost
+            continue
+        if remaining >= MIN_TURN_TOKENS:
+            # Dei documenti generati conta la fine più recente; dei messaggi utente l'inizio
+            recent.append(truncate_to_tokens(line, remaining, keep="tail" if role == "Assistant" else "head"))
+        break
+
+    return "\n\n".join(parts + list(reversed(recent)))
+
+
+def section_histories(turns: Sequence[Turn], previous_texts: Optional[Dict[int, str]] = None) -> List[str]:
+    """Uno storico per sezione (indice section - 1), ognuno col proprio budget."""
+    previous_texts = previous_texts or {}
+    return [build_history(turns, section_budget(s), previous_texts.get(s)) for s in SECTIONS]
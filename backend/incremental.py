@@ -0,0 +1,96 @@
+# incremental.py
+# Rigenerazione parziale nei turni successivi della stessa sessione: si riusano le sezioni
+# già accettate e si rigenerano solo quelle toccate dalle informazioni cambiate.
+import datetime
+import re
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from .sqdb_pipe import SectionSnapshot, Workflow
+from .pipeline import SECTIONS
+
+ALL_SECTIONS: Set[int] = set(SECTIONS)
+
+# Argomento della correzione -> sezioni che lo riportano nel testo
+SECTION_TOPICS: List[Tuple[re.Pattern, Set[int]]] = [
+    # Anagrafica e indirizzi (header); il nome del lavoratore compare anche nei dettagli
+    (re.compile(r"\b(indirizz\w*|via|viale|piazza|corso|cap|citt[aà]|provincia|residen\w*|domicili\w*"
+                r"|mittente|destinatari\w*|nome|cognome|signor\w*)\b", re.I), {1, 3}),
+    # Datore di lavoro: header, dettagli e titolare del trattamento
+    (re.compile(r"\b(aziend\w*|societ[aà]|ditta|datore|ragione sociale|partita iva|p\.?\s?iva)\b", re.I), {1, 3, 6}),
+    # Tipologia contrattuale: oggetto e dettagli
+    (re.compile(r"\b(tempo\s+(in)?determinato|apprendistato|part[\s-]?time|full[\s-]?time|tirocinio|stage"
+                r"|tipologia|oggetto)\b", re.I), {2, 3}),
+    # Condizioni economiche e organizzative
+    (re.compile(r"(€|\b(stipendi\w*|retribuzion\w*|ral|salari\w*|compens\w*|euro|lordi|netti|mansion\w*|ruolo"
+                r"|qualifica|livello|orari\w*|ore|sede|inizio|decorrenza|durata|prova|ferie|trasferta|benefit)\b)",
+                re.I), {3}),
+    # Contratto collettivo e riferimenti di legge
+    (re.compile(r"\b(ccnl|contratto collettivo|legge|normativ\w*|decreto|d\.?\s?lgs|articol\w*|art\.)", re.I), {3, 4}),
+    (re.compile(r"\b(firm\w*|luogo e data)\b", re.I), {5}),
+    (re.compile(r"\b(privacy|gdpr|informativa|trattamento dei dati|titolare del trattamento|dpo)\b", re.I), {6}),
+    (re.compile(r"\b(consens\w*|revoc\w*)\b", re.I), {7}),
+]
+
+
+def affected_sections(question: str) -> Set[int]:
+    """Sezioni che dipendono dalle informazioni citate nel messaggio (vuoto se non si riconosce nulla)."""
+    out: Set[int] = set()
+    for pattern, sections in SECTION_TOPICS:
+        if pattern.search(question):
+            out |= sections
+    return out
+
+
+def load_snapshot(db2: Session, session_id: str) -> Dict[int, SectionSnapshot]:
+    rows = db2.query(SectionSnapshot).filter(SectionSnapshot.session_id == session_id).all()
+    return {r.section: r for r in rows if r.text}
+
+
+def sections_to_regenerate(question: str, snapshot: Dict[int, SectionSnapshot]) -> Set[int]:
+    """
+    Senza un documento precedente completo si rigenera tutto; altrimenti solo le sezioni
+    toccate dalla correzione. Se il messaggio non si lega a nessuna sezione, per prudenza tutto.
+    """
+    if set(snapshot) != ALL_SECTIONS:
+        return set(ALL_SECTIONS)
+    return affected_sections(question) or set(ALL_SECTIONS)
+
+
+def reuse_sections(db2: Session, run_id: str, snapshot: Dict[int, SectionSnapshot],
+                   regenerate: Iterable[int]) -> List[int]:
+    """Copia nella run le sezioni da non rigenerare, già nello stato "giudicato"; ritorna le sezioni riusate."""
+    regenerate = set(regenerate)
+    reused: List[int] = []
+    rows = db2.query(Workflow).filter(Workflow.run_id == run_id).all()
+    for row in rows:
+        snap = snapshot.get(row.section)
+        if row.section in regenerate or snap is None:
+            continue
+        row.text = snap.text
+        row.score = snap.score
+        row.notes = snap.notes
+        row.status = "giudicato"
+        reused.append(row.section)
+    db2.commit()
+    return sorted(reused)
+
+
+def save_snapshot(db2: Session, session_id: str, run_id: str, rows: Iterable[Workflow]) -> None:
+    """Aggiorna lo snapshot della sessione con le sezioni accettate della run."""
+    existing = {r.section: r for r in db2.query(SectionSnapshot).filter(SectionSnapshot.session_id == session_id)}
+    now = datetime.datetime.now()
+    for row in rows:
+        if row.status != "giudicato" or not row.text:
+            continue
+        snap = existing.get(row.section)
+        if snap is None:
+            snap = SectionSnapshot(session_id=session_id, section=row.section)
+            db2.add(snap)
+        snap.run_id = run_id
+        snap.text = row.text
+        snap.score = row.score
+        snap.notes = row.notes
+        snap.updated_at = now
+    db2.commit()
@@ -0,0 +1,332 @@
+# inline_engine.py
+# Motore di esecuzione inline: le 7 pipeline di sezione (genera -> giudica -> retry)
+# girano come task asyncio dentro il processo FastAPI, senza broker né result backend.
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from .sqdb_pipe import Workflow, AllData, get_db2
+from .prompts import judge_final_prompt
+from .incremental import save_snapshot
+from .regolo import CV_CREATOR_MODEL, REGOLO_STREAM, regolo_call_async
+from . import events
+from .pipeline import (
+    SECTIONS, SCORE_THRESHOLD, MAX_SECTION_RETRIES, FINAL_JUDGE_THRESHOLD, JUDGE_MODE,
+    generation_prompt, judge_section_async, judge_batch_async,
+    compute_weighted_score, collect_judge_notes, assemble_document, max_attempts,
+    save_final_messages, build_result,
+)
+
+# Stessa scadenza dei risultati Celery (result_expires)
+RESULT_TTL = 900
+# Stati di una sezione ancora in lavorazione (come ACTIVE_SECTION_STATES in main)
+OPEN_STATES = ("da_generare", "in_creazione", "da_giudicare", "in_giudizio")
+# Sezione fermata (run annullata o fallita): nessun aggiornamento successivo la riapre
+STOPPED_STATES = ("annullato", "failed")
+
+
+class RunCancelled(Exception):
+    pass
+
+
+class InlineRun:
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.created_at = time.monotonic()
+        # Resta a True dopo cancel_run: la run non esce dal registro, /task_status la vede annullata
+        self.cancelled = False
+
+
+# run_id -> InlineRun (l'id della run fa da task_id verso il frontend)
+_runs: Dict[str, InlineRun] = {}
+
+
+# --- Accesso DB (sincrono, eseguito in un thread) ---
+
+def _load_rows(run_id: str):
+    db2 = next(get_db2())
+    try:
+        rows = db2.query(Workflow).filter(Workflow.run_id == run_id).order_by(Workflow.section).all()
+        db2.expunge_all()
+        return rows
+    finally:
+        db2.close()
+
+
+def _update_row(row_id: int, archive: bool = False, **fields) -> None:
+    db2 = next(get_db2())
+    try:
+        # UPDATE condizionato, non lettura + scrittura: un thread di sezione ancora in volo dopo
+        # cancel_run o _fail_open_rows non deve riportare la riga in lavorazione
+        updated = (
+            db2.query(Workflow)
+            .filter(Workflow.id == row_id)
+            .filter(Workflow.status.notin_(STOPPED_STATES))
+            .update({getattr(Workflow, k): v for k, v in fields.items()}, synchronize_session=False)
+        )
+        if not updated:
+            db2.rollback()
+            raise RunCancelled()
+        task = db2.query(Workflow).filter(Workflow.id == row_id).first()
+        if archive:
+            db2.add(AllData(
+                run_id=task.run_id,
+                section=task.section,
+                status=task.status,
+                text=task.text,
+                score=task.score,
+                notes=task.notes,
+                weighted_score=task.weighted_score,
+                retry_count=task.retry_count,
+            ))
+        db2.commit()
+        if "status" in fields:
+            events.publish_status(task.run_id, task.section, task.status, score=task.score, attempt=task.retry_count)
+    finally:
+        db2.close()
+
+
+def _set_weighted_score(run_id: str, weighted_score: float) -> None:
+    db2 = next(get_db2())
+    try:
+        first = (
+            db2.query(Workflow)
+            .filter(Workflow.run_id == run_id)
+            .filter(Workflow.section == 1)
+            .first()
+        )
+        if first:
+            first.weighted_score = weighted_score
+            db2.commit()
+    finally:
+        db2.close()
+
+
+def _save_snapshot(run_id: str, session_token: Optional[str]) -> None:
+    if not session_token:
+        return
+    db2 = next(get_db2())
+    try:
+        rows = db2.query(Workflow).filter(Workflow.run_id == run_id).all()
+        save_snapshot(db2, session_token, run_id, rows)
+    finally:
+        db2.close()
+
+
+def _fail_open_rows(run_id: str) -> None:
+    """Run fallita: le sezioni rimaste aperte passano a "failed" (stesso esito dei task Celery)."""
+    db2 = next(get_db2())
+    try:
+        rows = db2.query(Workflow).filter(Workflow.run_id == run_id).filter(Workflow.status.in_(OPEN_STATES)).all()
+        for task in rows:
+            task.status = "failed"
+        db2.commit()
+        for task in rows:
+            events.publish_status(task.run_id, task.section, task.status, score=task.score, attempt=task.retry_count)
+    finally:
+        db2.close()
+
+
+# --- Pipeline ---
+
+async def _gather_or_cancel(*coros):
+    """asyncio.gather che, al primo errore, annulla le altre sezioni invece di lasciarle girare."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _generate_section(run_id: str, row_id: int, section: int, user_info: str, conversation_history: str,
+                            notes: Optional[str], attempt: int, use_cache: bool = True) -> str:
+    await asyncio.to_thread(_update_row, row_id, status="in_creazione", retry_count=attempt)
+    relay = events.AsyncDeltaRelay(run_id, section, attempt=attempt) if REGOLO_STREAM else None
+    if relay:
+        await relay.start()
+    result_text = await regolo_call_async(
+        CV_CREATOR_MODEL, generation_prompt(section, user_info, conversation_history, notes or None),
+        on_delta=relay, cache=use_cache,
+    )
+    if relay:
+        await relay.flush()
+    return result_text
+
+
+async def _run_section(run_id: str, row_id: int, section: int, user_info: str, conversation_history: str,
+                       notes: Optional[str], use_cache: bool = True) -> Dict[str, Any]:
+    """Equivalente asincrono di complete_creation, retry inclusi."""
+    score_val = 0.0
+    for attempt in range(MAX_SECTION_RETRIES + 1):
+        result_text = await _generate_section(
+            run_id, row_id, section, user_info, conversation_history, notes, attempt, use_cache
+        )
+        await asyncio.to_thread(_update_row, row_id, text=result_text, status="in_giudizio")
+
+        score_val, notes = await judge_section_async(section, result_text, cache=use_cache)
+
+        if score_val >= SCORE_THRESHOLD:
+            await asyncio.to_thread(
+                _update_row, row_id, archive=True, notes=notes, score=score_val, status="giudicato"
+            )
+            return {"section": section, "status": "ok", "score": score_val}
+        await asyncio.to_thread(_update_row, row_id, notes=notes, score=score_val, status="da_generare")
+
+    await asyncio.to_thread(_update_row, row_id, status="failed")
+    return {"section": section, "status": "failed"}
+
+
+async def _run_batch_rounds(run_id: str, pending, user_info: str, histories: List[str],
+                            use_cache: bool = True) -> Optional[str]:
+    """
+    Modalità batch: genera le sezioni in parallelo, le giudica con una sola chiamata e
+    ripete per quelle sotto soglia. Ritorna il riepilogo del giudice se copre tutte le 7 sezioni.
+    """
+    notes = {r.id: r.notes for r in pending}
+    summary: Optional[str] = None
+    for attempt in range(MAX_SECTION_RETRIES + 1):
+        texts = await _gather_or_cancel(*(
+            _generate_section(
+                run_id, r.id, r.section, user_info, histories[r.section - 1], notes[r.id], attempt, use_cache
+            )
+            for r in pending
+        ))
+        for r, text in zip(pending, texts):
+            await asyncio.to_thread(_update_row, r.id, text=text, status="in_giudizio")
+
+        verdicts, batch_summary = await judge_batch_async(
+            {r.section: text for r, text in zip(pending, texts)}, cache=use_cache
+        )
+        if attempt == 0 and len(pending) == len(SECTIONS) and batch_summary:
+            summary = batch_summary
+
+        retry = []
+        for r in pending:
+            score_val, notes[r.id] = verdicts[r.section]
+            if score_val >= SCORE_THRESHOLD:
+                await asyncio.to_thread(
+                    _update_row, r.id, archive=True, notes=notes[r.id], score=score_val, status="giudicato"
+                )
+            elif attempt < MAX_SECTION_RETRIES:
+                await asyncio.to_thread(_update_row, r.id, notes=notes[r.id], score=score_val, status="da_generare")
+                retry.append(r)
+            else:
+                await asyncio.to_thread(_update_row, r.id, notes=notes[r.id], score=score_val, status="failed")
+        if not retry:
+            break
+        # Il riepilogo del primo giro non descrive più le sezioni rigenerate
+        summary = None
+        pending = retry
+    return summary
+
+
+async def _run_pipeline(run_id: str, session_token: Optional[str], user_info: str,
+                        histories: List[str], use_cache: bool = True) -> Dict[str, Any]:
+    rows = await asyncio.to_thread(_load_rows, run_id)
+    pending = [r for r in rows if r.status == "da_generare" and r.section in SECTIONS]
+    judge_final: Optional[str] = None
+    if JUDGE_MODE == "batch":
+        if pending:
+            judge_final = await _run_batch_rounds(run_id, pending, user_info, histories, use_cache)
+    else:
+        await _gather_or_cancel(*(
+            _run_section(run_id, r.id, r.section, user_info, histories[r.section - 1], r.notes, use_cache)
+            for r in pending
+        ))
+
+    # Equivalente di finalize_cv
+    rows = await asyncio.to_thread(_load_rows, run_id)
+    weighted_score = compute_weighted_score(rows)
+
+    if weighted_score <= FINAL_JUDGE_THRESHOLD:
+        judge_final = ""
+    elif judge_final is None:
+        judge_final = await regolo_call_async(
+            CV_CREATOR_MODEL, judge_final_prompt(collect_judge_notes(rows)), cache=use_cache
+        )
+
+    current_cv = assemble_document(rows)
+    await asyncio.to_thread(_set_weighted_score, run_id, weighted_score)
+    await asyncio.to_thread(save_final_messages, session_token, current_cv, judge_final)
+    await asyncio.to_thread(_save_snapshot, run_id, session_token)
+
+    result = build_result(current_cv, weighted_score, max_attempts(rows), judge_final)
+    await events.apublish(run_id, {"type": "done", **result})
+    return result
+
+
+async def _run_and_report(run_id: str, session_token: Optional[str], user_info: str,
+                          histories: List[str], use_cache: bool = True) -> Dict[str, Any]:
+    try:
+        return await _run_pipeline(run_id, session_token, user_info, histories, use_cache)
+    except RunCancelled:
+        # Sezioni annullate da cancel_run (anche di un altro processo): l'evento l'ha già pubblicato lui
+        raise
+    except asyncio.CancelledError:
+        # cancel_run pubblica già "cancelled"; qui serve per lo spegnimento del processo
+        await events.apublish(run_id, {"type": "cancelled"})
+        raise
+    except Exception as e:
+        try:
+            await asyncio.to_thread(_fail_open_rows, run_id)
+        except Exception as db_error:
+            print("[INLINE] mark failed error", run_id, db_error)
+        await events.apublish(run_id, {"type": "failed", "detail": str(e)})
+        raise
+
+
+# --- Registro run in-process ---
+
+def _prune() -> None:
+    now = time.monotonic()
+    expired = [rid for rid, run in _runs.items() if run.task.done() and now - run.created_at > RESULT_TTL]
+    for rid in expired:
+        _runs.pop(rid, None)
+
+
+def _collect_outcome(task: "asyncio.Task") -> None:
+    # L'esito resta nel registro per /task_status: qui si legge l'eccezione perché asyncio
+    # non la segnali come mai recuperata quando nessuno interroga la run
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None and not isinstance(error, RunCancelled):
+        print("[INLINE] run fallita:", repr(error))
+
+
+def start_run(run_id: str, session_token: Optional[str], user_info: str, histories: List[str],
+              use_cache: bool = True) -> str:
+    """Avvia la run nell'event loop corrente e ritorna il suo id (da usare come task_id); histories: uno storico per sezione."""
+    _prune()
+    task = asyncio.get_running_loop().create_task(
+        _run_and_report(run_id, session_token, user_info, histories, use_cache)
+    )
+    task.add_done_callback(_collect_outcome)
+    _runs[run_id] = InlineRun(task)
+    return run_id
+
+
+def get_run(run_id: str) -> Optional[InlineRun]:
+    return _runs.get(run_id)
+
+
+def cancel_run(run_id: str) -> bool:
+    """Annulla la run se è ancora in corso; ritorna True se il task è stato davvero interrotto."""
+    run = _runs.get(run_id)
+    if run is None or run.task.done():
+        # Una run già conclusa tiene il suo esito
+        return False
+    run.cancelled = True
+    run.task.cancel()
+    return True
+
+
+async def shutdown() -> None:
+    pending = [run.task for run in _runs.values() if not run.task.done()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    _runs.clear()
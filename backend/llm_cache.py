@@ -0,0 +1,279 @@
+# llm_cache.py
+# Cache delle risposte LLM su Redis, indirizzata per contenuto: chiave = hash(model, temperature, prompt).
+# TTL per voce, limite al numero di voci con evizione LRU e contatori hit/miss.
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+# Risposte più grandi di così non vengono messe in cache
+LLM_CACHE_MAX_ENTRY_BYTES = int(os.getenv("LLM_CACHE_MAX_ENTRY_BYTES", 256 * 1024))
+# Verdetti del giudice (punteggio + note) per testo di sezione: indipendenti dalla temperatura
+JUDGE_CACHE_ENABLED = os.getenv("JUDGE_CACHE_ENABLED", "1") == "1"
+JUDGE_CACHE_TTL = int(os.getenv("JUDGE_CACHE_TTL", 7 * 24 * 3600))
+
+_PREFIX = "zerohr:llm:"
+_VERDICT_PREFIX = "zerohr:verdict:"
+_INDEX_KEY = "zerohr:llm-index"   # zset chiave -> ultimo accesso (per l'evizione LRU)
+_STATS_KEY = "zerohr:llm-stats"   # hash hits / misses / stores / evictions / skipped
+
+_redis_cache = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=1, decode_responses=True)
+_aredis_cache: Optional[aioredis.Redis] = None
+
+
+def cache_key(model: str, prompt: str, temperature: float) -> str:
+    digest = hashlib.sha256(json.dumps([model, float(temperature), prompt]).encode("utf-8")).hexdigest()
+    return _PREFIX + digest
+
+
+def verdict_key(section: int, text: str, sample_text: str) -> str:
+    digest = hashlib.sha256(json.dumps([int(section), text, sample_text]).encode("utf-8")).hexdigest()
+    return _VERDICT_PREFIX + digest
+
+
+def _get_async_redis() -> aioredis.Redis:
+    global _aredis_cache
+    if _aredis_cache is None:
+        _aredis_cache = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=1, decode_responses=True)
+    return _aredis_cache
+
+
+def _store_pipeline(pipe, key: str, text: str, ttl: int = LLM_CACHE_TTL, stat: str = "stores") -> None:
+    now = time.time()
+    pipe.set(key, text, ex=ttl)
+    pipe.zadd(_INDEX_KEY, {key: now})
+    # Voci scadute per TTL: via anche dall'indice
+    pipe.zremrangebyscore(_INDEX_KEY, 0, now - max(LLM_CACHE_TTL, JUDGE_CACHE_TTL))
+    pipe.hincrby(_STATS_KEY, stat, 1)
+    pipe.zcard(_INDEX_KEY)
+
+
+def _evict(r: redis.Redis, size: int) -> None:
+    excess = size - LLM_CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return
+    victims = [k for k, _ in r.zpopmin(_INDEX_KEY, excess)]
+    if victims:
+        r.delete(*victims)
+        r.hincrby(_STATS_KEY, "evictions", len(victims))
+
+
+async def _aevict(r: aioredis.Redis, size: int) -> None:
+    excess = size - LLM_CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return
+    victims = [k for k, _ in await r.zpopmin(_INDEX_KEY, excess)]
+    if victims:
+        await r.delete(*victims)
+        await r.hincrby(_STATS_KEY, "evictions", len(victims))
+
+
+def _too_large(text: str) -> bool:
+    return len(text.encode("utf-8")) > LLM_CACHE_MAX_ENTRY_BYTES
+
+
+def get(model: str, prompt: str, temperature: float) -> Optional[str]:
+    if not LLM_CACHE_ENABLED:
+        return None
+    key = cache_key(model, prompt, temperature)
+    try:
+        text = _redis_cache.get(key)
+        pipe = _redis_cache.pipeline()
+        if text is None:
+            pipe.hincrby(_STATS_KEY, "misses", 1)
+        else:
+            pipe.hincrby(_STATS_KEY, "hits", 1)
+            pipe.zadd(_INDEX_KEY, {key: time.time()})
+        pipe.execute()
+        return text
+    except Exception as e:
+        print("[LLM_CACHE] get error:", e)
+        return None
+
+
+def put(model: str, prompt: str, temperature: float, text: str) -> None:
+    if not LLM_CACHE_ENABLED:
+        return
+    try:
+        if _too_large(text):
+            _redis_cache.hincrby(_STATS_KEY, "skipped", 1)
+            return
+        pipe = _redis_cache.pipeline()
+        _store_pipeline(pipe, cache_key(model, prompt, temperature), text)
+        size = pipe.execute()[-1]
+        _evict(_redis_cache, size)
+    except Exception as e:
+        print("[LLM_CACHE] put error:", e)
+
+
+async def aget(model: str, prompt: str, temperature: float) -> Optional[str]:
+    if not LLM_CACHE_ENABLED:
+        return None
+    key = cache_key(model, prompt, temperature)
+    r = _get_async_redis()
+    try:
+        text = await r.get(key)
+        pipe = r.pipeline()
+        if text is None:
+            pipe.hincrby(_STATS_KEY, "misses", 1)
+        else:
+            pipe.hincrby(_STATS_KEY, "hits", 1)
+            pipe.zadd(_INDEX_KEY, {key: time.time()})
+        await pipe.execute()
+        return text
+    except Exception as e:
+        print("[LLM_CACHE] get error:", e)
+        return None
+
+
+async def aput(model: str, prompt: str, temperature: float, text: str) -> None:
+    if not LLM_CACHE_ENABLED:
+        return
+    r = _get_async_redis()
+    try:
+        if _too_large(text):
+            await r.hincrby(_STATS_KEY, "skipped", 1)
+            return
+        pipe = r.pipeline()
+        _store_pipeline(pipe, cache_key(model, prompt, temperature), text)
+        size = (await pipe.execute())[-1]
+        await _aevict(r, size)
+    except Exception as e:
+        print("[LLM_CACHE] put error:", e)
+
+
+# --- Verdetti del giudice ---
+
+def _decode_verdict(raw: Optional[str]) -> Optional[Tuple[float, str]]:
+    if raw is None:
+        return None
+    data = json.loads(raw)
+    return float(data["score"]), data["notes"]
+
+
+def get_verdict(section: int, text: str, sample_text: str) -> Optional[Tuple[float, str]]:
+    """Verdetto già emesso per lo stesso testo di sezione e lo stesso campione GOLD STANDARD."""
+    if not JUDGE_CACHE_ENABLED:
+        return None
+    key = verdict_key(section, text, sample_text)
+    try:
+        raw = _redis_cache.get(key)
+        pipe = _redis_cache.pipeline()
+        if raw is None:
+            pipe.hincrby(_STATS_KEY, "verdict_misses", 1)
+        else:
+            pipe.hincrby(_STATS_KEY, "verdict_hits", 1)
+            pipe.zadd(_INDEX_KEY, {key: time.time()})
+        pipe.execute()
+        return _decode_verdict(raw)
+    except Exception as e:
+        print("[LLM_CACHE] verdict get error:", e)
+        return None
+
+
+def put_verdict(section: int, text: str, sample_text: str, score: float, notes: str) -> None:
+    if not JUDGE_CACHE_ENABLED:
+        return
+    try:
+        pipe = _redis_cache.pipeline()
+        _store_pipeline(
+            pipe, verdict_key(section, text, sample_text), json.dumps({"score": score, "notes": notes}),
+            ttl=JUDGE_CACHE_TTL, stat="verdict_stores",
+        )
+        size = pipe.execute()[-1]
+        _evict(_redis_cache, size)
+    except Exception as e:
+        print("[LLM_CACHE] verdict put error:", e)
+
+
+async def aget_verdict(section: int, text: str, sample_text: str) -> Optional[Tuple[float, str]]:
+    if not JUDGE_CACHE_ENABLED:
+        return None
+    key = verdict_key(section, text, sample_text)
+    r = _get_async_redis()
+    try:
+        raw = await r.get(key)
+        pipe = r.pipeline()
+        if raw is None:
+            pipe.hincrby(_STATS_KEY, "verdict_misses", 1)
+        else:
+            pipe.hincrby(_STATS_KEY, "verdict_hits", 1)
+            pipe.zadd(_INDEX_KEY, {key: time.time()})
+        await pipe.execute()
+        return _decode_verdict(raw)
+    except Exception as e:
+        print("[LLM_CACHE] verdict get error:", e)
+        return None
+
+
+async def aput_verdict(section: int, text: str, sample_text: str, score: float, notes: str) -> None:
+    if not JUDGE_CACHE_ENABLED:
+        return
+    r = _get_async_redis()
+    try:
+        pipe = r.pipeline()
+        _store_pipeline(
+            pipe, verdict_key(section, text, sample_text), json.dumps({"score": score, "notes": notes}),
+            ttl=JUDGE_CACHE_TTL, stat="verdict_stores",
+        )
+        size = (await pipe.execute())[-1]
+        await _aevict(r, size)
+    except Exception as e:
+        print("[LLM_CACHE] verdict put error:", e)
+
+
+def record_prejudge(outcome: str) -> None:
+    """Conta gli esiti del pre-giudizio deterministico: accepted / rejected / deferred (al giudice LLM)."""
+    try:
+        _redis_cache.hincrby(_STATS_KEY, f"prejudge_{outcome}", 1)
+    except Exception as e:
+        print("[LLM_CACHE] stats error:", e)
+
+
+def stats() -> Dict[str, float]:
+    """Contatori della cache; con Redis irraggiungibile {"available": False}, non un errore."""
+    try:
+        raw = _redis_cache.hgetall(_STATS_KEY)
+        entries = _redis_cache.zcard(_INDEX_KEY)
+    except redis.RedisError as e:
+        print("[LLM_CACHE] stats error:", e)
+        return {"available": False, "enabled": LLM_CACHE_ENABLED}
+    out: Dict[str, float] = {
+        k: int(raw.get(k, 0))
+        for k in ("hits", "misses", "stores", "evictions", "skipped",
+                  "verdict_hits", "verdict_misses", "verdict_stores",
+                  "prejudge_accepted", "prejudge_rejected", "prejudge_deferred")
+    }
+    lookups = out["hits"] + out["misses"]
+    out["hit_ratio"] = (out["hits"] / lookups) if lookups else 0.0
+    verdict_lookups = out["verdict_hits"] + out["verdict_misses"]
+    out["verdict_hit_ratio"] = (out["verdict_hits"] / verdict_lookups) if verdict_lookups else 0.0
+    out["entries"] = entries
+    out["available"] = True
+    out["enabled"] = LLM_CACHE_ENABLED
+    return out
+
+
+def clear() -> int:
+    keys = _redis_cache.zrange(_INDEX_KEY, 0, -1)
+    if keys:
+        _redis_cache.delete(*keys)
+    _redis_cache.delete(_INDEX_KEY, _STATS_KEY)
+    return len(keys)
+
+
+async def aclose() -> None:
+    global _aredis_cache
+    if _aredis_cache is not None:
+        await _aredis_cache.aclose()
+    _aredis_cache = None
@@ -1,39 +1,55 @@
 # app.py
-from fastapi import FastAPI, Depends, HTTPException, Response, Cookie
+from fastapi import FastAPI, Depends, HTTPException, Response, Cookie, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel
 from celery import Celery, chord, states
 from celery.exceptions import Ignore
 from celery.result import AsyncResult
+from celery.signals import worker_init, worker_process_init
 from pathlib import Path
-import httpx
+import asyncio
+from contextlib import asynccontextmanager
 import uuid
 import datetime
-import json
 import redis
-import re
 import os
 
 # --- Import applicativi/DB ---
-from .sqdb import init_db, get_db, ChatSession, UserSession
-from .sqdb_pipe import Workflow, AllData, get_db2, init_db2
-from langgraph.store.memory import InMemoryStore
-from .prompts import (
-    cv_prompt_sezione1, cv_prompt_sezione2, cv_prompt_sezione3,
-    cv_prompt_sezione4, cv_prompt_sezione5, cv_prompt_sezione6, cv_prompt_sezione7,
-    judge_prompt_sezione1, judge_prompt_sezione2, judge_prompt_sezione3,
-    judge_prompt_sezione4, judge_prompt_sezione5, judge_prompt_sezione6,
-    judge_prompt_sezione7, judge_final_prompt,
+from .sqdb import init_db, get_async_db, run_write, touch_user_session, ChatSession
+from .sessions import init_session_store, session_from_cookie
+from .blobs import add_message
+from . import memory_stores
+from .memory_stores import SessionMemoryStores
+from .sqdb_pipe import (
+    Workflow, AllData, get_db2, get_async_db2, init_db2, run_write2, seed_runs, purge_expired_runs,
 )
+from .prompts import judge_final_prompt
+from .pipeline import (
+    SECTIONS, SCORE_THRESHOLD, MAX_SECTION_RETRIES, FINAL_JUDGE_THRESHOLD, JUDGE_MODE,
+    data_dir,
+    generation_prompt, judge_section_sync, judge_batch_sync,
+    compute_weighted_score, collect_judge_notes, assemble_document, max_attempts,
+    save_final_messages, build_result,
+)
+from . import inline_engine
+from .incremental import load_snapshot, sections_to_regenerate, reuse_sections, save_snapshot
+from .history import load_turns, section_histories
+from .tokens import estimate_tokens
+from .regolo import (
+    CV_CREATOR_MODEL, REGOLO_STREAM, regolo_call_sync, aclose_clients, reset_clients, resilience_stats,
+    check_config,
+)
+from . import events, llm_cache, prompt_templates
 
-# --- Costanti Regolo (override via env) ---
-REGOLO_API_URL = os.getenv("REGOLO_API_URL", "https://api.regolo.ai/v1/completions")
-REGOLO_API_KEY = os.getenv("REGOLO_API_KEY")
-if not REGOLO_API_KEY:
-    raise ValueError("REGOLO_API_KEY environment variable is required")
-CV_CREATOR_MODEL = os.getenv("CV_CREATOR_MODEL", "gpt-oss-120b")
+# --- Motore di esecuzione: "celery" (worker separati) oppure "inline" (asyncio nel processo API) ---
+EXECUTION_ENGINE = os.getenv("ZEROHR_ENGINE", "celery").lower()
+if EXECUTION_ENGINE not in ("celery", "inline"):
+    raise ValueError(f"ZEROHR_ENGINE non valido: {EXECUTION_ENGINE!r} (valori ammessi: celery, inline)")
 
 # --- Redis e Celery ---
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
@@ -50,7 +66,57 @@ celery_app.conf.update(
     worker_prefetch_multiplier=1,
 )
 
-app = FastAPI()
+def init_app_state() -> None:
+    """Inizializzazione di processo (API e worker): configurazione Regolo, tabelle dei due DB e token di sessione."""
+    check_config()
+    init_db2()
+    init_db()
+    init_session_store()
+
+
+def warm_up_api() -> None:
+    """Solo processo API: template, tokenizer e langgraph pronti prima della prima richiesta async."""
+    prompt_templates.warm_up()
+    memory_stores.warm_up()
+
+
+# Righe Workflow di run mai finalizzate (annullate, fallite, abbandonate): eliminate dopo il TTL
+WORKFLOW_ROWS_TTL = int(os.getenv("ZEROHR_WORKFLOW_ROWS_TTL", 24 * 3600))
+WORKFLOW_PURGE_INTERVAL = int(os.getenv("ZEROHR_WORKFLOW_PURGE_INTERVAL", 600))
+
+
+def purge_workflow_rows() -> int:
+    db2 = next(get_db2())
+    try:
+        return purge_expired_runs(db2, WORKFLOW_ROWS_TTL)
+    finally:
+        db2.close()
+
+
+async def _purge_workflow_loop() -> None:
+    while True:
+        try:
+            deleted = await asyncio.to_thread(purge_workflow_rows)
+            if deleted:
+                print(f"[RUNS] righe Workflow scadute eliminate: {deleted}")
+        except Exception as e:
+            print("[RUNS] purge error:", e)
+        await asyncio.sleep(WORKFLOW_PURGE_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(init_app_state)
+    await asyncio.to_thread(warm_up_api)
+    purge_task = asyncio.create_task(_purge_workflow_loop())
+    yield
+    purge_task.cancel()
+    await inline_engine.shutdown()
+    await aclose_clients()
+    await events.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS ---
 app.add_middleware(
@@ -61,56 +127,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- Headers Regolo ---
-headers = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {REGOLO_API_KEY}",
-}
-
-# --- Inizializzazione DB2 e bootstrap delle 7 sezioni ---
-init_db2()
-_db2_init = next(get_db2())
-_db2_init.query(Workflow).delete()
-_db2_init.commit()
-for section_num in range(1, 8):
-    _db2_init.add(Workflow(section=section_num, status="da_generare"))
-    _db2_init.commit()
-
-# --- Lettura testi di esempio (una sola volta) ---
-example_contract_texts: List[str] = []
-example_filenames = [
-    "header.txt", "subject.txt", "Contract.txt", "laws_n_regs.txt",
-    "signature.txt", "privacy_notice.txt", "withdrawal.txt"
-]
-data_dir = Path(__file__).parent.parent / "data"
-for filename in example_filenames:
-    try:
-        with open(data_dir / filename, "r", encoding="utf-8") as file:
-            example_contract_texts.append(file.read())
-    except FileNotFoundError:
-        example_contract_texts.append("")
-
-# --- Carica sample CV sezionali (1..7) ---
-cvs_dir = data_dir.parent / "cvs"
-sample_texts: Dict[int, str] = {}
-for i in range(1, 8):
-    sample_path = cvs_dir / f"{i}.txt"
-    try:
-        with open(sample_path, "r", encoding="utf-8") as f:
-            sample_texts[i] = f.read()
-    except FileNotFoundError:
-        sample_texts[i] = ""
+@worker_init.connect
+def _init_worker(**kwargs):
+    # Processo principale del worker (con --pool=threads è l'unico): niente più wipe della
+    # tabella Workflow all'avvio, le run in corso degli altri processi restano intatte
+    init_app_state()
 
-# --- Paths for names_tokens.json ---
+@worker_process_init.connect
+def _reset_regolo_clients(**kwargs):
+    # Il pool HTTP del processo padre non va condiviso con i figli del worker
+    reset_clients()
+
+# --- Paths ---
 output_dir = data_dir.parent / "output"
-names_tokens_path = data_dir / "names_tokens.json"
 
-# --- Store memorie utente in RAM (per sessione) ---
-user_memory_stores: Dict[str, InMemoryStore] = {}
+# --- Store memorie utente in RAM (per sessione, LRU + scadenza per inattività) ---
+user_memory_stores = SessionMemoryStores()
 
 # --- Pydantic models ---
 class QueryRequest(BaseModel):
     question: str
+    no_cache: bool = False  # salta la cache delle risposte LLM per questa richiesta
+    full_regeneration: bool = False  # rigenera tutte le sezioni anche se la sessione ha già un documento
 
 class QueryResponse(BaseModel):
     final_cv: str
@@ -204,16 +242,134 @@ def clear_celery_backend() -> Dict[str, int]:
     ]
     return _scan_del(_redis_backend, patterns)
 
-def reseed_workflow(db2: Session, status_all: str = "da_generare", status_map: Dict[int, str] | None = None):
-    """Reset + semina con stato desiderato (uguale per tutti o per-sezione via mappa)."""
-    db2.query(Workflow).delete()
-    db2.commit()
-    for section_num in range(1, 8):
-        st = status_all
-        if status_map and section_num in status_map:
-            st = status_map[section_num]
-        db2.add(Workflow(section=section_num, status=st))
+def reseed_workflow(
+    db2: Session,
+    status_all: str = "da_generare",
+    status_map: Dict[int, str] | None = None,
+    run_id: Optional[str] = None,
+):
+    """
+    Reset + semina con stato desiderato (uguale per tutti o per-sezione via mappa).
+    Con run_id tocca solo le righe di quella run; senza, azzera l'intera tabella (uso admin).
+    DELETE e INSERT multi-riga nella stessa transazione, un solo commit.
+    """
+    q = db2.query(Workflow)
+    if run_id is not None:
+        q = q.filter(Workflow.run_id == run_id)
+    q.delete(synchronize_session=False)
+    seed_runs(db2, [run_id], status_all=status_all, status_map=status_map)
+
+# ========== Registro run per sessione ==========
+
+# Stati in cui una sezione è ancora in lavorazione (una run cancellata li porta ad "annullato")
+ACTIVE_SECTION_STATES = ("da_generare", "in_creazione", "da_giudicare", "in_giudizio")
+RUN_REGISTRY_TTL = int(os.getenv("ZEROHR_RUN_REGISTRY_TTL", 900))
+
+def _run_registry_key(session_token: str) -> str:
+    return f"zerohr:run:session:{session_token}"
+
+def section_task_id(run_id: str, section: int) -> str:
+    """Id Celery deterministico del task di sezione: permette di revocarlo senza inspect()."""
+    return f"{run_id}:s{section}"
+
+def register_run(session_token: str, run_id: str) -> Optional[str]:
+    """Registra la run corrente della sessione e ritorna quella precedente (se presente)."""
+    key = _run_registry_key(session_token)
+    pipe = redis_client.pipeline()
+    pipe.getset(key, run_id)
+    pipe.expire(key, RUN_REGISTRY_TTL)
+    previous, _ = pipe.execute()
+    return previous
+
+def current_run(session_token: str) -> Optional[str]:
+    """Run corrente della sessione secondo il registro (None se scaduta o già finalizzata)."""
+    return redis_client.get(_run_registry_key(session_token))
+
+def unregister_run(session_token: str, run_id: str) -> None:
+    """Rimuove la run dal registro solo se è ancora quella corrente della sessione."""
+    key = _run_registry_key(session_token)
+    try:
+        if redis_client.get(key) == run_id:
+            redis_client.delete(key)
+    except Exception as e:
+        print("[RUNS] unregister error:", e)
+
+def _revoke_run_tasks(run_id: str, sections: List[int]) -> Dict[str, int]:
+    """
+    Revoca i task Celery della run ancora aperti (sezioni passate + callback del chord, se non
+    già concluso) ed elimina i risultati di tutti; ritorna quanti id sono stati davvero revocati.
+    """
+    all_ids = [section_task_id(run_id, s) for s in range(1, 8)] + [run_id]
+    ids = [section_task_id(run_id, s) for s in sections]
+    try:
+        if AsyncResult(run_id, app=celery_app).state not in states.READY_STATES:
+            ids.append(run_id)
+    except Exception as e:
+        print("[RUNS] state error", run_id, e)
+        ids.append(run_id)
+
+    revoked = 0
+    if ids:
+        try:
+            celery_app.control.revoke(ids, terminate=False)
+            revoked = len(ids)
+        except Exception as e:
+            print("[RUNS] revoke error", run_id, e)
+
+    forgotten = 0
+    for _id in all_ids:
+        try:
+            AsyncResult(_id, app=celery_app).forget()
+            forgotten += 1
+        except Exception as e:
+            print("[RUNS] forget error", _id, e)
+    return {"revoked": revoked, "forgotten": forgotten}
+
+def _cancel_open_sections(db2: Session, run_id: str) -> List[int]:
+    """Marca come annullate le sezioni ancora in lavorazione e ritorna i loro numeri."""
+    sections = [
+        s for (s,) in db2.query(Workflow.section)
+        .filter(Workflow.run_id == run_id)
+        .filter(Workflow.status.in_(ACTIVE_SECTION_STATES))
+    ]
+    if sections:
+        (
+            db2.query(Workflow)
+            .filter(Workflow.run_id == run_id)
+            .filter(Workflow.status.in_(ACTIVE_SECTION_STATES))
+            .update({Workflow.status: "annullato"}, synchronize_session=False)
+        )
     db2.commit()
+    return sections
+
+def _inline_cancel_stats(run_id: str) -> Dict[str, int]:
+    # La run resta nel registro inline come annullata; nessun risultato da eliminare
+    return {"revoked": int(inline_engine.cancel_run(run_id)), "forgotten": 0}
+
+def cancel_run(db2: Session, run_id: str) -> Dict[str, Any]:
+    """
+    Annulla una singola run: marca le sezioni ancora aperte come annullate, revoca i loro
+    task (più il callback del chord) ed elimina solo i risultati della run dal backend.
+    """
+    # Prima il DB: un task che parte adesso trova già "annullato" e si ferma
+    sections = _cancel_open_sections(db2, run_id)
+    if EXECUTION_ENGINE == "inline":
+        stats = _inline_cancel_stats(run_id)
+    else:
+        stats = _revoke_run_tasks(run_id, sections)
+    events.publish(run_id, {"type": "cancelled"})
+    return {"run_id": run_id, **stats, "sections_cancelled": len(sections)}
+
+async def acancel_run(run_id: str) -> Dict[str, Any]:
+    """cancel_run per gli endpoint async: DB (scrittura, vedi run_write2), Celery e Redis in un thread."""
+    sections = await asyncio.to_thread(run_write2, _cancel_open_sections, run_id)
+    if EXECUTION_ENGINE == "inline":
+        # Il task asyncio va annullato dal suo event loop, non da un thread
+        stats = _inline_cancel_stats(run_id)
+    else:
+        stats = await asyncio.to_thread(_revoke_run_tasks, run_id, sections)
+    await events.apublish(run_id, {"type": "cancelled"})
+    return {"run_id": run_id, **stats, "sections_cancelled": len(sections)}
 
 # === Request models per gli endpoint admin ===
 class KillRequest(BaseModel):
@@ -230,11 +386,14 @@ class ResetRequest(BaseModel):
 class SeedRequest(BaseModel):
     status_all: str = "da_generare"
     status_map: Dict[int, str] | None = None
+    run_ids: List[str] | None = None  # pre-alloca le righe di più run (sostituendo le loro righe)
 
 # --- Lock Redis corretta ---
 class RedisLock:
     def __init__(self, name, timeout=60):
-        self._lock = redis_client.lock(name, timeout=timeout)
+        # thread_local=False: negli endpoint async acquire e release girano in due thread diversi
+        # e con il token thread-local il rilascio fallirebbe, lasciando il lock fino al timeout
+        self._lock = redis_client.lock(name, timeout=timeout, thread_local=False)
     def __enter__(self):
         if not self._lock.acquire(blocking=False):
             raise HTTPException(status_code=429, detail="Too many concurrent requests, try again later")
@@ -244,174 +403,237 @@ class RedisLock:
             self._lock.release()
         except Exception:
             pass
+    # Negli endpoint async acquire/release (chiamate Redis) girano in un thread
+    async def __aenter__(self):
+        return await asyncio.to_thread(self.__enter__)
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await asyncio.to_thread(self.__exit__, exc_type, exc_val, exc_tb)
+
+# ========== CELERY TASKS ==========
+
+def _commit_status(db2: Session, task: Workflow, status: str) -> None:
+    """Aggiorna lo stato della sezione e lo notifica sul canale eventi della run."""
+    task.status = status
+    db2.commit()
+    events.publish_status(task.run_id, task.section, status, score=task.score, attempt=task.retry_count)
 
-# --- Utility sincrona per Regolo ---
-def regolo_call_sync(client: httpx.Client, model: str, prompt: str, temperature: float = 0.7) -> str:
-    data = {"model": model, "prompt": prompt, "temperature": temperature}
-    resp = client.post(REGOLO_API_URL, headers=headers, json=data)
-    if resp.status_code != 200:
-        raise Exception(f"Regolo API error: {resp.text}")
-    js = resp.json()
+def _run_id_from_task_id(task_id: str) -> str:
+    """Inverso di section_task_id: "<run_id>:s<n>" -> run_id (il callback del chord ha già id = run_id)."""
+    return task_id.rsplit(":s", 1)[0]
+
+def _mark_section_failed(row_id: int) -> None:
+    db2 = next(get_db2())
     try:
-        text = js["choices"][0]["text"]
-    except Exception:
-        raise Exception(f"Invalid response from Regolo API: {js}")
-    return text.strip()
+        task = db2.query(Workflow).filter(Workflow.id == row_id).first()
+        if task is not None and task.status not in ("annullato", "giudicato", "failed"):
+            _commit_status(db2, task, "failed")
+    finally:
+        db2.close()
 
-# ========== CELERY TASKS ==========
+class RunTask(celery_app.Task):
+    """
+    Base dei task di una run: se il task fallisce (Regolo giù dopo i retry, circuito aperto,
+    riga non valida, ...) il chord non arriva al callback, quindi l'esito "failed" va
+    pubblicato qui, altrimenti lo stream SSE resterebbe aperto fino a EVENTS_IDLE_TIMEOUT.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        run_id = kwargs.get("run_id") or _run_id_from_task_id(task_id)
+        try:
+            if "task_id" in kwargs:
+                _mark_section_failed(kwargs["task_id"])
+        except Exception as e:
+            print("[RUNS] mark failed error", task_id, e)
+        events.publish(run_id, {"type": "failed", "detail": str(exc)})
 
-@celery_app.task(bind=True)
-def complete_creation(self, task_id: int, user_info: str, conversation_history: str):
+@celery_app.task(bind=True, base=RunTask)
+def complete_creation(self, task_id: int, user_info: str, conversation_history: str, use_cache: bool = True,
+                      judge: bool = True, attempt: int = 0):
+    """Genera la sezione; con judge=False si ferma a "da_giudicare" e il giudizio lo fa judge_batch."""
     db2 = next(get_db2())
     task = db2.query(Workflow).filter(Workflow.id == task_id).first()
+    if task and task.status == "annullato":
+        raise Ignore()
     if not task or task.status not in ("da_generare", "da_giudicare"):
         raise Exception("Task not found or not in valid state")
 
     section = task.section
 
-    prompt_map = {
-        1: cv_prompt_sezione1, 2: cv_prompt_sezione2, 3: cv_prompt_sezione3,
-        4: cv_prompt_sezione4, 5: cv_prompt_sezione5, 6: cv_prompt_sezione6, 7: cv_prompt_sezione7,
-    }
-    judge_prompt_map = {
-        1: judge_prompt_sezione1, 2: judge_prompt_sezione2, 3: judge_prompt_sezione3,
-        4: judge_prompt_sezione4, 5: judge_prompt_sezione5, 6: judge_prompt_sezione6, 7: judge_prompt_sezione7,
-    }
-
-    example_text_map = {i + 1: t for i, t in enumerate(example_contract_texts)}
-    sample_text = sample_texts.get(section, "")
-
-    with httpx.Client(timeout=600.0) as client:
-        task.status = "in_creazione"
-        db2.commit()
-        self.update_state(state=states.STARTED, meta={"section": section})
+    task.retry_count = attempt or self.request.retries
+    _commit_status(db2, task, "in_creazione")
+    self.update_state(state=states.STARTED, meta={"section": section})
 
-        prompt_text = prompt_map[section](user_info, example_text_map[section], conversation_history, task.notes or None)
-        result_text = regolo_call_sync(client, CV_CREATOR_MODEL, prompt_text)
+    prompt_text = generation_prompt(section, user_info, conversation_history, task.notes or None)
+    relay = events.DeltaRelay(task.run_id, section, attempt=task.retry_count) if REGOLO_STREAM else None
+    result_text = regolo_call_sync(CV_CREATOR_MODEL, prompt_text, on_delta=relay, cache=use_cache)
+    if relay:
+        relay.flush()
 
-        task.text = result_text
-        task.status = "da_giudicare"
-        db2.commit()
+    # La run potrebbe essere stata annullata da una nuova richiesta della stessa sessione
+    db2.refresh(task)
+    if task.status == "annullato":
+        raise Ignore()
 
-        task.status = "in_giudizio"
-        db2.commit()
+    task.text = result_text
+    _commit_status(db2, task, "da_giudicare")
+    if not judge:
+        return {"section": section, "status": "generated"}
+    _commit_status(db2, task, "in_giudizio")
 
-        judge_prompt = judge_prompt_map[section](task.text, sample_text)
-        judge_text = regolo_call_sync(client, CV_CREATOR_MODEL, judge_prompt)
+    score_val, judge_text = judge_section_sync(section, task.text, cache=use_cache)
 
-        match = re.search(r"Punteggio\s*[:\-]?\s*([0-9]*\.?[0-9]+)", judge_text, re.I)
-        score_val = float(match.group(1)) if match else 0.0
+    # Annullata durante il giudizio: lo stato resta "annullato" e nulla va in AllData
+    db2.refresh(task)
+    if task.status == "annullato":
+        raise Ignore()
 
-        task.notes = judge_text
-        task.score = score_val
+    task.notes = judge_text
+    task.score = score_val
 
-        if score_val < 7:
-            try:
-                task.status = "da_generare"
-                db2.commit()
-                self.retry(countdown=0, exc=Exception("Retry for low score"), max_retries=2)
-            except self.MaxRetriesExceededError:
-                task.status = "failed"
-                db2.commit()
-                return {"section": section, "status": "failed"}
-        else:
-            task.status = "giudicato"
-            full_task = AllData(
-                section=task.section,
-                status=task.status,
-                text=task.text,
-                score=task.score,
-                notes=task.notes,
-                weighted_score=task.weighted_score,
-                retry_count=task.retry_count,
-            )
-            db2.add(full_task)
-            db2.commit()
+    if score_val < SCORE_THRESHOLD:
+        try:
+            _commit_status(db2, task, "da_generare")
+            self.retry(countdown=0, exc=Exception("Retry for low score"), max_retries=MAX_SECTION_RETRIES)
+        except self.MaxRetriesExceededError:
+            _commit_status(db2, task, "failed")
+            return {"section": section, "status": "failed"}
+    else:
+        _accept_section(db2, task)
 
     return {"section": section, "status": "ok", "score": score_val}
 
-@celery_app.task(bind=True)
-def finalize_cv(self, results, session_token: Optional[str] = None):
-    from sqdb_pipe import get_db2, Workflow
-    from sqdb import get_db, ChatSession
-    import datetime as _dt
+def _accept_section(db2: Session, task: Workflow) -> None:
+    """Sezione promossa: stato "giudicato" e copia nello storico AllData."""
+    task.status = "giudicato"
+    full_task = AllData(
+        run_id=task.run_id,
+        section=task.section,
+        status=task.status,
+        text=task.text,
+        score=task.score,
+        notes=task.notes,
+        weighted_score=task.weighted_score,
+        retry_count=task.retry_count,
+    )
+    db2.add(full_task)
+    db2.commit()
+    events.publish_status(task.run_id, task.section, task.status, score=task.score, attempt=task.retry_count)
+
+def _generation_header(run_id: str, rows: List[Workflow], user_info: str, histories: List[str],
+                       use_cache: bool, judge: bool, attempt: int = 0) -> List:
+    return [
+        complete_creation.s(
+            task_id=t.id,
+            user_info=user_info,
+            conversation_history=histories[t.section - 1],
+            use_cache=use_cache,
+            judge=judge,
+            attempt=attempt,
+        ).set(task_id=section_task_id(run_id, t.section))
+        for t in rows
+    ]
 
+@celery_app.task(bind=True, base=RunTask)
+def judge_batch(self, results, run_id: str, session_token: Optional[str] = None, user_info: str = "",
+                histories: Optional[List[str]] = None, use_cache: bool = True, attempt: int = 0):
+    """
+    Callback del chord in modalità batch: giudica in una sola chiamata le sezioni generate,
+    poi rigenera quelle sotto soglia (nuovo chord che sostituisce questo task) oppure finalizza.
+    """
+    db2 = next(get_db2())
+    rows = (
+        db2.query(Workflow)
+        .filter(Workflow.run_id == run_id)
+        .filter(Workflow.status == "da_giudicare")
+        .all()
+    )
+    for t in rows:
+        _commit_status(db2, t, "in_giudizio")
+
+    verdicts, summary = judge_batch_sync({t.section: t.text or "" for t in rows}, cache=use_cache)
+
+    # La run potrebbe essere stata annullata durante il giudizio
+    for t in rows:
+        db2.refresh(t)
+    if any(t.status == "annullato" for t in rows):
+        raise Ignore()
+
+    to_retry: List[Workflow] = []
+    for t in rows:
+        t.score, t.notes = verdicts[t.section]
+        if t.score >= SCORE_THRESHOLD:
+            _accept_section(db2, t)
+        elif attempt < MAX_SECTION_RETRIES:
+            _commit_status(db2, t, "da_generare")
+            to_retry.append(t)
+        else:
+            _commit_status(db2, t, "failed")
+
+    if to_retry:
+        histories = histories or [""] * len(SECTIONS)
+        header = _generation_header(run_id, to_retry, user_info, histories, use_cache,
+                                    judge=False, attempt=attempt + 1)
+        raise self.replace(chord(header, judge_batch.s(
+            run_id=run_id, session_token=session_token, user_info=user_info,
+            histories=histories, use_cache=use_cache, attempt=attempt + 1,
+        )))
+
+    # Il riepilogo sostituisce judge_final_prompt solo se copre tutte le 7 sezioni
+    judge_final = summary if attempt == 0 and len(rows) == len(SECTIONS) and summary else None
+    return _finalize_run(db2, run_id, session_token, use_cache, judge_final=judge_final)
+
+@celery_app.task(bind=True, base=RunTask)
+def finalize_cv(self, results, run_id: str, session_token: Optional[str] = None, use_cache: bool = True):
     db2 = next(get_db2())
-    all_tasks = db2.query(Workflow).filter(Workflow.section.in_(range(1, 8))).all()
+    return _finalize_run(db2, run_id, session_token, use_cache)
+
+def _finalize_run(db2: Session, run_id: str, session_token: Optional[str], use_cache: bool = True,
+                  judge_final: Optional[str] = None):
+    """Punteggio pesato, giudizio finale (se non già fornito dal giudice batch) e salvataggio del documento."""
+    all_tasks = (
+        db2.query(Workflow)
+        .filter(Workflow.run_id == run_id)
+        .filter(Workflow.section.in_(range(1, 8)))
+        .order_by(Workflow.section)
+        .all()
+    )
 
-    weights = [0.03846, 0.00500, 0.41500, 0.30000, 0.00500, 0.11877, 0.11777]
-    scores: List[float] = []
-    for s in range(1, 8):
-        t = next((t for t in all_tasks if t.section == s), None)
-        scores.append((t.score or 0.0) if t else 0.0)
-    weighted_score = sum(s * w for s, w in zip(scores, weights))
+    weighted_score = compute_weighted_score(all_tasks)
 
-    judge_final = ""
-    if weighted_score > 8:
-        all_judge_texts = "\n\n".join((t.notes or "") for t in all_tasks)
-        with httpx.Client(timeout=600.0) as client:
-            judge_final = regolo_call_sync(client, CV_CREATOR_MODEL, judge_final_prompt(all_judge_texts))
+    if weighted_score <= FINAL_JUDGE_THRESHOLD:
+        judge_final = ""
+    elif judge_final is None:
+        judge_final = regolo_call_sync(
+            CV_CREATOR_MODEL, judge_final_prompt(collect_judge_notes(all_tasks)), cache=use_cache
+        )
 
-    section_texts_ordered = db2.query(Workflow).order_by(Workflow.section).all()
-    current_cv = "\n\n".join((t.text or "") for t in section_texts_ordered)
+    current_cv = assemble_document(all_tasks)
 
     first_section_task = next((t for t in all_tasks if t.section == 1), None)
     if first_section_task:
         first_section_task.weighted_score = weighted_score
         db2.commit()
 
-    try:
-        if session_token:
-            db = next(get_db())
-            db.add(ChatSession(
-                session_id=session_token,
-                type="Assistant",
-                message=current_cv,
-                created_at=_dt.datetime.now(),
-            ))
-            if judge_final:
-                db.add(ChatSession(
-                    session_id=session_token,
-                    type="System",
-                    message=f"[Judge finale]\n{judge_final}",
-                    created_at=_dt.datetime.now(),
-                ))
-            db.commit()
-    except Exception:
-        pass
-
-    attempts = 0
-    try:
-        attempts = max((t.retry_count or 0) for t in all_tasks if hasattr(t, "retry_count"))
-    except Exception:
-        attempts = 0
+    save_final_messages(session_token, current_cv, judge_final)
+    if session_token:
+        save_snapshot(db2, session_token, run_id, all_tasks)
 
-    return {
-        "cv": current_cv,
-        "weighted_score": weighted_score,
-        "attempts": attempts,
-        "feedback": judge_final,
-    }
+    result = build_result(current_cv, weighted_score, max_attempts(all_tasks), judge_final)
+    events.publish(run_id, {"type": "done", **result})
+    return result
 
 # ========== RESET + RELOAD (1 + 2) ==========
 
-def reset_workflow_state(db2: Session) -> None:
-    _db2_init = next(get_db2())
-    _db2_init.query(Workflow).delete()
-    _db2_init.commit()
-    for section_num in range(1, 8):
-        _db2_init.add(Workflow(section=section_num, status="da_generare"))
-        _db2_init.commit()
+def reset_workflow_state(db2: Session, run_id: str) -> None:
+    """Rimuove le righe Workflow della run (l'id del task chord coincide con il run_id)."""
+    db2.query(Workflow).filter(Workflow.run_id == run_id).delete(synchronize_session=False)
+    db2.commit()
 
 def cleanup_task_artifacts(task_id: str) -> None:
     try:
         AsyncResult(task_id, app=celery_app).forget()
     except Exception as e:
         print("[CLEANUP] forget error:", e)
-    try:
-        redis_client.delete("start_task_lock")
-    except Exception as e:
-        print("[CLEANUP] redis lock del error:", e)
 
 def trigger_uvicorn_reload_dev() -> bool:
     _file_ = os.path.abspath(__file__)
@@ -425,101 +647,102 @@ def trigger_uvicorn_reload_dev() -> bool:
         print("[RELOAD] failed:", e)
         return False
 
+def _dispatch_celery_run(run_id: str, session_token: str, rows: List[Workflow],
+                         user_info: str, histories: List[str], use_cache: bool = True) -> str:
+    batch = JUDGE_MODE == "batch"
+    header = _generation_header(run_id, rows, user_info, histories, use_cache, judge=not batch)
+    if batch:
+        callback = judge_batch.s(
+            run_id=run_id, session_token=session_token, user_info=user_info,
+            histories=histories, use_cache=use_cache,
+        )
+    else:
+        callback = finalize_cv.s(run_id=run_id, session_token=session_token, use_cache=use_cache)
+
+    # L'id del callback coincide con il run_id: /task_status e /finalize risalgono alla run
+    callback_result = chord(header)(callback, task_id=run_id)
+    return callback_result.id
+
+def _save_turn_messages(db: Session, session_token: str, user_msg: ChatSession, prompt_parts: List[str]) -> None:
+    db.add(user_msg)
+    add_message(db, session_token, "System", "".join(prompt_parts), prompt_parts)
+
 # ========== ENDPOINTS BUSINESS ==========
 
 @app.post("/main")
 async def main_trigger(
     request: QueryRequest,
     response: Response = None,
-    db2: Session = Depends(get_db2),
-    db: Session = Depends(get_db),
+    adb2: AsyncSession = Depends(get_async_db2),
+    adb: AsyncSession = Depends(get_async_db),
     session_token: Optional[str] = Cookie(default=None),
 ):
-    init_db2()
-    init_db()
-
-    # === RESET AUTOMATICO OGNI VOLTA ===
-    revoke_all_tasks(mode="soft")       # revoca task attivi/pending
-    purge_all_queues()                  # svuota le code
-    clear_celery_backend()              # pulizia risultati/metadati
-    reseed_workflow(db2, status_all="da_generare")  # reset workflow
+    # Sull'event loop solo I/O asincrono: le letture girano con run_sync sulla sessione async,
+    # le scritture (run_write / run_write2), Celery e Redis sincrono in un thread (eventi con redis.asyncio)
 
     # === Gestione token/sessione ===
-    names_tokens = {}
-    try:
-        with open(names_tokens_path, "r") as f:
-            names_tokens = json.load(f)
-    except FileNotFoundError:
-        names_tokens = {}
-
-    if session_token and session_token in names_tokens:
-        token = session_token
-        print(f"Token di sessione esistente rilevato: {token}, lo riutilizzo")
-    else:
-        token = str(uuid.uuid4())
-        names_tokens[token] = True
-        with open(names_tokens_path, "w") as f:
-            json.dump(names_tokens, f)
-        if response:
-            response.set_cookie(key="session_token", value=token, httponly=True)
-        print(f"Nuovo token di sessione creato ed impostato nel cookie: {token}")
-
-    session_token = token
-
-    user_session = db.query(UserSession).filter(UserSession.user_id == session_token).first()
-    now = datetime.datetime.now()
-    if user_session is None:
-        user_session = UserSession(
-            user_id=session_token,
-            start_time=now,
-            last_access_time=now,
-        )
-        db.add(user_session)
+    # Le scritture (brevi) vanno sul pool sincrono in un thread, vedi run_write
+    session_token = await asyncio.to_thread(run_write, session_from_cookie, session_token, response)
+
+    # === Nuova run: annulla solo la run precedente di questa sessione ===
+    # Ogni richiesta lavora sulle proprie 7 righe Workflow, identificate dal run_id
+    run_id = str(uuid.uuid4())
+    previous_run_id = await asyncio.to_thread(register_run, session_token, run_id)
+    if previous_run_id and previous_run_id != run_id:
+        print("[RUNS] annullo run precedente:", await acancel_run(previous_run_id))
+    # run_id appena generato: nessuna riga da cancellare, basta l'INSERT delle 7 sezioni
+    await asyncio.to_thread(run_write2, seed_runs, [run_id])
+
+    # === Turni successivi: rigenera solo le sezioni toccate dalla correzione ===
+    snapshot = await adb2.run_sync(load_snapshot, session_token)
+    if not request.full_regeneration:
+        regenerate = sections_to_regenerate(request.question, snapshot)
+        reused = await asyncio.to_thread(run_write2, reuse_sections, run_id, snapshot, regenerate)
+        if reused:
+            print(f"[INCREMENTAL] sezioni riusate: {reused}, rigenerate: {sorted(regenerate)}")
+            for section in reused:
+                await events.apublish_status(run_id, section, "giudicato", score=snapshot[section].score)
+
+    if await asyncio.to_thread(run_write, touch_user_session, session_token):
         print("Nuova sessione utente creata")
     else:
-        user_session.last_access_time = now
         print("Sessione utente aggiornata")
-    db.commit()
 
     user_namespace = (session_token, "memories")
 
-    chat_msgs = (
-        db.query(ChatSession.message)
-        .filter(ChatSession.session_id == session_token)
-        .filter(ChatSession.type != "System")
-        .order_by(ChatSession.id.desc())
-        .limit(3)
-        .all()
+    # Uno storico per sezione, entro il suo budget di token; al posto dei documenti
+    # generati in precedenza entra solo il testo della sezione stessa
+    histories = section_histories(
+        await adb.run_sync(load_turns, session_token), {s: snap.text for s, snap in snapshot.items()}
     )
-    conversation_history = "\n".join(m[0] for m in reversed(chat_msgs))
-    user_memory_stores[session_token] = InMemoryStore()
-    memory_store = user_memory_stores[session_token]
+    memory_store = user_memory_stores.get(session_token, fresh=True)
     print("Storico conversazioni caricato da DB")
-    print(conversation_history)
+    print("[HISTORY] token per sezione:", [estimate_tokens(h) for h in histories])
 
     user_info = request.question
 
-    with RedisLock("start_task_lock", timeout=15):
-        tasks_to_create = (
-            db2.query(Workflow)
-            .filter(Workflow.status == "da_generare")
-            .filter(Workflow.section.in_(range(1, 8)))
+    async with RedisLock(f"start_task_lock:{session_token}", timeout=15):
+        result = await adb2.execute(
+            select(Workflow)
+            .where(Workflow.run_id == run_id)
+            .where(Workflow.status == "da_generare")
+            .where(Workflow.section.in_(range(1, 8)))
             .order_by(Workflow.section)
-            .all()
         )
+        tasks_to_create = result.scalars().all()
         if not tasks_to_create:
             raise HTTPException(status_code=404, detail="No tasks in 'da_generare' state available")
 
-    header = [
-        complete_creation.s(
-            task_id=t.id,
-            user_info=user_info,
-            conversation_history=conversation_history
+    if EXECUTION_ENGINE == "inline":
+        task_id = inline_engine.start_run(
+            run_id, session_token, user_info, histories, use_cache=not request.no_cache
+        )
+    else:
+        # La pubblicazione del chord sul broker è sincrona
+        task_id = await asyncio.to_thread(
+            _dispatch_celery_run, run_id, session_token, tasks_to_create, user_info, histories,
+            use_cache=not request.no_cache,
         )
-        for t in tasks_to_create
-    ]
-
-    callback_result = chord(header)(finalize_cv.s(session_token=session_token))
 
     user_msg = ChatSession(
         session_id=session_token,
@@ -527,24 +750,34 @@ async def main_trigger(
         message=request.question,
         created_at=datetime.datetime.now(),
     )
-    message = cv_prompt_sezione1(user_info, example_contract_texts[0], conversation_history, None)
-    system_msg = ChatSession(
-        session_id=session_token,
-        type="System",
-        message=message,
-        created_at=datetime.datetime.now(),
-    )
-    db.add(user_msg)
-    db.add(system_msg)
-    db.commit()
+    # Prompt System nei blob, a pezzi: il prefisso statico è lo stesso per tutte le richieste
+    prompt_parts = prompt_templates.generation_prompt_parts(1, user_info, histories[0], None)
+    await asyncio.to_thread(run_write, _save_turn_messages, session_token, user_msg, prompt_parts)
 
     memory_store.put(user_namespace, "user", {"text": f"User: {request.question}"})
 
-    return {"task_id": callback_result.id}
+    return {"task_id": task_id}
+
+
+@app.post("/cancel/{task_id}")
+async def cancel_task(
+    task_id: str,
+    session_token: Optional[str] = Cookie(default=None),
+):
+    """Annulla la run corrente della sessione (pulsante "Annulla"): le run degli altri utenti non si toccano."""
+    if not session_token or await asyncio.to_thread(current_run, session_token) != task_id:
+        raise HTTPException(status_code=404, detail="Run not found for this session")
+    stats = await acancel_run(task_id)
+    await asyncio.to_thread(unregister_run, session_token, task_id)
+    return {"ok": True, **stats}
 
 
 @app.get("/task_status/{task_id}", response_model=Optional[QueryResponse])
 def get_task_status(task_id: str, db2: Session = Depends(get_db2)):
+    inline_run = inline_engine.get_run(task_id)
+    if inline_run is not None:
+        return _inline_task_status(task_id, inline_run)
+
     async_result = celery_app.AsyncResult(task_id)
 
     if async_result.status == "PENDING":
@@ -570,15 +803,80 @@ def get_task_status(task_id: str, db2: Session = Depends(get_db2)):
     else:
         return QueryResponse(final_cv="", score=0.0, attempts=0, feedback=f"Task state: {async_result.status}")
 
+def _inline_task_status(task_id: str, run: "inline_engine.InlineRun") -> QueryResponse:
+    """Stessa semantica di get_task_status per le run eseguite dal motore inline."""
+    if run.cancelled:
+        return QueryResponse(final_cv="", score=0.0, attempts=0, feedback="Task state: REVOKED")
+    if not run.task.done():
+        return QueryResponse(final_cv="", score=0.0, attempts=0, feedback="Task in progress")
+    if run.task.cancelled():
+        return QueryResponse(final_cv="", score=0.0, attempts=0, feedback="Task state: REVOKED")
+    exc = run.task.exception()
+    if isinstance(exc, inline_engine.RunCancelled):
+        # Sezioni annullate da un altro processo (es. nuova richiesta della stessa sessione)
+        return QueryResponse(final_cv="", score=0.0, attempts=0, feedback="Task state: REVOKED")
+    if exc is not None:
+        raise HTTPException(status_code=500, detail=f"Task failed: {exc}. Feedback: None")
+    result = run.task.result() or {}
+    return QueryResponse(
+        final_cv=result.get("cv", ""),
+        score=result.get("weighted_score", 0.0),
+        attempts=result.get("attempts", 0),
+        feedback=result.get("feedback", "") or ""
+    )
+
+@app.get("/stream/{task_id}")
+async def stream_task(task_id: str):
+    """
+    Server-Sent Events della run: "section_start" e "delta" (testo parziale per sezione)
+    durante la generazione, "done" con il risultato finale.
+    """
+    async def _event_source():
+        async for event in events.iter_events(task_id):
+            yield events.format_sse(event)
+
+    return StreamingResponse(
+        _event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/progress/{task_id}")
+async def progress_task(task_id: str):
+    """Come /stream ma solo con i cambi di stato delle sezioni ("status") e l'esito finale."""
+    async def _event_source():
+        async for event in events.iter_events(task_id, types=events.PROGRESS_TYPES):
+            yield events.format_sse(event)
+
+    return StreamingResponse(
+        _event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/ws/progress/{task_id}")
+async def progress_ws(websocket: WebSocket, task_id: str):
+    """Variante WebSocket di /progress: un messaggio JSON per evento."""
+    await websocket.accept()
+    try:
+        async for event in events.iter_events(task_id, types=events.PROGRESS_TYPES):
+            if event is not None:
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
 @app.post("/finalize/{task_id}")
-def finalize_and_reset(task_id: str):
+def finalize_and_reset(task_id: str, session_token: Optional[str] = Cookie(default=None)):
     db2 = next(get_db2())
 
     before = db2.query(Workflow).count()
-    reset_workflow_state(db2)
+    reset_workflow_state(db2, run_id=task_id)
     after = db2.query(Workflow).count()
 
     cleanup_task_artifacts(task_id)
+    if session_token:
+        unregister_run(session_token, task_id)
 
     purged = False
     if os.getenv("ZEROHR_DEV_PURGE") == "1":
@@ -600,11 +898,14 @@ def finalize_and_reset(task_id: str):
     }
 
 @app.get("/debug/state")
-def debug_state():
+def debug_state(run_id: Optional[str] = None):
     db2 = next(get_db2())
-    rows = db2.query(Workflow).order_by(Workflow.section).all()
+    q = db2.query(Workflow)
+    if run_id is not None:
+        q = q.filter(Workflow.run_id == run_id)
+    rows = q.order_by(Workflow.run_id, Workflow.section).all()
     data = [
-        {"id": r.id, "section": r.section, "status": r.status, "score": r.score}
+        {"id": r.id, "run_id": r.run_id, "section": r.section, "status": r.status, "score": r.score}
         for r in rows
     ]
     return {"workflow": data}
@@ -641,7 +942,38 @@ def admin_reset(req: ResetRequest, db2: Session = Depends(get_db2)):
         "status_map": req.status_map or {},
     }
 
+@app.get("/admin/llm_cache")
+def admin_llm_cache_stats():
+    return {"ok": True, "stats": llm_cache.stats()}
+
+@app.post("/admin/llm_cache/clear")
+def admin_llm_cache_clear():
+    return {"ok": True, "cleared": llm_cache.clear()}
+
+@app.get("/admin/memory_stores")
+def admin_memory_stores():
+    """Sessioni e byte tenuti in RAM, sessioni espulse (LRU, cap in byte) e scadute per inattività."""
+    return {"ok": True, "stats": user_memory_stores.stats()}
+
+@app.get("/admin/prompt_templates")
+def admin_prompt_templates():
+    """Token del prefisso statico (riusabile dalla prefix cache del provider) e del suffisso dinamico per sezione."""
+    return {"ok": True, "templates": prompt_templates.template_stats()}
+
+@app.get("/admin/regolo")
+def admin_regolo_stats():
+    """
+    Circuit breaker e limite adattivo sono del processo API (i worker Celery hanno i propri);
+    il rate limit (attese in coda, percentili in ms) è condiviso da tutto il cluster.
+    """
+    return {"ok": True, **resilience_stats()}
+
 @app.post("/admin/seed")
 def admin_seed(req: SeedRequest, db2: Session = Depends(get_db2)):
-    reseed_workflow(db2, status_all=req.status_all, status_map=req.status_map)
-    return {"ok": True, "status_all": req.status_all, "status_map": req.status_map or {}}
+    if req.run_ids:
+        db2.query(Workflow).filter(Workflow.run_id.in_(req.run_ids)).delete(synchronize_session=False)
+        seeded = seed_runs(db2, req.run_ids, status_all=req.status_all, status_map=req.status_map)
+    else:
+        reseed_workflow(db2, status_all=req.status_all, status_map=req.status_map)
+        seeded = len(SECTIONS)
+    return {"ok": True, "status_all": req.status_all, "status_map": req.status_map or {}, "rows": seeded}
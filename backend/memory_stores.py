@@ -0,0 +1,144 @@
+# memory_stores.py
+# Memorie utente in RAM per sessione (InMemoryStore di langgraph) con limiti: LRU su numero
+# di sessioni e byte occupati, più scadenza per inattività. Sostituisce il dict globale che
+# cresceva a ogni nuova sessione e si svuotava solo con /admin/reset.
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+MEMORY_MAX_SESSIONS = int(os.getenv("ZEROHR_MEMORY_MAX_SESSIONS", 1000))
+MEMORY_MAX_BYTES = int(os.getenv("ZEROHR_MEMORY_MAX_BYTES", 64 * 1024 * 1024))
+MEMORY_IDLE_TTL = float(os.getenv("ZEROHR_MEMORY_IDLE_TTL", 3600))
+
+
+def warm_up() -> None:
+    """Importa langgraph in anticipo (all'avvio, in un thread) invece che alla prima sessione."""
+    import langgraph.store.memory  # noqa: F401
+
+
+def _value_size(key: str, value: Dict[str, Any]) -> int:
+    """Byte stimati di una memoria: chiave + valore serializzato in UTF-8."""
+    return len(key.encode("utf-8")) + len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+class SessionMemory:
+    """InMemoryStore di una sessione, con il conto dei byte scritti (per chiave, le sovrascritture non sommano)."""
+
+    def __init__(self, registry: "SessionMemoryStores", session_id: str):
+        # langgraph è pesante da importare: lo si carica alla prima sessione, non all'avvio
+        from langgraph.store.memory import InMemoryStore
+
+        self.store = InMemoryStore()
+        self.session_id = session_id
+        self.sizes: Dict[Tuple[Tuple[str, ...], str], int] = {}
+        self.nbytes = 0
+        self.last_access = time.monotonic()
+        self._registry = registry
+
+    def put(self, namespace: Tuple[str, ...], key: str, value: Dict[str, Any]) -> None:
+        # La serializzazione fuori dal lock; scrittura e conto dei byte sotto il lock del registro
+        self._registry._put(self, namespace, key, value, _value_size(key, value))
+
+    def search(self, namespace: Tuple[str, ...], limit: int = 10):
+        self._registry._touch(self)
+        return self.store.search(namespace, limit=limit)
+
+
+class SessionMemoryStores:
+    """Registro session_id -> SessionMemory, ordinato dal meno al più recentemente usato."""
+
+    def __init__(self, max_sessions: int = MEMORY_MAX_SESSIONS, max_bytes: int = MEMORY_MAX_BYTES,
+                 idle_ttl: float = MEMORY_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[str, SessionMemory]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"created": 0, "hits": 0, "evicted_lru": 0, "evicted_bytes": 0, "expired": 0}
+
+    # --- accesso ---
+
+    def get(self, session_id: str, fresh: bool = False) -> SessionMemory:
+        """Memoria della sessione (creata se manca); fresh=True la ricrea vuota."""
+        with self._lock:
+            self._expire_idle()
+            memory = None if fresh else self._entries.get(session_id)
+            if memory is not None:
+                self._counters["hits"] += 1
+                memory.last_access = time.monotonic()
+                self._entries.move_to_end(session_id)
+                return memory
+            self._drop(session_id)
+            memory = SessionMemory(self, session_id)
+            self._entries[session_id] = memory
+            self._counters["created"] += 1
+            while len(self._entries) > self.max_sessions:
+                self._evict_oldest("evicted_lru")
+            return memory
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire_idle()
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "idle_ttl": self.idle_ttl,
+                **self._counters,
+            }
+
+    # --- interni (chiamati dalle SessionMemory; nbytes e sizes si toccano solo sotto self._lock) ---
+
+    def _touch(self, memory: SessionMemory) -> None:
+        with self._lock:
+            memory.last_access = time.monotonic()
+            if self._entries.get(memory.session_id) is memory:
+                self._entries.move_to_end(memory.session_id)
+
+    def _put(self, memory: SessionMemory, namespace: Tuple[str, ...], key: str,
+             value: Dict[str, Any], size: int) -> None:
+        with self._lock:
+            memory.store.put(namespace, key, value)
+            delta = size - memory.sizes.get((namespace, key), 0)
+            memory.sizes[(namespace, key)] = size
+            memory.nbytes += delta
+            memory.last_access = time.monotonic()
+            if self._entries.get(memory.session_id) is not memory:
+                # Già espulsa: la richiesta in corso la usa ancora, ma non conta nel registro
+                return
+            self._entries.move_to_end(memory.session_id)
+            self._bytes += delta
+            # Si espellono le sessioni meno recenti; quella appena scritta resta anche se da sola supera il cap
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._evict_oldest("evicted_bytes")
+
+    def _drop(self, session_id: str) -> None:
+        memory = self._entries.pop(session_id, None)
+        if memory is not None:
+            self._bytes -= memory.nbytes
+
+    def _evict_oldest(self, reason: str) -> None:
+        session_id, memory = self._entries.popitem(last=False)
+        self._bytes -= memory.nbytes
+        self._counters[reason] += 1
+
+    def _expire_idle(self) -> None:
+        if self.idle_ttl <= 0:
+            return
+        deadline = time.monotonic() - self.idle_ttl
+        # In ordine LRU: ci si ferma alla prima sessione ancora attiva
+        while self._entries:
+            memory = next(iter(self._entries.values()))
+            if memory.last_access > deadline:
+                break
+            self._evict_oldest("expired")
@@ -0,0 +1,245 @@
+# pipeline.py
+# Parti della pipeline a 7 sezioni condivise dai motori di esecuzione (Celery e inline).
+import asyncio
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .sqdb import get_db
+from .blobs import add_message
+from .regolo import CV_CREATOR_MODEL, regolo_call_sync, regolo_call_async
+from . import llm_cache
+from .validators import prejudge, outcome
+from .prompts import (
+    cv_prompt_sezione1, cv_prompt_sezione2, cv_prompt_sezione3,
+    cv_prompt_sezione4, cv_prompt_sezione5, cv_prompt_sezione6, cv_prompt_sezione7,
+    judge_prompt_sezione1, judge_prompt_sezione2, judge_prompt_sezione3,
+    judge_prompt_sezione4, judge_prompt_sezione5, judge_prompt_sezione6,
+    judge_prompt_sezione7,
+)
+from . import prompt_templates
+
+SECTIONS = range(1, 8)
+
+# Sotto questa soglia la sezione viene rigenerata (al massimo MAX_SECTION_RETRIES volte)
+SCORE_THRESHOLD = 7
+MAX_SECTION_RETRIES = 2
+# Il riepilogo del giudice finale si chiede solo per documenti sopra questa media
+FINAL_JUDGE_THRESHOLD = 8
+# "section": un giudizio per sezione (dentro il task di sezione); "batch": tutte le sezioni in una chiamata
+JUDGE_MODE = os.getenv("ZEROHR_JUDGE_MODE", "section").lower()
+if JUDGE_MODE not in ("section", "batch"):
+    raise ValueError(f"ZEROHR_JUDGE_MODE non valido: {JUDGE_MODE!r} (attesi 'section' o 'batch')")
+SECTION_WEIGHTS = [0.03846, 0.00500, 0.41500, 0.30000, 0.00500, 0.11877, 0.11777]
+
+prompt_map = {
+    1: cv_prompt_sezione1, 2: cv_prompt_sezione2, 3: cv_prompt_sezione3,
+    4: cv_prompt_sezione4, 5: cv_prompt_sezione5, 6: cv_prompt_sezione6, 7: cv_prompt_sezione7,
+}
+judge_prompt_map = {
+    1: judge_prompt_sezione1, 2: judge_prompt_sezione2, 3: judge_prompt_sezione3,
+    4: judge_prompt_sezione4, 5: judge_prompt_sezione5, 6: judge_prompt_sezione6, 7: judge_prompt_sezione7,
+}
+
+# --- Testi di esempio e campioni GOLD STANDARD ---
+# Letti alla prima richiesta tramite prompt_templates (e riletti se i file cambiano),
+# non all'import: prompt_templates.example_text(s) / sample_text(s).
+data_dir = prompt_templates.data_dir
+cvs_dir = prompt_templates.cvs_dir
+
+
+def generation_prompt(section: int, user_info: str, conversation_history: str, judge_text: Optional[str]) -> str:
+    return prompt_templates.generation_prompt(section, user_info, conversation_history, judge_text)
+
+
+def judge_prompt(section: int, text: str) -> str:
+    return prompt_templates.judge_prompt(section, text)
+
+
+def parse_score(judge_text: str) -> float:
+    match = re.search(r"Punteggio\s*[:\-]?\s*([0-9]*\.?[0-9]+)", judge_text, re.I)
+    return float(match.group(1)) if match else 0.0
+
+
+# --- Giudizio di una sezione: controlli deterministici, poi cache dei verdetti, poi giudice LLM ---
+
+def _prejudge(section: int, text: str, sample_text: str) -> Optional[Tuple[float, str]]:
+    verdict = prejudge(section, text, sample_text)
+    llm_cache.record_prejudge(outcome(verdict))
+    return tuple(verdict) if verdict is not None else None
+
+
+def _local_verdict(section: int, text: str, cache: bool) -> Optional[Tuple[float, str]]:
+    sample_text = prompt_templates.sample_text(section)
+    verdict = _prejudge(section, text, sample_text)
+    if verdict is None and cache:
+        verdict = llm_cache.get_verdict(section, text, sample_text)
+    return verdict
+
+
+async def _alocal_verdict(section: int, text: str, cache: bool) -> Optional[Tuple[float, str]]:
+    sample_text = prompt_templates.sample_text(section)
+    verdict = await asyncio.to_thread(_prejudge, section, text, sample_text)
+    if verdict is None and cache:
+        verdict = await llm_cache.aget_verdict(section, text, sample_text)
+    return verdict
+
+
+def judge_section_sync(section: int, text: str, cache: bool = True) -> Tuple[float, str]:
+    """Ritorna (punteggio, note del giudice); un testo già giudicato non richiama l'LLM."""
+    verdict = _local_verdict(section, text, cache)
+    if verdict is not None:
+        return verdict
+    notes = regolo_call_sync(CV_CREATOR_MODEL, judge_prompt(section, text), cache=cache)
+    score = parse_score(notes)
+    if cache:
+        llm_cache.put_verdict(section, text, prompt_templates.sample_text(section), score, notes)
+    return score, notes
+
+
+async def judge_section_async(section: int, text: str, cache: bool = True) -> Tuple[float, str]:
+    verdict = await _alocal_verdict(section, text, cache)
+    if verdict is not None:
+        return verdict
+    notes = await regolo_call_async(CV_CREATOR_MODEL, judge_prompt(section, text), cache=cache)
+    score = parse_score(notes)
+    if cache:
+        await llm_cache.aput_verdict(section, text, prompt_templates.sample_text(section), score, notes)
+    return score, notes
+
+
+# --- Giudizio di tutte le sezioni in una sola chiamata (ZEROHR_JUDGE_MODE=batch) ---
+
+def parse_batch_verdicts(judge_text: str, sections: Iterable[int]) -> Tuple[Dict[int, Tuple[float, str]], str]:
+    """Estrae {sezione: (punteggio, note)} e il riepilogo dalla risposta JSON del giudice batch."""
+    match = re.search(r"\{.*\}", judge_text, re.S)
+    try:
+        data = json.loads(match.group(0)) if match else {}
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    raw = data.get("sezioni") if isinstance(data.get("sezioni"), dict) else {}
+
+    verdicts: Dict[int, Tuple[float, str]] = {}
+    for section in sections:
+        item = raw.get(str(section))
+        if not isinstance(item, dict):
+            continue
+        try:
+            score = float(item.get("punteggio"))
+        except (TypeError, ValueError):
+            continue
+        # Stesso formato delle note del giudice per sezione ("Punteggio: X.Y" in testa)
+        verdicts[section] = (score, f"Punteggio: {score}\n{item.get('note') or ''}".strip())
+
+    summary = data.get("riepilogo") or ""
+    if isinstance(summary, list):
+        summary = "\n".join(f"- {item}" for item in summary)
+    return verdicts, str(summary)
+
+
+def judge_batch_sync(texts: Dict[int, str], cache: bool = True) -> Tuple[Dict[int, Tuple[float, str]], str]:
+    """
+    Giudica le sezioni in una sola chiamata; ritorna ({sezione: (punteggio, note)}, riepilogo).
+    Le sezioni già decise localmente restano fuori dal prompt; quelle assenti dalla risposta
+    vengono giudicate singolarmente. Il riepilogo è vuoto se non è servita la chiamata batch.
+    """
+    verdicts: Dict[int, Tuple[float, str]] = {}
+    pending: Dict[int, str] = {}
+    for section, text in texts.items():
+        verdict = _local_verdict(section, text, cache)
+        if verdict is None:
+            pending[section] = text
+        else:
+            verdicts[section] = verdict
+    if not pending:
+        return verdicts, ""
+
+    judge_text = regolo_call_sync(CV_CREATOR_MODEL, prompt_templates.batch_judge_prompt(pending), cache=cache)
+    parsed, summary = parse_batch_verdicts(judge_text, pending)
+    for section, (score, notes) in parsed.items():
+        verdicts[section] = (score, notes)
+        if cache:
+            llm_cache.put_verdict(section, pending[section], prompt_templates.sample_text(section), score, notes)
+    for section in sorted(pending.keys() - parsed.keys()):
+        print(f"[JUDGE] sezione {section} assente dalla risposta batch, giudizio singolo")
+        verdicts[section] = judge_section_sync(section, pending[section], cache)
+    return verdicts, summary
+
+
+async def judge_batch_async(texts: Dict[int, str], cache: bool = True) -> Tuple[Dict[int, Tuple[float, str]], str]:
+    verdicts: Dict[int, Tuple[float, str]] = {}
+    pending: Dict[int, str] = {}
+    for section, text in texts.items():
+        verdict = await _alocal_verdict(section, text, cache)
+        if verdict is None:
+            pending[section] = text
+        else:
+            verdicts[section] = verdict
+    if not pending:
+        return verdicts, ""
+
+    judge_text = await regolo_call_async(CV_CREATOR_MODEL, prompt_templates.batch_judge_prompt(pending), cache=cache)
+    parsed, summary = parse_batch_verdicts(judge_text, pending)
+    for section, (score, notes) in parsed.items():
+        verdicts[section] = (score, notes)
+        if cache:
+            await llm_cache.aput_verdict(section, pending[section], prompt_templates.sample_text(section), score, notes)
+    missing = sorted(pending.keys() - parsed.keys())
+    if missing:
+        print(f"[JUDGE] sezioni {missing} assenti dalla risposta batch, giudizio singolo")
+        results = await asyncio.gather(*(judge_section_async(s, pending[s], cache) for s in missing))
+        verdicts.update(zip(missing, results))
+    return verdicts, summary
+
+
+# --- Composizione del risultato finale (stessa forma per ogni motore) ---
+
+def compute_weighted_score(rows: Sequence) -> float:
+    scores: List[float] = []
+    for s in SECTIONS:
+        t = next((t for t in rows if t.section == s), None)
+        scores.append((t.score or 0.0) if t else 0.0)
+    return sum(s * w for s, w in zip(scores, SECTION_WEIGHTS))
+
+
+def collect_judge_notes(rows: Sequence) -> str:
+    return "\n\n".join((t.notes or "") for t in rows)
+
+
+def assemble_document(rows: Sequence) -> str:
+    """Unisce i testi delle sezioni nell'ordine 1..7."""
+    return "\n\n".join((t.text or "") for t in sorted(rows, key=lambda t: t.section))
+
+
+def max_attempts(rows: Sequence) -> int:
+    try:
+        return max((t.retry_count or 0) for t in rows)
+    except ValueError:
+        return 0
+
+
+def save_final_messages(session_token: Optional[str], current_cv: str, judge_final: str) -> None:
+    """Salva documento e giudizio finale nello storico chat della sessione (best effort)."""
+    if not session_token:
+        return
+    try:
+        db = next(get_db())
+        # Documento e giudizio nei blob (deduplicati e compressi), come i prompt System
+        add_message(db, session_token, "Assistant", current_cv)
+        if judge_final:
+            add_message(db, session_token, "System", f"[Judge finale]\n{judge_final}")
+        db.commit()
+    except Exception as e:
+        print("[FINALIZE] salvataggio storico fallito:", e)
+
+
+def build_result(current_cv: str, weighted_score: float, attempts: int, judge_final: str) -> Dict:
+    return {
+        "cv": current_cv,
+        "weighted_score": weighted_score,
+        "attempts": attempts,
+        "feedback": judge_final,
+    }
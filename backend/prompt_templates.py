@@ -0,0 +1,197 @@
+# prompt_templates.py
+# Prefissi statici dei prompt precompilati una volta per versione dei file dati
+# (data/*.txt per la generazione, cvs/N.txt per i giudici) e composti con il suffisso dinamico.
+# Tiene anche il conto dei token statici/dinamici per sezione.
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .prompts import (
+    cv_static_sezione1, cv_static_sezione2, cv_static_sezione3, cv_static_sezione4,
+    cv_static_sezione5, cv_static_sezione6, cv_static_sezione7,
+    judge_static_sezione1, judge_static_sezione2, judge_static_sezione3, judge_static_sezione4,
+    judge_static_sezione5, judge_static_sezione6, judge_static_sezione7,
+    cv_dynamic, judge_dynamic, judge_batch_static, judge_batch_dynamic,
+)
+from .tokens import estimate_tokens
+
+SECTIONS = range(1, 8)
+
+# Ogni quanti secondi al massimo si ricontrolla se un file dati è cambiato (uno stat per prefisso):
+# le richieste nel frattempo usano il prefisso in cache senza toccare il disco
+TEMPLATES_RECHECK_SECONDS = float(os.getenv("ZEROHR_TEMPLATES_RECHECK_SECONDS", 5))
+
+data_dir = Path(__file__).parent.parent / "data"
+cvs_dir = data_dir.parent / "cvs"
+EXAMPLE_FILENAMES = [
+    "header.txt", "subject.txt", "Contract.txt", "laws_n_regs.txt",
+    "signature.txt", "privacy_notice.txt", "withdrawal.txt"
+]
+
+cv_static_map = {
+    1: cv_static_sezione1, 2: cv_static_sezione2, 3: cv_static_sezione3, 4: cv_static_sezione4,
+    5: cv_static_sezione5, 6: cv_static_sezione6, 7: cv_static_sezione7,
+}
+judge_static_map = {
+    1: judge_static_sezione1, 2: judge_static_sezione2, 3: judge_static_sezione3, 4: judge_static_sezione4,
+    5: judge_static_sezione5, 6: judge_static_sezione6, 7: judge_static_sezione7,
+}
+
+
+class StaticPrefix(NamedTuple):
+    version: Tuple
+    source: str        # testo del file dati (contratto d'esempio o campione GOLD STANDARD)
+    text: str          # prefisso compilato
+    tokens: int
+
+
+# (tipo, sezione) -> prefisso; tipo: "cv", "judge", "batch" (sezione 0)
+_prefixes: Dict[Tuple[str, int], StaticPrefix] = {}
+# (tipo, sezione) -> [chiamate, token dinamici totali, ultimo conteggio]
+_dynamic_stats: Dict[Tuple[str, int], List[int]] = {}
+# (tipo, sezione) -> istante dell'ultimo controllo della versione
+_checked_at: Dict[Tuple[str, int], float] = {}
+_lock = threading.Lock()
+
+
+def _example_path(section: int) -> Path:
+    return data_dir / EXAMPLE_FILENAMES[section - 1]
+
+
+def _sample_path(section: int) -> Path:
+    return cvs_dir / f"{section}.txt"
+
+
+def _file_version(path: Path) -> Tuple[int, int]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read(path: Path) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+def _fresh(key: Tuple[str, int]) -> Optional[StaticPrefix]:
+    """Prefisso in cache se controllato da meno di TEMPLATES_RECHECK_SECONDS."""
+    cached = _prefixes.get(key)
+    if cached is not None and time.monotonic() - _checked_at.get(key, 0.0) < TEMPLATES_RECHECK_SECONDS:
+        return cached
+    return None
+
+
+def _prefix(kind: str, section: int) -> StaticPrefix:
+    """Prefisso statico dalla cache, ricompilato solo se il file dati è cambiato (mtime o dimensione)."""
+    key = (kind, section)
+    prefix = _fresh(key)
+    if prefix is not None:
+        return prefix
+    path = _example_path(section) if kind == "cv" else _sample_path(section)
+    version = _file_version(path)
+    prefix = _prefixes.get(key)
+    if prefix is None or prefix.version != version:
+        source = _read(path)
+        text = (cv_static_map if kind == "cv" else judge_static_map)[section](source)
+        prefix = StaticPrefix(version, source, text, estimate_tokens(text))
+    with _lock:
+        _prefixes[key] = prefix
+        _checked_at[key] = time.monotonic()
+    return prefix
+
+
+def _batch_prefix() -> StaticPrefix:
+    key = ("batch", 0)
+    prefix = _fresh(key)
+    if prefix is not None:
+        return prefix
+    version = tuple(_file_version(_sample_path(s)) for s in SECTIONS)
+    prefix = _prefixes.get(key)
+    if prefix is None or prefix.version != version:
+        text = judge_batch_static({s: sample_text(s) for s in SECTIONS})
+        prefix = StaticPrefix(version, "", text, estimate_tokens(text))
+    with _lock:
+        _prefixes[key] = prefix
+        _checked_at[key] = time.monotonic()
+    return prefix
+
+
+def warm_up() -> None:
+    """
+    Legge i file dati e compila tutti i prefissi (carica anche il tokenizer): da chiamare in un
+    thread all'avvio, così la prima richiesta non fa I/O su disco dall'event loop.
+    """
+    for section in SECTIONS:
+        _prefix("cv", section)
+        _prefix("judge", section)
+    _batch_prefix()
+
+
+def _compose(kind: str, section: int, prefix: StaticPrefix, dynamic: str) -> str:
+    tokens = estimate_tokens(dynamic)
+    with _lock:
+        stats = _dynamic_stats.setdefault((kind, section), [0, 0, 0])
+        stats[0] += 1
+        stats[1] += tokens
+        stats[2] = tokens
+    return prefix.text + dynamic
+
+
+# --- API ---
+
+def example_text(section: int) -> str:
+    return _prefix("cv", section).source
+
+
+def sample_text(section: int) -> str:
+    return _prefix("judge", section).source
+
+
+def generation_prompt(section: int, user_info: str, conversation_history: str, judge_text: Optional[str]) -> str:
+    return _compose("cv", section, _prefix("cv", section),
+                    cv_dynamic(section, user_info, conversation_history, judge_text))
+
+
+def generation_prefix(section: int) -> str:
+    return _prefix("cv", section).text
+
+
+def generation_prompt_parts(section: int, user_info: str, conversation_history: str,
+                            judge_text: Optional[str]) -> Tuple[str, str]:
+    """(prefisso statico, parte dinamica) del prompt di generazione, per salvarlo a pezzi (blobs)."""
+    return _prefix("cv", section).text, cv_dynamic(section, user_info, conversation_history, judge_text)
+
+
+def judge_prompt(section: int, text: str) -> str:
+    return _compose("judge", section, _prefix("judge", section), judge_dynamic(text))
+
+
+def batch_judge_prompt(cv_sections: Dict[int, str]) -> str:
+    return _compose("batch", 0, _batch_prefix(), judge_batch_dynamic(cv_sections))
+
+
+def template_stats() -> List[Dict]:
+    """Token del prefisso statico e del suffisso dinamico (medio e ultimo) per tipo di prompt e sezione."""
+    keys = [("cv", s) for s in SECTIONS] + [("judge", s) for s in SECTIONS] + [("batch", 0)]
+    out = []
+    for kind, section in keys:
+        prefix = _batch_prefix() if kind == "batch" else _prefix(kind, section)
+        calls, total, last = _dynamic_stats.get((kind, section), [0, 0, 0])
+        avg = total / calls if calls else 0.0
+        out.append({
+            "kind": kind,
+            "section": section or None,
+            "static_tokens": prefix.tokens,
+            "dynamic_calls": calls,
+            "dynamic_tokens_avg": round(avg, 1),
+            "dynamic_tokens_last": last,
+            "static_share": round(prefix.tokens / (prefix.tokens + avg), 3) if calls else None,
+        })
+    return out
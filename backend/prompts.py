@@ -1,8 +1,24 @@
 # prompts.py
+# Ogni prompt è prefisso statico + suffisso dinamico. Il prefisso contiene istruzioni, contratto
+# d'esempio e campioni GOLD STANDARD, e resta identico tra le richieste, così il provider può riusarne
+# la prefix/KV cache. Il suffisso contiene dati utente, storico, feedback e testo da giudicare.
 
-def judge_prompt_sezione1(cv_text: str, sample_text1: str) -> str:
+SECTION_TITLES = {
+    1: "Header e Indirizzo",
+    2: "Oggetto del Documento",
+    3: "Dettagli del Contratto di Lavoro",
+    4: "Riferimenti Normativi",
+    5: "Firma del Contratto",
+    6: "Informativa Privacy",
+    7: "Consenso e Revoca del Consenso",
+}
+
+
+# ========== GIUDICI: prefissi statici ==========
+
+def judge_static_sezione1(sample_text1: str) -> str:
     return f"""
-Sei un Consulente HR severo, esperto nella revisione di documenti di assunzione secondo la normativa italiana vigente.  
+Sei un Consulente HR severo, esperto nella revisione di documenti di assunzione secondo la normativa italiana vigente.
 Valuta severamente la sezione "Header e Indirizzo" del documento fornito dall'utente, confrontandola esclusivamente con gli esempi GOLD STANDARD riportati qui sotto:
 
 
@@ -10,29 +26,25 @@ Esempi GOLD STANDARD:
 {sample_text1}
 
 
-Tieni conto di:  
-- Rispetto pedissequo della struttura dell'esempio;  
-- Completezza delle informazioni essenziali in questa sezione;  
-- Stile formale e senza elementi superflui;  
-- Assenza di dati sensibili non richiesti;  
-
-
-Questo è il testo da valutare:  
-{cv_text}
+Tieni conto di:
+- Rispetto pedissequo della struttura dell'esempio;
+- Completezza delle informazioni essenziali in questa sezione;
+- Stile formale e senza elementi superflui;
+- Assenza di dati sensibili non richiesti;
 
 In questa sezione non è richiesta la firma.
 In questa sezione non è richiesta la partita IVA
 
 
-Concedi un punteggio da 1 a 10, con formula testuale "Punteggio: X.Y".  
-Se manca anche una sola informazione fondamentale, massimo 7.9.  
-Se il punteggio è inferiore a 9.0, indica brevemente come migliorare la struttura o contenuto.  
-Se >= 9.0, conferma il buon lavoro.  
-Non aggiungere né inventare nulla. 
+Concedi un punteggio da 1 a 10, con formula testuale "Punteggio: X.Y".
+Se manca anche una sola informazione fondamentale, massimo 7.9.
+Se il punteggio è inferiore a 9.0, indica brevemente come migliorare la struttura o contenuto.
+Se >= 9.0, conferma il buon lavoro.
+Non aggiungere né inventare nulla.
 """
 
 
-def judge_prompt_sezione2(cv_text: str, sample_text2: str) -> str:
+def judge_static_sezione2(sample_text2: str) -> str:
     return f"""
 Sei un Consulente HR severo e rigoroso. Valuta la sezione "Oggetto del Documento" secondo gli standard GOLD STANDARD senza deviazioni.
 
@@ -41,44 +53,38 @@ Esempi GOLD STANDARD:
 {sample_text2}
 
 
-Controlla rispetto strutturale, completezza, tono formale e assenza di contenuti superflui.  
+Controlla rispetto strutturale, completezza, tono formale e assenza di contenuti superflui.
 DEVE ESSERCI SOLO QUELLA RIGA. NIENT'ALTRO CHE QUELLA ex(Oggetto: assunzione a tempo indeterminato) è da Punteggio 10
 
-Testo da valutare:  
-{cv_text}
 
-
-Dai un punteggio da 1 a 10 (testo esatto "Punteggio: X.Y").  
-Se manca anche solo una informazione base, max 7.9.  
-Per voti sotto 9.0, suggerisci miglioramenti precisi e sintetici.  
-Per punteggi 9.0 o più, apprezza il lavoro fatto.  
+Dai un punteggio da 1 a 10 (testo esatto "Punteggio: X.Y").
+Se manca anche solo una informazione base, max 7.9.
+Per voti sotto 9.0, suggerisci miglioramenti precisi e sintetici.
+Per punteggi 9.0 o più, apprezza il lavoro fatto.
 Niente aggiunte o invenzioni.
 """
 
 
-def judge_prompt_sezione3(cv_text: str, sample_text3: str) -> str:
+def judge_static_sezione3(sample_text3: str) -> str:
     return f"""
-Sei un Consulente HR severissimo nel valutare la sezione "Dettagli del Contratto di Lavoro".  
+Sei un Consulente HR severissimo nel valutare la sezione "Dettagli del Contratto di Lavoro".
 Esamina struttura, completezza, precisione e linguaggio formale, senza liste o contenuti estranei.
 
 
 Esempi GOLD STANDARD:
 {sample_text3}
 
-Testo da analizzare:  
-{cv_text}
-
 Firma e data NON necessarie in questa sezione.
 
-Attribuisci un punteggio da 1 a 10 con la formula, esatta e obbligatoriamente presente: "Punteggio: X.Y".  
-Se manca anche un dettaglio chiave, massimo 7.9.  
-Se punteggio < 9.0, indica come perfezionare contenuto o forma.  
-Se >= 9.0, conferma la validità.  
+Attribuisci un punteggio da 1 a 10 con la formula, esatta e obbligatoriamente presente: "Punteggio: X.Y".
+Se manca anche un dettaglio chiave, massimo 7.9.
+Se punteggio < 9.0, indica come perfezionare contenuto o forma.
+Se >= 9.0, conferma la validità.
 Non inventare nulla.
 """
 
 
-def judge_prompt_sezione4(cv_text: str, sample_text4: str) -> str:
+def judge_static_sezione4(sample_text4: str) -> str:
     return f"""
 In qualità di Consulente HR critico, valuta la sezione "Riferimenti Normativi" su conformità, completezza e fedeltà all'esempio GOLD STANDARD.
 
@@ -87,20 +93,17 @@ Esempi GOLD STANDARD:
 
 Firma e data non sono richieste in questa sezione.
 
-Testo da valutare:  
-{cv_text}
-
-Attribuisci un punteggio da 1 a 10 con la formula, esatta e obbligatoriamente presente: "Punteggio: X.Y".  
-Se manca un elemento fondamentale, massimo 7.9.  
-Per voti sotto 9.0, offri suggerimenti precisi per migliorare struttura o contenuti.  
-Per punteggio >= 9.0, elogio breve.  
+Attribuisci un punteggio da 1 a 10 con la formula, esatta e obbligatoriamente presente: "Punteggio: X.Y".
+Se manca un elemento fondamentale, massimo 7.9.
+Per voti sotto 9.0, offri suggerimenti precisi per migliorare struttura o contenuti.
+Per punteggio >= 9.0, elogio breve.
 Nessuna aggiunta o elaborazione extra.
 """
 
 
-def judge_prompt_sezione5(cv_text: str, sample_text5: str) -> str:
+def judge_static_sezione5(sample_text5: str) -> str:
     return f"""
-Sei un Consulente HR severo responsabile di giudicare la sezione "Firma del Contratto".  
+Sei un Consulente HR severo responsabile di giudicare la sezione "Firma del Contratto".
 Controlla che ci siano indicazioni per firma e data adeguate, senza che siano inserite nel testo, e che la struttura rispetti l'esempio GOLD STANDARD.
 
 
@@ -108,19 +111,15 @@ Esempi GOLD STANDARD:
 {sample_text5}
 
 
-Testo da valutare:  
-{cv_text}
-
-
-Assegna punteggio da 1 a 10 con formula "Punteggio: X.Y".  
-Se manca anche solo un elemento, massimo 7.9.  
-Se punteggio < 9.0, indica come migliorare la sezione sinteticamente.  
-Se >= 9.0, conferma accuratezza e completezza.  
+Assegna punteggio da 1 a 10 con formula "Punteggio: X.Y".
+Se manca anche solo un elemento, massimo 7.9.
+Se punteggio < 9.0, indica come migliorare la sezione sinteticamente.
+Se >= 9.0, conferma accuratezza e completezza.
 Non aggiungere o modificare contenuti.
 """
 
 
-def judge_prompt_sezione6(cv_text: str, sample_text6: str) -> str:
+def judge_static_sezione6(sample_text6: str) -> str:
     return f"""
 Come Consulente HR inflessibile, valuta la sezione "Informativa Privacy" per conformità rigorosa al modello GOLD STANDARD, precisione e chiarezza.
 
@@ -129,25 +128,21 @@ Esempi GOLD STANDARD:
 {sample_text6}
 
 
-Verifica struttura fedele, linguaggio formale, completezza delle informazioni e niente elementi inutili o allegati.  
+Verifica struttura fedele, linguaggio formale, completezza delle informazioni e niente elementi inutili o allegati.
 Firma e data devono essere indicati solo come spazi.
 
 
-Testo da giudicare:  
-{cv_text}
-
-
-Dai punteggio da 1 a 10 con "Punteggio: X.Y".  
-Se informazioni chiave mancano, non superare 7.9.  
-Se sotto 9.0, suggerisci brevi modifiche per renderla perfetta.  
-Se pari o superiore a 9.0, complimenti per l'ottimo lavoro.  
+Dai punteggio da 1 a 10 con "Punteggio: X.Y".
+Se informazioni chiave mancano, non superare 7.9.
+Se sotto 9.0, suggerisci brevi modifiche per renderla perfetta.
+Se pari o superiore a 9.0, complimenti per l'ottimo lavoro.
 Non inventare mai.
 """
 
 
-def judge_prompt_sezione7(cv_text: str, sample_text7: str) -> str:
+def judge_static_sezione7(sample_text7: str) -> str:
     return f"""
-Sei un Consulente HR severissimo nella valutazione della sezione "Consenso e Revoca del Consenso".  
+Sei un Consulente HR severissimo nella valutazione della sezione "Consenso e Revoca del Consenso".
 Controlla completa aderenza al modello GOLD STANDARD, chiarezza, corretto linguaggio e presenza di spazi per firma e data (indicati, non scritti).
 
 
@@ -155,35 +150,62 @@ Esempi GOLD STANDARD:
 {sample_text7}
 
 
-Testo da valutare:  
-{cv_text}
+Assegna punteggio da 1 a 10 con formula esatta "Punteggio: X.Y".
+Se manca anche un minimo essenziale, max 7.9.
+Per punteggi inferiori a 9.0, indica con precisione come perfezionarla.
+Se punteggio >= 9.0, conferma ottima qualità.
+Non aggiungere informazioni o dettagli.
+"""
 
 
-Assegna punteggio da 1 a 10 con formula esatta "Punteggio: X.Y".  
-Se manca anche un minimo essenziale, max 7.9.  
-Per punteggi inferiori a 9.0, indica con precisione come perfezionarla.  
-Se punteggio >= 9.0, conferma ottima qualità.  
-Non aggiungere informazioni o dettagli.
+def judge_dynamic(cv_text: str) -> str:
+    return f"""
+Testo da valutare:
+{cv_text}
 """
 
 
-# Ora le funzioni per i prompt di creazione sezione CV
+# Composizioni complete (stessa firma di sempre)
 
-def cv_prompt_sezione1(user_info: str, example_contract_text1: str, conversation_history: str, judge_text: str = None) -> str:
-    prompt = f"""
-Sei un esperto scrittore di documenti per assunzioni secondo la legge Italiana.
+def judge_prompt_sezione1(cv_text: str, sample_text1: str) -> str:
+    return judge_static_sezione1(sample_text1) + judge_dynamic(cv_text)
 
-Scrivi soltanto la sezione 1: "Header e Indirizzo" del contratto, partendo esclusivamente da queste informazioni fornite dall'utente, senza aggiungere o modificare nulla di originale:
 
-<user_info>{user_info}</user_info>
+def judge_prompt_sezione2(cv_text: str, sample_text2: str) -> str:
+    return judge_static_sezione2(sample_text2) + judge_dynamic(cv_text)
 
-Attieniti pedissequamente alla struttura e allo stile del seguente contratto d'esempio, senza variazioni:
 
-<contratto>{example_contract_text1}</contratto>
+def judge_prompt_sezione3(cv_text: str, sample_text3: str) -> str:
+    return judge_static_sezione3(sample_text3) + judge_dynamic(cv_text)
 
-Considera anche lo storico delle conversazioni seguenti, in modo da evitare incoerenze o ripetizioni:
 
-{conversation_history}
+def judge_prompt_sezione4(cv_text: str, sample_text4: str) -> str:
+    return judge_static_sezione4(sample_text4) + judge_dynamic(cv_text)
+
+
+def judge_prompt_sezione5(cv_text: str, sample_text5: str) -> str:
+    return judge_static_sezione5(sample_text5) + judge_dynamic(cv_text)
+
+
+def judge_prompt_sezione6(cv_text: str, sample_text6: str) -> str:
+    return judge_static_sezione6(sample_text6) + judge_dynamic(cv_text)
+
+
+def judge_prompt_sezione7(cv_text: str, sample_text7: str) -> str:
+    return judge_static_sezione7(sample_text7) + judge_dynamic(cv_text)
+
+
+# ========== CREAZIONE SEZIONI: prefissi statici ==========
+
+def cv_static_sezione1(example_contract_text1: str) -> str:
+    return f"""
+Sei un esperto scrittore di documenti per assunzioni secondo la legge Italiana.
+
+Scrivi soltanto la sezione 1: "Header e Indirizzo" del contratto, partendo esclusivamente dalle informazioni fornite dall'utente (riportate più sotto), senza aggiungere o modificare nulla di originale.
+
+Attieniti pedissequamente alla struttura e allo stile del seguente contratto d'esempio, senza variazioni:
+
+<contratto>{example_contract_text1}</contratto>
 
 Assicurati che la sezione includa, nell'ordine e con la stessa formattazione semplice e diretta dell'esempio:
 - Nome del mittente (
@@ -201,31 +223,23 @@ NON inserire informazioni aggiuntive o riferimenti esterni.
 
 Mantieni rigorosamente il formato e la punteggiatura dell'esempio GOLD STANDARD, senza trattini o punteggiatura non richiesti.
 """
-    if judge_text:
-        prompt += f"\n\nPer favore migliora il tuo documento basandoti su queste informazioni:\n{judge_text}"
-    return prompt
 
 
-def cv_prompt_sezione2(user_info: str, example_contract_text2: str, conversation_history: str, judge_text: str = None) -> str:
-    prompt = f"""
+def cv_static_sezione2(example_contract_text2: str) -> str:
+    return f"""
 Sei un esperto scrittore di documenti per assunzioni secondo la legge Italiana.
 
-Scrivi esclusivamente la sezione 2: "Oggetto del Documento" del contratto, basandoti solo sulle informazioni fornite dall'utente:
+Scrivi esclusivamente la sezione 2: "Oggetto del Documento" del contratto, basandoti solo sulle informazioni fornite dall'utente (riportate più sotto).
 
 NON INTRODURRE CON NIENTE NEANCHE IL NUMERO E NOME DELLA SEZIONE, SCRIVI SOLO IL TESTO.
 NIENT'ALTRO 0 SOLO QUELLA RIGA
 
-<user_info>{user_info}</user_info>
-
 Attieniti precisamente alla struttura e al linguaggio del seguente contratto d'esempio, senza variazioni:
 <contratto>{example_contract_text2}</contratto>
 
-Considera anche lo storico delle conversazioni per garantire coerenza:
-{conversation_history}  
-
 Istruzioni:
 - Non utilizzare tag HTML o XML, scrivi solo il testo pulito come nell'esempio GOLD STANDARD.
-- Allinea esattamente la formulazione a: 
+- Allinea esattamente la formulazione a:
 
   es: Oggetto: assunzione a tempo indeterminato
 
@@ -239,71 +253,47 @@ Istruzioni:
 NON inventare dati, usa trattini __ per indicare informazioni sensibili mancanti.
 
 Non inserire markup. Non fare riferimenti o aggiunte non previste.
-
 """
-    if judge_text:
-        prompt += f"\n\nPer favore migliora il tuo documento basandoti su queste informazioni:\n{judge_text}"
-    return prompt
 
 
-def cv_prompt_sezione3(user_info: str, example_contract_text3: str, conversation_history: str, judge_text: str = None) -> str:
-    prompt = f"""
+def cv_static_sezione3(example_contract_text3: str) -> str:
+    return f"""
 Sei un perfetto scrittore di documenti per assunzioni secondo la legge Italiana.
-Il tuo compito è scrivere la sezione "Dettagli del Contratto di Lavoro" del contratto, partendo da ciò che l'utente ti ha fornito.
-Dovrai attingere tutto SOLO ED ESCLUSIVAMENTE da queste informazioni, senza inventare nulla:
-<user_info>{user_info}</user_info>
+Il tuo compito è scrivere la sezione "Dettagli del Contratto di Lavoro" del contratto, partendo da ciò che l'utente ti ha fornito (riportato più sotto).
+Dovrai attingere tutto SOLO ED ESCLUSIVAMENTE da quelle informazioni, senza inventare nulla.
 Utilizza come modello la struttura del contratto d'esempio, senza mai assolutamente variare modalità:
 <contratto>{example_contract_text3}</contratto>
 NON INTRODURRE CON NIENTE NEANCHE IL NUMERO E NOME DELLA SEZIONE, SCRIVI SOLO IL TESTO.
 Mantieni pedissequamente la struttura e la semplicità del contratto di esempio in questa sezione specifica, senza aggiunte o modifiche strutturali.
-Considera lo storico conversazioni:
-{conversation_history}
 NON inserire informazioni sensibili o mancanti: usa trattini __ per indicarle nel testo.
 Non fare riferimenti né aggiunte esterne.
-Scrivi solo la sezione 3: Dettagli del Contratto di Lavoro.
 """
-    if judge_text:
-        prompt += f"\n\nPer favore migliora il tuo documento basandoti su queste informazioni:\n{judge_text}"
-    return prompt
 
 
-def cv_prompt_sezione4(user_info: str, example_contract_text4: str, conversation_history: str, judge_text: str = None) -> str:
-    prompt = f"""
+def cv_static_sezione4(example_contract_text4: str) -> str:
+    return f"""
 Sei un perfetto scrittore di documenti per assunzioni secondo la legge Italiana.
-Il tuo compito è scrivere la sezione "Riferimenti Normativi" del contratto, partendo da ciò che l'utente ti ha fornito.
-Dovrai attingere tutto SOLO ED ESCLUSIVAMENTE da queste informazioni, senza inventare nulla:
-<user_info>{user_info}</user_info>
+Il tuo compito è scrivere la sezione "Riferimenti Normativi" del contratto, partendo da ciò che l'utente ti ha fornito (riportato più sotto).
+Dovrai attingere tutto SOLO ED ESCLUSIVAMENTE da quelle informazioni, senza inventare nulla.
 Utilizza come modello la struttura del contratto d'esempio, senza mai assolutamente variare modalità:
 <contratto>{example_contract_text4}</contratto>
 NON INTRODURRE CON NIENTE NEANCHE IL NUMERO E NOME DELLA SEZIONE, SCRIVI SOLO IL TESTO.
 Mantieni pedissequamente la struttura e la semplicità del contratto di esempio in questa sezione specifica, senza aggiunte o modifiche strutturali.
-Considera lo storico conversazioni:
-{conversation_history}
 NON inserire informazioni sensibili o mancanti: usa trattini __ per indicarle nel testo.
 Non fare riferimenti né aggiunte esterne.
-Scrivi solo la sezione 4: Riferimenti Normativi.
 """
-    if judge_text:
-        prompt += f"\n\nPer favore migliora il tuo documento basandoti su queste informazioni:\n{judge_text}"
-    return prompt
 
 
-def cv_prompt_sezione5(user_info: str, example_contract_text5: str, conversation_history: str, judge_text: str = None) -> str:
-    prompt = f"""
+def cv_static_sezione5(example_contract_text5: str) -> str:
+    return f"""
 Sei un esperto scrittore di documenti per assunzioni secondo la legge Italiana.
 
 Scrivi solo la sezione 5: "Firma del Contratto" del documento.
 
-Attieniti esclusivamente ai dati forniti dall'utente:
-
-<user_info>{user_info}</user_info>
+Attieniti esclusivamente ai dati forniti dall'utente (riportati più sotto).
 
 NON INTRODURRE CON NIENTE NEANCHE IL NUMERO E NOME DELLA SEZIONE, SCRIVI SOLO IL TESTO.
 
-Considera anche lo storico delle conversazioni per garantire coerenza:
-
-{conversation_history}
-
 Utilizza come modello la struttura e il layout del contratto d'esempio senza alcuna variazione:
 
 <contratto>{example_contract_text5}</contratto>
@@ -317,55 +307,142 @@ Il testo dovrà presentare:
 
 Non inserire elementi esterni o riferimenti.
 """
-    if judge_text:
-        prompt += f"\n\nPer favore migliora il tuo documento basandoti su queste informazioni:\n{judge_text}"
-    return prompt
 
 
-def cv_prompt_sezione6(user_info: str, example_contract_text6: str, conversation_history: str, judge_text: str = None) -> str:
-    prompt = f"""
+def cv_static_sezione6(example_contract_text6: str) -> str:
+    return f"""
 Sei un perfetto scrittore di documenti per assunzioni secondo la legge Italiana.
-Il tuo compito è scrivere la sezione "Informativa Privacy" del documento, partendo da ciò che l'utente ti ha fornito.
-<user_info>{user_info}</user_info>
+Il tuo compito è scrivere la sezione "Informativa Privacy" del documento, partendo da ciò che l'utente ti ha fornito (riportato più sotto).
 Utilizza come modello la struttura del contratto d'esempio, senza mai assolutamente variare modalità:
 <contratto>{example_contract_text6}</contratto>
 Quando introduci la sezione, non usare nessun numero o titolo, scrivi solo il testo come nel testo d'esempio.
 Se l'utente non specifica, puoi copiare e utilizzare il contratto d'esempio per come è.
 Mantieni pedissequamente la struttura e la semplicità del contratto di esempio in questa sezione specifica, senza aggiunte o modifiche strutturali.
-Considera lo storico conversazioni:
-{conversation_history}
 NON inserire informazioni sensibili o mancanti: usa trattini __ per indicarle nel testo.
 Non fare riferimenti né aggiunte esterne.
-Scrivi solo la sezione 6: Informativa Privacy.
 """
-    if judge_text:
-        prompt += f"\n\nPer favore migliora il tuo documento basandoti su queste informazioni:\n{judge_text}"
-    return prompt
 
 
-def cv_prompt_sezione7(user_info: str, example_contract_text7: str, conversation_history: str, judge_text: str = None) -> str:
-    prompt = f"""
+def cv_static_sezione7(example_contract_text7: str) -> str:
+    return f"""
 Sei un perfetto scrittore di documenti per assunzioni secondo la legge Italiana.
-Il tuo compito è scrivere la sezione "Consenso e Revoca del Consenso al Trattamento" del documento, partendo da ciò che l'utente ti ha fornito.
-Dovrai attingere tutto SOLO ED ESCLUSIVAMENTE da queste informazioni, senza inventare nulla:
-<user_info>{user_info}</user_info>
+Il tuo compito è scrivere la sezione "Consenso e Revoca del Consenso al Trattamento" del documento, partendo da ciò che l'utente ti ha fornito (riportato più sotto).
+Dovrai attingere tutto SOLO ED ESCLUSIVAMENTE da quelle informazioni, senza inventare nulla.
 Utilizza come modello la struttura del contratto d'esempio, senza mai assolutamente variare modalità:
 <contratto>{example_contract_text7}</contratto>
 Quando introduci la sezione, non usare nessun numero o titolo, scrivi solo il testo come nel testo d'esempio.
 Mantieni pedissequamente la struttura e la semplicità del contratto di esempio in questa sezione specifica, senza aggiunte o modifiche strutturali.
-Considera lo storico conversazioni:
-{conversation_history}
 NON inserire informazioni sensibili o mancanti: usa trattini __ per indicarle nel testo.
 Non fare riferimenti né aggiunte esterne.
-Scrivi solo la sezione 7: Consenso e Revoca del Consenso.
+"""
+
+
+def cv_dynamic(section: int, user_info: str, conversation_history: str, judge_text: str = None) -> str:
+    prompt = f"""
+Informazioni fornite dall'utente:
+<user_info>{user_info}</user_info>
+
+Considera anche lo storico delle conversazioni seguenti, in modo da evitare incoerenze o ripetizioni:
+{conversation_history}
+
+Scrivi solo la sezione {section}: {SECTION_TITLES[section]}.
 """
     if judge_text:
         prompt += f"\n\nPer favore migliora il tuo documento basandoti su queste informazioni:\n{judge_text}"
     return prompt
 
+
+# Composizioni complete (stessa firma di sempre)
+
+def cv_prompt_sezione1(user_info: str, example_contract_text1: str, conversation_history: str, judge_text: str = None) -> str:
+    return cv_static_sezione1(example_contract_text1) + cv_dynamic(1, user_info, conversation_history, judge_text)
+
+
+def cv_prompt_sezione2(user_info: str, example_contract_text2: str, conversation_history: str, judge_text: str = None) -> str:
+    return cv_static_sezione2(example_contract_text2) + cv_dynamic(2, user_info, conversation_history, judge_text)
+
+
+def cv_prompt_sezione3(user_info: str, example_contract_text3: str, conversation_history: str, judge_text: str = None) -> str:
+    return cv_static_sezione3(example_contract_text3) + cv_dynamic(3, user_info, conversation_history, judge_text)
+
+
+def cv_prompt_sezione4(user_info: str, example_contract_text4: str, conversation_history: str, judge_text: str = None) -> str:
+    return cv_static_sezione4(example_contract_text4) + cv_dynamic(4, user_info, conversation_history, judge_text)
+
+
+def cv_prompt_sezione5(user_info: str, example_contract_text5: str, conversation_history: str, judge_text: str = None) -> str:
+    return cv_static_sezione5(example_contract_text5) + cv_dynamic(5, user_info, conversation_history, judge_text)
+
+
+def cv_prompt_sezione6(user_info: str, example_contract_text6: str, conversation_history: str, judge_text: str = None) -> str:
+    return cv_static_sezione6(example_contract_text6) + cv_dynamic(6, user_info, conversation_history, judge_text)
+
+
+def cv_prompt_sezione7(user_info: str, example_contract_text7: str, conversation_history: str, judge_text: str = None) -> str:
+    return cv_static_sezione7(example_contract_text7) + cv_dynamic(7, user_info, conversation_history, judge_text)
+
+
+# ========== GIUDIZIO BATCH (ZEROHR_JUDGE_MODE=batch) ==========
+
+JUDGE_BATCH_CRITERIA = {
+    1: "Header e Indirizzo: mittente e indirizzo completo, riga vuota, \"Egregio Signor\", destinatario e indirizzo completo. Niente firma né partita IVA.",
+    2: "Oggetto del Documento: UNA SOLA riga, es. \"Oggetto: assunzione a tempo indeterminato\"; quella riga da sola vale 10.",
+    3: "Dettagli del Contratto di Lavoro: struttura, completezza, precisione, linguaggio formale, senza liste o contenuti estranei. Firma e data non necessarie.",
+    4: "Riferimenti Normativi: conformità, completezza e fedeltà all'esempio. Firma e data non richieste.",
+    5: "Firma del Contratto: spazi per firma di datore e lavoratore e campo data (gg/mm/aaaa) su righe distinte, non compilati.",
+    6: "Informativa Privacy: struttura fedele, linguaggio formale, informazioni complete, niente allegati; firma e data solo come spazi.",
+    7: "Consenso e Revoca del Consenso: aderenza al modello, chiarezza, spazi per firma e data (indicati, non scritti).",
+}
+
+
+def judge_batch_static(sample_texts: dict) -> str:
+    # Criteri e campioni di tutte le 7 sezioni, anche se se ne giudicano meno: il prefisso non cambia
+    blocks = "\n\n".join(
+        f"""### Sezione {n}
+Criteri: {criteria}
+
+Esempi GOLD STANDARD:
+{sample_texts.get(n, "")}"""
+        for n, criteria in sorted(JUDGE_BATCH_CRITERIA.items())
+    )
+    return f"""
+Sei un Consulente HR severo, esperto nella revisione di documenti di assunzione secondo la normativa italiana vigente.
+Valuta separatamente ciascuna sezione fornita più sotto, confrontandola esclusivamente con i suoi esempi GOLD STANDARD e i suoi criteri.
+
+{blocks}
+
+Per ogni sezione:
+- punteggio da 1 a 10 con un decimale; se manca anche una sola informazione fondamentale, massimo 7.9;
+- se il punteggio è inferiore a 9.0, indica brevemente come migliorare; se >= 9.0, conferma il buon lavoro.
+Non aggiungere né inventare nulla.
+
+Infine riassumi, SOLO con puntini, le informazioni mancanti che l'utente deve aggiungere, escludendo formattazione e ciò che non compete a lui.
+
+Rispondi SOLO con un oggetto JSON valido, senza testo prima o dopo, in questo formato:
+{{"sezioni": {{"<numero sezione>": {{"punteggio": 8.5, "note": "..."}}}}, "riepilogo": "- ..."}}
+"""
+
+
+def judge_batch_dynamic(cv_sections: dict) -> str:
+    blocks = "\n\n".join(
+        f"""### Sezione {n} - testo da valutare:
+{text}"""
+        for n, text in sorted(cv_sections.items())
+    )
+    return f"""
+Sezioni da valutare (solo queste):
+
+{blocks}
+"""
+
+
+def judge_prompt_batch(cv_sections: dict, sample_texts: dict) -> str:
+    return judge_batch_static(sample_texts) + judge_batch_dynamic(cv_sections)
+
+
 def judge_final_prompt(judge_text:str = None):
     prompt = f"""
     Riassumi questo feedback usando SOLO puntini che indicano precisamente le Informazioni mancanti che l'utente deve aggiungere, escludento tutte quelle riguardandi formattazione e cose che non competono a lui. Preciso e perfettamente Conciso
     {judge_text}
 """
-    return prompt
\ No newline at end of file
+    return prompt
@@ -0,0 +1,197 @@
+# ratelimit.py
+# Rate limit condiviso da tutti i processi (API, worker Celery) verso Regolo: due token bucket
+# su Redis, richieste/minuto e token/minuto, aggiornati atomicamente da uno script Lua.
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+
+# Quote del provider (0 = nessun limite)
+REGOLO_RPM = int(os.getenv("REGOLO_RPM", 0))
+REGOLO_TPM = int(os.getenv("REGOLO_TPM", 0))
+# Oltre quest'attesa la chiamata viene rifiutata invece di restare in coda
+RATELIMIT_MAX_WAIT = float(os.getenv("RATELIMIT_MAX_WAIT", 120.0))
+
+_REQUESTS_KEY = "zerohr:rl:requests"
+_TOKENS_KEY = "zerohr:rl:tokens"
+_STATS_KEY = "zerohr:rl-stats"      # hash acquisitions / waited / wait_ms_total / timeouts
+_WAITS_KEY = "zerohr:rl-waits"      # ultime attese in ms (per i percentili)
+_WAITS_KEEP = 1000
+
+# KEYS[1] bucket richieste, KEYS[2] bucket token
+# ARGV: rpm, tpm, costo in richieste, costo in token, force (1 = addebita comunque, per le rettifiche)
+# Ritorna "0" se il costo è stato addebitato, altrimenti i secondi da attendere.
+_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local limits = {tonumber(ARGV[1]), tonumber(ARGV[2])}
+local costs = {tonumber(ARGV[3]), tonumber(ARGV[4])}
+local force = ARGV[5] == '1'
+local levels = {}
+local wait = 0
+for i = 1, 2 do
+  if limits[i] > 0 then
+    local data = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local level = tonumber(data[1]) or limits[i]
+    local ts = tonumber(data[2]) or now
+    level = math.min(limits[i], level + math.max(0, now - ts) * limits[i] / 60)
+    levels[i] = level
+    -- Una richiesta più grande dell'intera quota aspetta il bucket pieno, non per sempre
+    costs[i] = math.min(costs[i], limits[i])
+    if costs[i] > 0 and level < costs[i] then
+      wait = math.max(wait, (costs[i] - level) * 60 / limits[i])
+    end
+  end
+end
+if wait > 0 and not force then
+  return tostring(wait)
+end
+for i = 1, 2 do
+  if limits[i] > 0 then
+    redis.call('HSET', KEYS[i], 'tokens', tostring(math.min(limits[i], levels[i] - costs[i])), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[i], 300)
+  end
+end
+return '0'
+"""
+
+_redis_rl = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=1, decode_responses=True)
+_bucket = _redis_rl.register_script(_BUCKET_LUA)
+_aredis_rl: Optional[aioredis.Redis] = None
+_abucket = None
+
+
+class RateLimitTimeout(Exception):
+    """La quota non si libera entro RATELIMIT_MAX_WAIT secondi."""
+
+
+def enabled() -> bool:
+    return REGOLO_RPM > 0 or REGOLO_TPM > 0
+
+
+def _get_async_bucket():
+    global _aredis_rl, _abucket
+    if _aredis_rl is None:
+        _aredis_rl = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=1, decode_responses=True)
+        _abucket = _aredis_rl.register_script(_BUCKET_LUA)
+    return _abucket
+
+
+def _args(requests: int, tokens: int, force: bool = False):
+    return [REGOLO_RPM, REGOLO_TPM, requests, tokens, "1" if force else "0"]
+
+
+def _record_wait(pipe, waited: float, timed_out: bool = False) -> None:
+    ms = int(waited * 1000)
+    pipe.hincrby(_STATS_KEY, "acquisitions", 1)
+    if timed_out:
+        pipe.hincrby(_STATS_KEY, "timeouts", 1)
+    if ms > 0:
+        pipe.hincrby(_STATS_KEY, "waited", 1)
+        pipe.hincrby(_STATS_KEY, "wait_ms_total", ms)
+    pipe.lpush(_WAITS_KEY, ms)
+    pipe.ltrim(_WAITS_KEY, 0, _WAITS_KEEP - 1)
+
+
+def acquire(tokens: int) -> float:
+    """Attende che la quota consenta una richiesta da `tokens` token; ritorna i secondi passati in coda."""
+    if not enabled():
+        return 0.0
+    start = time.monotonic()
+    try:
+        while True:
+            wait = float(_bucket(keys=[_REQUESTS_KEY, _TOKENS_KEY], args=_args(1, tokens)))
+            waited = time.monotonic() - start
+            if wait <= 0:
+                break
+            if waited + wait > RATELIMIT_MAX_WAIT:
+                pipe = _redis_rl.pipeline()
+                _record_wait(pipe, waited, timed_out=True)
+                pipe.execute()
+                raise RateLimitTimeout(f"quota Regolo esaurita, attesa stimata {wait:.1f}s")
+            time.sleep(wait)
+        pipe = _redis_rl.pipeline()
+        _record_wait(pipe, waited)
+        pipe.execute()
+        return waited
+    except redis.RedisError as e:
+        # Redis giù: meglio rischiare un 429 (gestito dal retry) che fermare la pipeline
+        print("[RATELIMIT] redis error, procedo senza limite:", e)
+        return time.monotonic() - start
+
+
+async def acquire_async(tokens: int) -> float:
+    if not enabled():
+        return 0.0
+    start = time.monotonic()
+    bucket = _get_async_bucket()
+    try:
+        while True:
+            wait = float(await bucket(keys=[_REQUESTS_KEY, _TOKENS_KEY], args=_args(1, tokens)))
+            waited = time.monotonic() - start
+            if wait <= 0:
+                break
+            if waited + wait > RATELIMIT_MAX_WAIT:
+                pipe = _aredis_rl.pipeline()
+                _record_wait(pipe, waited, timed_out=True)
+                await pipe.execute()
+                raise RateLimitTimeout(f"quota Regolo esaurita, attesa stimata {wait:.1f}s")
+            await asyncio.sleep(wait)
+        pipe = _aredis_rl.pipeline()
+        _record_wait(pipe, waited)
+        await pipe.execute()
+        return waited
+    except redis.RedisError as e:
+        print("[RATELIMIT] redis error, procedo senza limite:", e)
+        return time.monotonic() - start
+
+
+def settle(estimated: int, actual: int) -> None:
+    """Rettifica il bucket token con il consumo reale (positivo: debito, negativo: rimborso)."""
+    if REGOLO_TPM <= 0 or actual == estimated:
+        return
+    try:
+        _bucket(keys=[_REQUESTS_KEY, _TOKENS_KEY], args=_args(0, actual - estimated, force=True))
+    except redis.RedisError as e:
+        print("[RATELIMIT] redis error:", e)
+
+
+async def asettle(estimated: int, actual: int) -> None:
+    if REGOLO_TPM <= 0 or actual == estimated:
+        return
+    try:
+        await _get_async_bucket()(keys=[_REQUESTS_KEY, _TOKENS_KEY], args=_args(0, actual - estimated, force=True))
+    except redis.RedisError as e:
+        print("[RATELIMIT] redis error:", e)
+
+
+def stats() -> Dict[str, Any]:
+    """Attese in coda (percentili in ms); con Redis irraggiungibile {"available": False}, non un errore."""
+    try:
+        raw = _redis_rl.hgetall(_STATS_KEY)
+        waits = sorted(int(w) for w in _redis_rl.lrange(_WAITS_KEY, 0, -1))
+    except redis.RedisError as e:
+        print("[RATELIMIT] redis error:", e)
+        return {"available": False, "rpm": REGOLO_RPM, "tpm": REGOLO_TPM}
+    out: Dict[str, Any] = {k: int(raw.get(k, 0)) for k in ("acquisitions", "waited", "wait_ms_total", "timeouts")}
+    out["available"] = True
+    for name, q in (("wait_ms_p50", 0.50), ("wait_ms_p95", 0.95), ("wait_ms_max", 1.0)):
+        out[name] = waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0
+    out["wait_ms_avg"] = (out["wait_ms_total"] / out["waited"]) if out["waited"] else 0.0
+    out["rpm"] = REGOLO_RPM
+    out["tpm"] = REGOLO_TPM
+    return out
+
+
+async def aclose() -> None:
+    global _aredis_rl, _abucket
+    if _aredis_rl is not None:
+        await _aredis_rl.aclose()
+    _aredis_rl = None
+    _abucket = None
@@ -0,0 +1,470 @@
+# regolo.py
+# Client HTTP condiviso per le chiamate a Regolo (un pool per processo, keep-alive).
+# Gli errori transitori (429, 5xx, rete) vengono ritentati con backoff; circuit breaker e
+# limite adattivo delle richieste in volo proteggono il provider quando è saturo.
+import asyncio
+import email.utils
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+import httpx
+
+from . import llm_cache, ratelimit
+from .tokens import estimate_tokens
+from .resilience import AdaptiveLimiter, CircuitBreaker, CircuitOpen, backoff_delay
+
+# --- Costanti Regolo (override via env) ---
+REGOLO_API_URL = os.getenv("REGOLO_API_URL", "https://api.regolo.ai/v1/completions")
+REGOLO_API_KEY = os.getenv("REGOLO_API_KEY")
+CV_CREATOR_MODEL = os.getenv("CV_CREATOR_MODEL", "gpt-oss-120b")
+
+# --- Pool di connessioni ---
+REGOLO_TIMEOUT = float(os.getenv("REGOLO_TIMEOUT", 600.0))
+REGOLO_CONNECT_TIMEOUT = float(os.getenv("REGOLO_CONNECT_TIMEOUT", 10.0))
+REGOLO_MAX_CONNECTIONS = int(os.getenv("REGOLO_MAX_CONNECTIONS", 20))
+REGOLO_MAX_KEEPALIVE = int(os.getenv("REGOLO_MAX_KEEPALIVE", 10))
+REGOLO_KEEPALIVE_EXPIRY = float(os.getenv("REGOLO_KEEPALIVE_EXPIRY", 60.0))
+REGOLO_HTTP2 = os.getenv("REGOLO_HTTP2", "0") == "1"
+# Completion in streaming per le sezioni generate (token inoltrati al canale eventi della run)
+REGOLO_STREAM = os.getenv("REGOLO_STREAM", "1") == "1"
+
+# --- Retry, circuit breaker e concorrenza adattiva ---
+REGOLO_MAX_RETRIES = int(os.getenv("REGOLO_MAX_RETRIES", 4))
+REGOLO_BACKOFF_BASE = float(os.getenv("REGOLO_BACKOFF_BASE", 1.0))
+REGOLO_BACKOFF_MAX = float(os.getenv("REGOLO_BACKOFF_MAX", 30.0))
+# Errori transitori consecutivi prima di aprire il circuito, e secondi prima della chiamata di prova
+REGOLO_BREAKER_THRESHOLD = int(os.getenv("REGOLO_BREAKER_THRESHOLD", 5))
+REGOLO_BREAKER_RESET = float(os.getenv("REGOLO_BREAKER_RESET", 30.0))
+# Limite iniziale / minimo / massimo delle chiamate in volo per processo
+REGOLO_LIMIT_INITIAL = int(os.getenv("REGOLO_LIMIT_INITIAL", 8))
+REGOLO_LIMIT_MIN = int(os.getenv("REGOLO_LIMIT_MIN", 1))
+REGOLO_LIMIT_MAX = int(os.getenv("REGOLO_LIMIT_MAX", REGOLO_MAX_CONNECTIONS))
+# Token di risposta prenotati nel rate limit prima di conoscere la risposta (poi rettificati)
+REGOLO_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("REGOLO_OUTPUT_TOKENS_ESTIMATE", 1024))
+
+
+
+def check_config() -> None:
+    """Verifica all'avvio (lifespan FastAPI, init del worker), non all'import del modulo."""
+    if not REGOLO_API_KEY:
+        raise ValueError("REGOLO_API_KEY environment variable is required")
+
+
+def _headers() -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {REGOLO_API_KEY}",
+    }
+
+
+class RegoloError(Exception):
+    """Errore restituito (o causato) dall'API Regolo."""
+
+    def __init__(self, message: str, status_code: int = 502, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RegoloUnavailable(RegoloError):
+    """Circuito aperto o quota del cluster esaurita: la chiamata non è partita."""
+
+
+def _retryable(e: RegoloError) -> bool:
+    return not isinstance(e, RegoloUnavailable) and (e.status_code == 429 or e.status_code >= 500)
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _status_error(resp: httpx.Response) -> RegoloError:
+    return RegoloError(f"Regolo API error: {resp.text}", status_code=resp.status_code, retry_after=_retry_after(resp))
+
+
+def _transport_error(e: httpx.TransportError) -> RegoloError:
+    status = 504 if isinstance(e, httpx.TimeoutException) else 502
+    return RegoloError(f"Regolo API unreachable: {e!r}", status_code=status)
+
+
+def _http2_enabled() -> bool:
+    # HTTP/2 richiede il pacchetto opzionale h2 (pip install httpx[http2])
+    if not REGOLO_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[REGOLO] REGOLO_HTTP2=1 ma 'h2' non è installato: uso HTTP/1.1")
+        return False
+    return True
+
+
+def _client_options() -> dict:
+    return {
+        "timeout": httpx.Timeout(REGOLO_TIMEOUT, connect=REGOLO_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=REGOLO_MAX_CONNECTIONS,
+            max_keepalive_connections=REGOLO_MAX_KEEPALIVE,
+            keepalive_expiry=REGOLO_KEEPALIVE_EXPIRY,
+        ),
+        "http2": _http2_enabled(),
+        "headers": _headers(),
+    }
+
+
+def _new_breaker() -> CircuitBreaker:
+    return CircuitBreaker(REGOLO_BREAKER_THRESHOLD, REGOLO_BREAKER_RESET)
+
+
+def _new_limiter() -> AdaptiveLimiter:
+    return AdaptiveLimiter(REGOLO_LIMIT_INITIAL, REGOLO_LIMIT_MIN, REGOLO_LIMIT_MAX)
+
+
+# Stato condiviso da tutte le chiamate del processo (thread Celery e event loop FastAPI)
+breaker = _new_breaker()
+limiter = _new_limiter()
+
+
+def resilience_stats() -> dict:
+    return {"breaker": breaker.snapshot(), "limiter": limiter.snapshot(), "ratelimit": ratelimit.stats()}
+
+
+# Un client per processo: dopo un fork (worker prefork) il pool del padre non va riusato.
+_client: Optional[httpx.Client] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.Client:
+    """Ritorna il client sincrono condiviso (thread-safe, creato al primo uso)."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = httpx.Client(**_client_options())
+                _client_pid = pid
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Ritorna il client asincrono condiviso (da usare nello stesso event loop del processo)."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(**_client_options())
+    return _async_client
+
+
+def reset_clients() -> None:
+    """Dimentica i client correnti senza chiuderli (es. nel figlio dopo un fork)."""
+    global _client, _client_pid, _async_client, breaker, limiter
+    _client = None
+    _client_pid = None
+    _async_client = None
+    # I lock del padre potrebbero essere stati copiati mentre erano acquisiti
+    breaker = _new_breaker()
+    limiter = _new_limiter()
+
+
+def close_client() -> None:
+    global _client, _client_pid
+    if _client is not None:
+        _client.close()
+    _client = None
+    _client_pid = None
+
+
+async def aclose_clients() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+    close_client()
+    await llm_cache.aclose()
+    await ratelimit.aclose()
+
+
+def _payload(model: str, prompt: str, temperature: float, stream: bool = False) -> dict:
+    data = {"model": model, "prompt": prompt, "temperature": temperature}
+    if stream:
+        data["stream"] = True
+    return data
+
+
+def _stream_delta(line: str) -> Optional[str]:
+    """Estrae il testo da una riga SSE ("data: {...}"); None per righe vuote, commenti o [DONE]."""
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    try:
+        return json.loads(data)["choices"][0].get("text") or ""
+    except Exception:
+        raise RegoloError(f"Invalid stream chunk from Regolo API: {data}", status_code=500)
+
+
+def _collect_stream(lines: Iterable[str], on_delta: Callable[[str], None]) -> str:
+    parts = []
+    for line in lines:
+        delta = _stream_delta(line)
+        if delta:
+            parts.append(delta)
+            on_delta(delta)
+    return "".join(parts).strip()
+
+
+def _parse_completion(resp: httpx.Response) -> str:
+    if resp.status_code != 200:
+        raise _status_error(resp)
+    js = resp.json()
+    try:
+        text = js["choices"][0]["text"]
+    except Exception:
+        raise RegoloError(f"Invalid response from Regolo API: {js}", status_code=500)
+    return text.strip()
+
+
+class _DeltaTracker:
+    """Inoltra le delta e ricorda se ne è già uscita qualcuna (uno stream a metà non si ritenta)."""
+
+    def __init__(self, on_delta: Callable[[str], Any]):
+        self.on_delta = on_delta
+        self.emitted = False
+
+    def __call__(self, delta: str) -> Any:
+        self.emitted = True
+        return self.on_delta(delta)
+
+
+async def _emit_async(on_delta: Callable[[str], Any], delta: str) -> None:
+    # Sull'event loop on_delta può essere una coroutine (events.AsyncDeltaRelay): va attesa, non bloccata
+    result = on_delta(delta)
+    if inspect.isawaitable(result):
+        await result
+
+
+def _admit() -> bool:
+    """Passa dal circuit breaker; True se la chiamata è la prova di half_open."""
+    try:
+        return breaker.allow()
+    except CircuitOpen as e:
+        raise RegoloUnavailable("Regolo API temporaneamente non disponibile (circuito aperto)",
+                                status_code=503, retry_after=e.retry_in)
+
+
+def _quota_exhausted(e: ratelimit.RateLimitTimeout) -> RegoloUnavailable:
+    return RegoloUnavailable(f"Regolo API: {e}", status_code=429, retry_after=ratelimit.RATELIMIT_MAX_WAIT)
+
+
+def _error_outcome(e: RegoloError) -> Optional[bool]:
+    # Quota esaurita: la chiamata non è partita, non dice nulla sulla salute del servizio
+    if isinstance(e, RegoloUnavailable):
+        return None
+    # Un errore non transitorio (4xx) è comunque una risposta del servizio
+    return not _retryable(e)
+
+
+def _record(outcome: Optional[bool], latency: float, probe: bool, acquired: bool) -> None:
+    """
+    Chiude la chiamata ammessa da _admit, qualunque sia l'esito (anche eccezioni inattese).
+    outcome: True riuscita (o errore non transitorio), False errore, None annullata o non partita.
+    """
+    if acquired:
+        limiter.release(latency, ok=outcome)
+    if outcome is True:
+        breaker.record_success()
+    elif outcome is False or probe:
+        # Una prova di half_open annullata va comunque risolta, altrimenti il circuito resta bloccato
+        breaker.record_failure()
+
+
+def _retry_delay(e: RegoloError, attempt: int, tracker: Optional[_DeltaTracker]) -> Optional[float]:
+    """Secondi di attesa prima di ritentare, o None se l'errore va propagato."""
+    if not _retryable(e) or attempt >= REGOLO_MAX_RETRIES or (tracker is not None and tracker.emitted):
+        return None
+    delay = backoff_delay(attempt, REGOLO_BACKOFF_BASE, REGOLO_BACKOFF_MAX, e.retry_after)
+    print(f"[REGOLO] errore {e.status_code}, tentativo {attempt + 1}/{REGOLO_MAX_RETRIES}, riprovo tra {delay:.1f}s")
+    return delay
+
+
+def _post_sync(client: httpx.Client, model: str, prompt: str, temperature: float,
+               on_delta: Optional[Callable[[str], None]]) -> str:
+    try:
+        if on_delta is None:
+            return _parse_completion(client.post(REGOLO_API_URL, json=_payload(model, prompt, temperature)))
+        with client.stream("POST", REGOLO_API_URL, json=_payload(model, prompt, temperature, stream=True)) as resp:
+            if resp.status_code != 200:
+                resp.read()
+                raise _status_error(resp)
+            return _collect_stream(resp.iter_lines(), on_delta)
+    except httpx.TransportError as e:
+        raise _transport_error(e)
+
+
+async def _post_async(client: httpx.AsyncClient, model: str, prompt: str, temperature: float,
+                      on_delta: Optional[Callable[[str], Any]]) -> str:
+    try:
+        if on_delta is None:
+            return _parse_completion(await client.post(REGOLO_API_URL, json=_payload(model, prompt, temperature)))
+        async with client.stream("POST", REGOLO_API_URL, json=_payload(model, prompt, temperature, stream=True)) as resp:
+            if resp.status_code != 200:
+                await resp.aread()
+                raise _status_error(resp)
+            parts = []
+            async for line in resp.aiter_lines():
+                delta = _stream_delta(line)
+                if delta:
+                    parts.append(delta)
+                    await _emit_async(on_delta, delta)
+            return "".join(parts).strip()
+    except httpx.TransportError as e:
+        raise _transport_error(e)
+
+
+def _attempt_sync(client: httpx.Client, model: str, prompt: str, temperature: float,
+                  on_delta: Optional[Callable[[str], None]]) -> str:
+    probe = _admit()
+    # Da qui in poi ogni uscita passa da _record: una prova di half_open non resta mai appesa
+    outcome: Optional[bool] = False
+    acquired = False
+    start = time.monotonic()
+    try:
+        # Quota del cluster prima dello slot locale: l'attesa in coda non occupa chiamate in volo
+        prompt_tokens = estimate_tokens(prompt)
+        reserved = prompt_tokens + REGOLO_OUTPUT_TOKENS_ESTIMATE
+        try:
+            ratelimit.acquire(reserved)
+        except ratelimit.RateLimitTimeout as e:
+            raise _quota_exhausted(e)
+        limiter.acquire()
+        acquired = True
+        start = time.monotonic()
+        text = _post_sync(client, model, prompt, temperature, on_delta)
+        outcome = True
+        ratelimit.settle(reserved, prompt_tokens + estimate_tokens(text))
+        return text
+    except RegoloError as e:
+        outcome = _error_outcome(e)
+        raise
+    finally:
+        _record(outcome, time.monotonic() - start, probe, acquired)
+
+
+async def _attempt_async(client: httpx.AsyncClient, model: str, prompt: str, temperature: float,
+                         on_delta: Optional[Callable[[str], Any]]) -> str:
+    probe = _admit()
+    outcome: Optional[bool] = False
+    acquired = False
+    start = time.monotonic()
+    try:
+        prompt_tokens = estimate_tokens(prompt)
+        reserved = prompt_tokens + REGOLO_OUTPUT_TOKENS_ESTIMATE
+        try:
+            await ratelimit.acquire_async(reserved)
+        except ratelimit.RateLimitTimeout as e:
+            raise _quota_exhausted(e)
+        await limiter.acquire_async()
+        acquired = True
+        start = time.monotonic()
+        text = await _post_async(client, model, prompt, temperature, on_delta)
+        outcome = True
+        await ratelimit.asettle(reserved, prompt_tokens + estimate_tokens(text))
+        return text
+    except RegoloError as e:
+        outcome = _error_outcome(e)
+        raise
+    except asyncio.CancelledError:
+        # Run annullata o client disconnesso: non è un errore del servizio
+        outcome = None
+        raise
+    finally:
+        _record(outcome, time.monotonic() - start, probe, acquired)
+
+
+def regolo_call_sync(
+    model: str,
+    prompt: str,
+    temperature: float = 0.7,
+    client: Optional[httpx.Client] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+    cache: bool = True,
+) -> str:
+    """
+    Completion Regolo; con on_delta la risposta arriva in streaming e ogni frammento viene inoltrato.
+    cache=False salta la cache delle risposte (lettura e scrittura).
+    """
+    if cache:
+        cached = llm_cache.get(model, prompt, temperature)
+        if cached is not None:
+            if on_delta is not None:
+                on_delta(cached)
+            return cached
+
+    client = client or get_client()
+    tracker = _DeltaTracker(on_delta) if on_delta is not None else None
+    attempt = 0
+    while True:
+        try:
+            text = _attempt_sync(client, model, prompt, temperature, tracker)
+            break
+        except RegoloError as e:
+            delay = _retry_delay(e, attempt, tracker)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+    if cache:
+        llm_cache.put(model, prompt, temperature, text)
+    return text
+
+
+async def regolo_call_async(
+    model: str,
+    prompt: str,
+    temperature: float = 0.7,
+    client: Optional[httpx.AsyncClient] = None,
+    on_delta: Optional[Callable[[str], Any]] = None,
+    cache: bool = True,
+) -> str:
+    """Come regolo_call_sync; on_delta può essere una funzione o una coroutine (attesa a ogni frammento)."""
+    if cache:
+        cached = await llm_cache.aget(model, prompt, temperature)
+        if cached is not None:
+            if on_delta is not None:
+                await _emit_async(on_delta, cached)
+            return cached
+
+    client = client or get_async_client()
+    tracker = _DeltaTracker(on_delta) if on_delta is not None else None
+    attempt = 0
+    while True:
+        try:
+            text = await _attempt_async(client, model, prompt, temperature, tracker)
+            break
+        except RegoloError as e:
+            delay = _retry_delay(e, attempt, tracker)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    if cache:
+        await llm_cache.aput(model, prompt, temperature, text)
+    return text
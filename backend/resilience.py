@@ -0,0 +1,148 @@
+# resilience.py
+# Primitive per chiamate a un servizio esterno degradato: backoff esponenziale con jitter,
+# circuit breaker e limite adattivo (AIMD) delle richieste in volo. Stato per processo.
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """Attesa prima del tentativo attempt+1: "full jitter" su base*2^attempt, mai meno di Retry-After."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, cap))
+    return delay
+
+
+class CircuitOpen(Exception):
+    """Il circuito è aperto: il servizio è considerato giù, la chiamata non parte."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"circuit open, retry in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    closed -> open dopo failure_threshold errori consecutivi; open -> half_open dopo reset_timeout.
+    In half_open passa una sola chiamata di prova: se va bene si richiude, altrimenti si riapre.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Lascia passare la chiamata (True se è la prova di half_open) o solleva CircuitOpen.
+        La prova va sempre chiusa con record_success o record_failure, anche se abortita.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return False
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == "open" and elapsed >= self.reset_timeout:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            raise CircuitOpen(max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"[BREAKER] circuito aperto dopo {self.failures} errori")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+class AdaptiveLimiter:
+    """
+    Limite AIMD delle richieste in volo: +1/limite per ogni successo, dimezzato su errore
+    (al massimo una volta per finestra) e ridotto del 10% quando la latenza recente supera
+    di latency_tolerance volte la media di lungo periodo.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int,
+                 latency_tolerance: float = 2.0, decrease_window: float = 1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_window = decrease_window
+        self.in_flight = 0
+        self._fast_latency: Optional[float] = None   # media mobile veloce (ultime chiamate)
+        self._slow_latency: Optional[float] = None   # media mobile lenta (riferimento)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    async def acquire_async(self, poll: float = 0.05) -> None:
+        # Il lock è di threading: dall'event loop si prova senza bloccare e si riprova dopo poll secondi
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+            await asyncio.sleep(poll)
+
+    def _decrease(self, factor: float, now: float) -> None:
+        if now - self._last_decrease < self.decrease_window:
+            return
+        self.limit = max(float(self.minimum), self.limit * factor)
+        self._last_decrease = now
+
+    def release(self, latency: float, ok: Optional[bool]) -> None:
+        """Libera lo slot; ok=None (chiamata annullata) non cambia il limite."""
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            now = time.monotonic()
+            if ok is False:
+                self._decrease(0.5, now)
+            elif ok:
+                self._fast_latency = latency if self._fast_latency is None else 0.5 * self._fast_latency + 0.5 * latency
+                self._slow_latency = latency if self._slow_latency is None else 0.95 * self._slow_latency + 0.05 * latency
+                if self._fast_latency > self.latency_tolerance * self._slow_latency:
+                    self._decrease(0.9, now)
+                else:
+                    self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency_recent": self._fast_latency,
+                "latency_baseline": self._slow_latency,
+            }
@@ -0,0 +1,121 @@
+# sessions.py
+# Token di sessione su tabella indicizzata (session_tokens): lookup per chiave primaria,
+# inserimento atomico, scadenza scorrevole. Sostituisce data/names_tokens.json.
+import datetime
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import Response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .sqdb import SessionLocal, SessionToken
+
+SESSION_TTL_DAYS = int(os.getenv("ZEROHR_SESSION_TTL_DAYS", 30))
+SESSION_TTL = datetime.timedelta(days=SESSION_TTL_DAYS)
+
+# Vecchio registro dei token: importato una volta sola, poi rinominato in .migrated
+LEGACY_TOKENS_PATH = Path(os.getenv(
+    "ZEROHR_LEGACY_TOKENS_PATH", Path(__file__).parent.parent / "data" / "names_tokens.json"
+))
+
+_store_ready = False
+_store_lock = threading.Lock()
+
+
+def migrate_legacy_tokens(db: Session, path: Path = LEGACY_TOKENS_PATH) -> int:
+    """Importa i token di names_tokens.json (quelli non già presenti) e rinomina il file; ritorna quanti."""
+    try:
+        with open(path, "r") as f:
+            tokens = list(json.load(f))
+    except FileNotFoundError:
+        return 0
+    except ValueError as e:
+        print("[SESSIONS] names_tokens.json illeggibile, migrazione saltata:", e)
+        return 0
+
+    now = datetime.datetime.now()
+    existing = set()
+    for i in range(0, len(tokens), 500):
+        chunk = tokens[i:i + 500]
+        existing.update(t for (t,) in db.query(SessionToken.token).filter(SessionToken.token.in_(chunk)))
+    missing = [t for t in dict.fromkeys(tokens) if t not in existing]
+    db.bulk_insert_mappings(SessionToken, [
+        {"token": t, "created_at": now, "expires_at": now + SESSION_TTL} for t in missing
+    ])
+    db.commit()
+    path.rename(path.with_name(path.name + ".migrated"))
+    print(f"[SESSIONS] migrati {len(missing)} token da {path.name}")
+    return len(missing)
+
+
+def purge_expired(db: Session) -> int:
+    deleted = (
+        db.query(SessionToken)
+        .filter(SessionToken.expires_at < datetime.datetime.now())
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+def init_session_store() -> None:
+    """
+    Una volta per processo, all'avvio (lifespan dell'API, init del worker): migrazione del
+    vecchio file e pulizia dei token scaduti, prima che arrivino richieste.
+    """
+    global _store_ready
+    with _store_lock:
+        if _store_ready:
+            return
+        db = SessionLocal()
+        try:
+            migrate_legacy_tokens(db, LEGACY_TOKENS_PATH)
+            purge_expired(db)
+        finally:
+            db.close()
+        _store_ready = True
+
+
+def _create_token(db: Session) -> str:
+    now = datetime.datetime.now()
+    while True:
+        token = str(uuid.uuid4())
+        db.add(SessionToken(token=token, created_at=now, expires_at=now + SESSION_TTL))
+        try:
+            db.commit()
+            return token
+        except IntegrityError:
+            db.rollback()
+
+
+def resolve_session_token(db: Session, session_token: Optional[str]) -> Tuple[str, bool]:
+    """Ritorna (token, creato): riusa il token se valido e non scaduto, altrimenti ne crea uno nuovo."""
+    now = datetime.datetime.now()
+    if session_token:
+        row = db.get(SessionToken, session_token)
+        if row is not None and row.expires_at > now:
+            # Scadenza scorrevole, ma si scrive solo quando è passata metà della durata
+            if row.expires_at - now < SESSION_TTL / 2:
+                row.expires_at = now + SESSION_TTL
+                db.commit()
+            return session_token, False
+    return _create_token(db), True
+
+
+def session_from_cookie(db: Session, session_token: Optional[str], response: Optional[Response]) -> str:
+    """Token della richiesta; se ne serve uno nuovo viene impostato nel cookie."""
+    token, created = resolve_session_token(db, session_token)
+    if created:
+        if response:
+            response.set_cookie(
+                key="session_token", value=token, httponly=True, max_age=int(SESSION_TTL.total_seconds())
+            )
+        print(f"Nuovo token di sessione creato ed impostato nel cookie: {token}")
+    else:
+        print(f"Token di sessione esistente rilevato: {token}, lo riutilizzo")
+    return token
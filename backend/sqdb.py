@@ -1,8 +1,9 @@
 import os
 from pathlib import Path
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, desc
+from sqlalchemy import Column, String, DateTime, Integer, Index, LargeBinary, desc, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .db import make_async_engine, make_engine
 import datetime
 
 
@@ -11,7 +12,7 @@ DATABASE_URL = os.getenv(
     f"sqlite:///{(Path(__file__).parent.parent / 'data' / 'assunzioni.db').resolve()}"
 )
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit= False)
 Base = declarative_base()
 
@@ -21,16 +22,84 @@ class UserSession(Base):
     start_time = Column(DateTime, default=datetime.datetime.now, nullable=True)
     last_access_time = Column(DateTime, default=datetime.datetime.now, nullable=True)
     
+class SessionToken(Base):
+    __tablename__ = "session_tokens"
+    token = Column(String, primary_key=True)
+    created_at = Column(DateTime, default=datetime.datetime.now, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)
+
 class ChatSession(Base):
     __tablename__ = "messages"
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    session_id = Column(String, index=True, nullable=True)
-    type = Column(String, index=True, nullable=True)
-    message = Column(String, index=True, nullable=True)
+    # Un solo indice per la query dello storico (session_id = ?, type != 'System', ORDER BY id DESC):
+    # (session_id, id) serve sia l'uguaglianza sia l'ordinamento, type != ... non è un intervallo
+    # utilizzabile e si filtra sulle righe lette. message contiene contratti e prompt interi e non va indicizzato
+    __table_args__ = (Index("ix_messages_session_id_id", "session_id", "id"),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, nullable=True)
+    type = Column(String, nullable=True)
+    message = Column(String, nullable=True)
+    # Corpi grandi (prompt System, documenti Assistant): hash dei blob in ordine, separati da
+    # virgola, al posto di message (vedi blobs.py)
+    blob_hashes = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.now, nullable=True)
-    
+
+class Blob(Base):
+    """Contenuto indirizzato per hash (sha256 del testo), compresso: ogni testo distinto è salvato una volta."""
+    __tablename__ = "blobs"
+    hash = Column(String, primary_key=True)
+    codec = Column(String, nullable=False)        # zstd | zlib
+    size = Column(Integer, nullable=False)        # byte del testo non compresso
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.now, nullable=True)
+
+# Colonne aggiunte dopo la prima versione dello schema (create_all non altera le tabelle esistenti)
+_ADDED_COLUMNS = {
+    "messages": {"blob_hashes": "VARCHAR"},
+}
+
+# Indici delle versioni precedenti dello schema, sostituiti da ix_messages_session_id_id:
+# create_all non tocca le tabelle esistenti, quindi sui DB già creati li togliamo a mano.
+_DROPPED_INDEXES = {
+    "messages": [
+        "ix_messages_message", "ix_messages_session_id", "ix_messages_type", "ix_messages_id",
+        "ix_messages_session_type_id",
+    ],
+}
+
+
+_schema_migrated = False
+
+
+def _migrate_schema():
+    global _schema_migrated
+    if _schema_migrated:
+        return
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in _ADDED_COLUMNS.items():
+            if not insp.has_table(table):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+        for table, names in _DROPPED_INDEXES.items():
+            if not insp.has_table(table):
+                continue
+            existing = {ix["name"] for ix in insp.get_indexes(table)}
+            for name in names:
+                if name in existing:
+                    conn.execute(text(f"DROP INDEX {name}"))
+                    print(f"[DB] indice {name} rimosso")
+    # Sulle tabelle già esistenti il nuovo indice composito non viene creato da create_all
+    for index in ChatSession.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    _schema_migrated = True
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _migrate_schema()
     print("Database initialized.")  
 
 def get_db():
@@ -38,4 +107,50 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def run_write(fn, *args, **kwargs):
+    """
+    fn(db, *args) su una sessione sincrona, con commit: dagli endpoint async si chiama con asyncio.to_thread.
+    Con SQLite il lock di scrittura resta preso solo per le query, non tra un await e l'altro
+    dell'event loop come con aiosqlite (sotto carico gli altri scrittori andavano in busy_timeout).
+    """
+    db = SessionLocal()
+    try:
+        result = fn(db, *args, **kwargs)
+        db.commit()
+        return result
+    finally:
+        db.close()
+
+
+def touch_user_session(db, session_token: str) -> bool:
+    """Aggiorna last_access_time della UserSession (o la crea); ritorna True se è nuova."""
+    now = datetime.datetime.now()
+    user_session = db.get(UserSession, session_token)
+    if user_session is None:
+        db.add(UserSession(user_id=session_token, start_time=now, last_access_time=now))
+        return True
+    user_session.last_access_time = now
+    return False
+
+
+# --- Sessioni async per gli endpoint dell'API (engine creato al primo uso) ---
+_async_session_factory = None
+
+
+def _async_session():
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import AsyncSession
+        # expire_on_commit=False: le righe restano leggibili dopo il commit senza altro I/O
+        _async_session_factory = sessionmaker(
+            bind=make_async_engine(DATABASE_URL), class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factory()
+
+
+async def get_async_db():
+    async with _async_session() as db:
+        yield db
@@ -1,8 +1,11 @@
 import os
+import datetime
 from pathlib import Path
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Float
+from typing import Dict, Iterable, Optional
+from sqlalchemy import Column, String, DateTime, Integer, Float, UniqueConstraint, insert, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .db import make_async_engine, make_engine
 
 
 DATABASE_URL = os.getenv(
@@ -10,7 +13,7 @@ DATABASE_URL = os.getenv(
     f"sqlite:///{(Path(__file__).parent.parent / 'data' / 'key_flow.db').resolve()}"
 )
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit= False)
 Base = declarative_base()
 
@@ -18,6 +21,7 @@ Base = declarative_base()
 class Workflow(Base):
     __tablename__ = "workflow"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    run_id = Column(String, index=True, nullable=True)  # Run di generazione (una per richiesta /main)
     section = Column(Integer, index=True)   # Numero sezione (1,2,...7)
     status = Column(String, index=True, nullable=True)     # esempi: da_generare, generato, da_giudicare, giudicato
     text = Column(String, nullable=True)                    # Testo generato o da giudicare
@@ -25,10 +29,12 @@ class Workflow(Base):
     notes = Column(String, nullable=True) 
     weighted_score = Column(Float, nullable=True)                  # Note miglioramenti (opzionale)
     retry_count = Column(Integer, default=0, nullable=True)       # Numero di retry effettuati
+    created_at = Column(DateTime, default=datetime.datetime.now, index=True, nullable=True)  # Per la pulizia a TTL
 
 class AllData(Base):
     __tablename__ = "alldata"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    run_id = Column(String, index=True, nullable=True)
     section = Column(Integer, index=True)   # Numero sezione (1,2,...7)
     status = Column(String, index=True, nullable=True)     # esempi: da_generare, generato, da_giudicare, giudicato
     text = Column(String, nullable=True)                    # Testo generato o da giudicare
@@ -37,7 +43,87 @@ class AllData(Base):
     weighted_score = Column(Float, nullable=True)                  # Note miglioramenti (opzionale)
     retry_count = Column(Integer, default=0, nullable=True)
 
+class SectionSnapshot(Base):
+    """Ultimo testo accettato per ogni sezione di una sessione (base per le rigenerazioni parziali)."""
+    __tablename__ = "section_snapshots"
+    __table_args__ = (UniqueConstraint("session_id", "section", name="uq_snapshot_session_section"),)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    session_id = Column(String, index=True, nullable=False)
+    section = Column(Integer, nullable=False)
+    run_id = Column(String, nullable=True)                  # Run che ha prodotto il testo
+    text = Column(String, nullable=True)
+    score = Column(Float, nullable=True)
+    notes = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.now, nullable=True)
+
+SECTIONS = range(1, 8)
+# Righe per INSERT multi-riga: 4 parametri a riga, sotto il limite di 999 variabili dei vecchi SQLite
+SEED_CHUNK_ROWS = 200
+
+
+def seed_runs(
+    db2,
+    run_ids: Iterable[Optional[str]],
+    status_all: str = "da_generare",
+    status_map: Optional[Dict[int, str]] = None,
+    commit: bool = True,
+) -> int:
+    """
+    Crea le 7 righe Workflow di ciascuna run con un solo INSERT ... VALUES multi-riga
+    (a blocchi per molte run) e un solo commit; ritorna le righe inserite.
+    Non cancella nulla: le run devono essere nuove, o già ripulite nella stessa transazione.
+    """
+    status_map = status_map or {}
+    now = datetime.datetime.now()
+    rows = [
+        {"run_id": run_id, "section": s, "status": status_map.get(s, status_all), "retry_count": 0, "created_at": now}
+        for run_id in run_ids
+        for s in SECTIONS
+    ]
+    for i in range(0, len(rows), SEED_CHUNK_ROWS):
+        db2.execute(insert(Workflow).values(rows[i:i + SEED_CHUNK_ROWS]))
+    if commit:
+        db2.commit()
+    return len(rows)
+
+
+def purge_expired_runs(db2, ttl_seconds: float) -> int:
+    """
+    Elimina le righe Workflow create da più di ttl_seconds: run annullate, fallite o abbandonate
+    (quelle concluse le toglie già /finalize). Lo storico resta in AllData e negli snapshot.
+    """
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=ttl_seconds)
+    deleted = db2.query(Workflow).filter(Workflow.created_at < cutoff).delete(synchronize_session=False)
+    db2.commit()
+    return deleted
+
+
+# Colonne aggiunte dopo la prima versione dello schema: create_all non altera
+# tabelle esistenti, quindi le aggiungiamo a mano sui DB già creati.
+_ADDED_COLUMNS = {
+    "workflow": {"run_id": "VARCHAR", "created_at": "DATETIME"},
+    "alldata": {"run_id": "VARCHAR"},
+}
+
+
+def _migrate_columns():
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in _ADDED_COLUMNS.items():
+            if not insp.has_table(table):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{name} ON {table} ({name})"))
+                    if name == "created_at":
+                        # Le righe già presenti partono da adesso: scadranno dopo il TTL, non subito
+                        conn.execute(Base.metadata.tables[table].update().values(created_at=datetime.datetime.now()))
+
+
 def init_db2():
+    _migrate_columns()
     Base.metadata.create_all(bind=engine)
     print("Database initialized.")  
 
@@ -46,4 +132,38 @@ def get_db2():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def run_write2(fn, *args, **kwargs):
+    """
+    fn(db2, *args) su una sessione sincrona di key_flow.db, con commit: dagli endpoint async si
+    chiama con asyncio.to_thread (vedi sqdb.run_write). La sessione async serve solo alle letture.
+    """
+    db2 = SessionLocal()
+    try:
+        result = fn(db2, *args, **kwargs)
+        db2.commit()
+        return result
+    finally:
+        db2.close()
+
+
+# --- Sessioni async per gli endpoint dell'API (engine creato al primo uso) ---
+_async_session_factory = None
+
+
+def _async_session():
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import AsyncSession
+        # expire_on_commit=False: le righe restano leggibili dopo il commit senza altro I/O
+        _async_session_factory = sessionmaker(
+            bind=make_async_engine(DATABASE_URL), class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factory()
+
+
+async def get_async_db2():
+    async with _async_session() as db:
+        yield db
@@ -0,0 +1,38 @@
+# tokens.py
+# Stima del numero di token di un testo, per rate limit e budget dei prompt.
+import math
+import os
+
+# Se installato, tiktoken dà il conteggio esatto (pip install tiktoken); altrimenti si stima dai caratteri
+TOKENIZER_ENCODING = os.getenv("ZEROHR_TOKENIZER_ENCODING", "o200k_base")
+# Caratteri per token nella stima senza tokenizer (testo italiano: ~3.5)
+CHARS_PER_TOKEN = float(os.getenv("ZEROHR_CHARS_PER_TOKEN", 3.5))
+
+
+def _load_encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        print("[TOKENS] encoding non disponibile, uso la stima:", e)
+        return None
+
+
+# Caricato alla prima stima: importare tiktoken e leggere l'encoding rallenta l'avvio
+_encoding = None
+_encoding_loaded = False
+
+
+def estimate_tokens(text: str) -> int:
+    global _encoding, _encoding_loaded
+    if not text:
+        return 0
+    if not _encoding_loaded:
+        _encoding = _load_encoding()
+        _encoding_loaded = True
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
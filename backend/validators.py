@@ -0,0 +1,201 @@
+# validators.py
+# Pre-giudizio deterministico delle sezioni: regole strutturali (le stesse scritte nei prompt)
+# e confronto con lo scheletro del campione GOLD STANDARD (cvs/N.txt, se presente).
+# Ogni validatore accetta, respinge con un feedback pronto per il retry, oppure rimanda al giudice LLM:
+# si respingono solo i difetti certi, le differenze di formulazione restano al giudice.
+import os
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+ZEROHR_PREJUDGE = os.getenv("ZEROHR_PREJUDGE", "1") == "1"
+
+# Punteggi assegnati senza giudice LLM: sopra / sotto SCORE_THRESHOLD della pipeline
+ACCEPT_SCORE = 9.5
+REJECT_SCORE = 5.0
+
+
+class Verdict(NamedTuple):
+    score: float
+    notes: str
+
+
+# Validatore: (testo, campione GOLD STANDARD) -> Verdict, oppure None per rimandare al giudice LLM
+Validator = Callable[[str, str], Optional[Verdict]]
+
+# sezione -> validatori, eseguiti in ordine; vince il primo che decide
+VALIDATORS: Dict[int, List[Validator]] = {}
+# validatori comuni a tutte le sezioni, eseguiti prima di quelli specifici
+COMMON_VALIDATORS: List[Validator] = []
+
+
+def register(*sections: int):
+    """Registra un validatore per le sezioni indicate (nessuna sezione = tutte)."""
+    def decorator(fn: Validator) -> Validator:
+        if not sections:
+            COMMON_VALIDATORS.append(fn)
+        for s in sections:
+            VALIDATORS.setdefault(s, []).append(fn)
+        return fn
+    return decorator
+
+
+def accept(reason: str) -> Verdict:
+    return Verdict(ACCEPT_SCORE, f"Punteggio: {ACCEPT_SCORE}\n[Controllo automatico] {reason}")
+
+
+def reject(*problems: str) -> Verdict:
+    # Stesso formato del giudice LLM: il testo finisce tale e quale nel prompt di rigenerazione
+    lines = "\n".join(f"- {p}" for p in problems)
+    return Verdict(REJECT_SCORE, f"Punteggio: {REJECT_SCORE}\n[Controllo automatico] Da correggere:\n{lines}")
+
+
+def prejudge(section: int, text: str, sample_text: str = "") -> Optional[Verdict]:
+    """Verdetto deterministico per la sezione, o None se serve il giudice LLM."""
+    if not ZEROHR_PREJUDGE:
+        return None
+    for validator in COMMON_VALIDATORS + VALIDATORS.get(section, []):
+        verdict = validator(text, sample_text)
+        if verdict is not None:
+            return verdict
+    return None
+
+
+def outcome(verdict: Optional[Verdict]) -> str:
+    if verdict is None:
+        return "deferred"
+    return "accepted" if verdict.score >= ACCEPT_SCORE else "rejected"
+
+
+# --- Utilità ---
+
+_MARKUP_RE = re.compile(r"</?[a-zA-Z][^>]*>|^\s*(#{1,6}\s|```)|\*\*", re.M)
+_SECTION_TITLE_RE = re.compile(r"^\s*(sezione\s*\d|\d\s*[\.\)]\s*(header|oggetto|firma))", re.I)
+# Etichetta di campo: al massimo 5 parole prima dei due punti (le frasi con ":" non contano)
+_LABEL_RE = re.compile(r"^\s*([A-ZÀ-Ú][^:\n]{1,40}?)\s*:")
+
+
+def _lines(text: str) -> List[str]:
+    return [l.strip() for l in text.strip().splitlines()]
+
+
+def _non_empty(text: str) -> List[str]:
+    return [l for l in _lines(text) if l]
+
+
+def _labels(text: str) -> List[str]:
+    """Etichette "Xxx:" a inizio riga, normalizzate (es. "firma datore di lavoro")."""
+    out = []
+    for line in _non_empty(text):
+        m = _LABEL_RE.match(line)
+        if m and len(m.group(1).split()) <= 5:
+            out.append(re.sub(r"\s+", " ", m.group(1)).lower())
+    return out
+
+
+def _missing_labels(text: str, sample_text: str) -> List[str]:
+    have = set(_labels(text))
+    return [label for label in dict.fromkeys(_labels(sample_text)) if label not in have]
+
+
+# --- Regole comuni ---
+
+@register()
+def _not_empty(text: str, sample_text: str) -> Optional[Verdict]:
+    if not text.strip():
+        return reject("La sezione è vuota: scrivi il testo richiesto.")
+    return None
+
+
+@register()
+def _no_markup(text: str, sample_text: str) -> Optional[Verdict]:
+    problems = []
+    if _MARKUP_RE.search(text):
+        problems.append("Togli tag HTML/XML e markdown (#, **, ```): solo testo pulito come nell'esempio.")
+    lines = _non_empty(text)
+    if lines and _SECTION_TITLE_RE.match(lines[0]):
+        problems.append("Non introdurre la sezione con numero o titolo: scrivi solo il testo.")
+    return reject(*problems) if problems else None
+
+
+# --- Sezione 1: Header e Indirizzo ---
+
+@register(1)
+def _header_layout(text: str, sample_text: str) -> Optional[Verdict]:
+    lines = _lines(text)
+    opening = next((i for i, l in enumerate(lines) if re.match(r"egregi[oa]|gentile", l, re.I)), None)
+    if opening is None:
+        return reject("Manca la formula di apertura \"Egregio Signor\" prima del destinatario.")
+    problems = []
+    if not any(lines[:opening]):
+        problems.append("Prima della formula di apertura vanno nome e indirizzo completo del mittente.")
+    elif lines[opening - 1]:
+        problems.append("Lascia una riga vuota tra l'indirizzo del mittente e la formula di apertura.")
+    if len([l for l in lines[opening:] if l]) < 2:
+        problems.append("Dopo la formula di apertura vanno nome completo e indirizzo del destinatario.")
+    if re.search(r"\bfirm[ao]\b|partita\s+iva|p\.?\s?iva", text, re.I):
+        problems.append("In questa sezione non vanno firma né partita IVA.")
+    if problems:
+        return reject(*problems)
+    # La completezza dei dati la valuta il giudice LLM
+    return None
+
+
+# --- Sezione 2: Oggetto (una sola riga "Oggetto: ...") ---
+
+_SUBJECT_RE = re.compile(r"^oggetto\s*:\s*(\S.{2,150})$", re.I)
+
+
+@register(2)
+def _single_subject_line(text: str, sample_text: str) -> Optional[Verdict]:
+    lines = _non_empty(text)
+    if len(lines) != 1:
+        return reject("Deve esserci una sola riga, nel formato \"Oggetto: assunzione a tempo indeterminato\".")
+    match = _SUBJECT_RE.match(lines[0])
+    if not match:
+        return reject("La riga deve iniziare con \"Oggetto:\" seguito dalla tipologia di assunzione.")
+    if re.search(r"contratto\s+di\s+assunzione", match.group(1), re.I):
+        return reject("Non aggiungere dettagli ridondanti come \"contratto di assunzione\".")
+    return accept("una sola riga \"Oggetto: ...\" come nell'esempio.")
+
+
+# --- Sezione 5: Firma del Contratto ---
+
+_SIGNATURE_RE = re.compile(r"firma[^\n]*_{3,}", re.I)
+_DATE_RE = re.compile(r"data[^\n]*(_{3,}|\d{1,2}/\d{1,2}/\d{2,4})", re.I)
+
+
+@register(5)
+def _signature_fields(text: str, sample_text: str) -> Optional[Verdict]:
+    problems = []
+    if len(_SIGNATURE_RE.findall(text)) < 2:
+        problems.append("Servono due righe separate di firma con spazio sottolineato (datore di lavoro e lavoratore).")
+    if not _DATE_RE.search(text):
+        problems.append("Manca il campo data, es. \"Data (gg/mm/aaaa): __________\".")
+    if problems:
+        return reject(*problems)
+    if sample_text and not _missing_labels(text, sample_text):
+        return accept("campi firma e data presenti con le stesse etichette dell'esempio.")
+    return None
+
+
+# --- Sezioni con struttura a campi: confronto con lo scheletro del campione ---
+
+# Sotto questo numero di etichette nel campione lo scheletro non è abbastanza sicuro per respingere
+SKELETON_MIN_LABELS = 2
+
+
+@register(3, 4, 6, 7)
+def _sample_skeleton(text: str, sample_text: str) -> Optional[Verdict]:
+    # Senza campione (cvs/N.txt assente) non c'è scheletro da confrontare: decide il giudice LLM
+    expected = list(dict.fromkeys(_labels(sample_text))) if sample_text else []
+    if len(expected) < SKELETON_MIN_LABELS:
+        return None
+    # Si respinge solo il difetto strutturale certo: nessun campo "Voce: valore" dove il campione
+    # ne ha diversi. Etichette diverse dal campione possono essere sinonimi corretti ("Sede di
+    # lavoro" per "Luogo di lavoro"): quelle le valuta il giudice LLM, non vanno respinte qui.
+    if not _labels(text):
+        return reject(
+            "Scrivi la sezione con le voci nel formato \"Voce: valore\" come nell'esempio, "
+            f"ad esempio \"{expected[0].capitalize()}: ...\"."
+        )
+    return None
@@ -0,0 +1,197 @@
+"""
+Benchmark di concorrenza dell'API: C client in parallelo chiamano POST /main (ognuno con la
+propria sessione, turni successivi) per D secondi; intanto un client sonda un endpoint leggero
+per misurare quanto l'event loop resta reattivo sotto carico.
+
+    # API già avviata (Redis necessario)
+    python benchmarks/bench_api_concurrency.py --url http://localhost:8000 --clients 32 --duration 30
+
+    # Avvia da solo un Regolo finto e l'API (uvicorn, motore inline, DB SQLite temporanei)
+    python benchmarks/bench_api_concurrency.py --spawn --clients 32 --duration 30
+
+Per un confronto prima/dopo si lancia lo stesso comando su due commit diversi.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+QUESTIONS = [
+    "Contratto a tempo indeterminato per Mario Rossi, impiegato amministrativo, RAL 28.000 euro, sede Milano.",
+    "Cambia la sede in Torino e l'orario in part-time 30 ore.",
+    "Aggiungi un periodo di prova di 3 mesi e CCNL Commercio livello 4.",
+]
+
+
+# --- Regolo finto: risponde dopo --fake-latency secondi, anche in streaming SSE ---
+
+def _fake_regolo_handler(latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                self._reply()
+            except (BrokenPipeError, ConnectionResetError):
+                # La run è stata annullata dal turno successivo e l'API ha chiuso la connessione
+                pass
+
+        def _reply(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(latency)
+            text = "Punteggio: 9.8\nSezione generata dal benchmark."
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for chunk in (text[:20], text[20:]):
+                    self.wfile.write(f"data: {json.dumps({'choices': [{'text': chunk}]})}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                return
+            payload = json.dumps({"choices": [{"text": text}], "usage": {"total_tokens": 64}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_stack(tmp: str, latency: float):
+    regolo_port, api_port = _free_port(), _free_port()
+    server = ThreadingHTTPServer(("127.0.0.1", regolo_port), _fake_regolo_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = dict(
+        os.environ,
+        ZEROHR_ENGINE="inline",
+        REGOLO_API_KEY="bench",
+        REGOLO_API_URL=f"http://127.0.0.1:{regolo_port}/v1/completions",
+        DATABASE_URL=f"sqlite:///{tmp}/assunzioni.db",
+        KEY_FLOW_DATABASE_URL=f"sqlite:///{tmp}/key_flow.db",
+        # Lo stack di prova non deve migrare (e rinominare) il names_tokens.json del repo
+        ZEROHR_LEGACY_TOKENS_PATH=f"{tmp}/names_tokens.json",
+    )
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(api_port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    url = f"http://127.0.0.1:{api_port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/admin/memory_stores", timeout=1.0)
+            return server, api, url
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    api.terminate()
+    server.shutdown()
+    raise RuntimeError("API non avviata entro 60s")
+
+
+# --- Carico ---
+
+async def _client(url: str, idx: int, stop_at: float, latencies, errors) -> None:
+    async with httpx.AsyncClient(base_url=url, timeout=120.0) as client:
+        turn = 0
+        while time.monotonic() < stop_at:
+            question = QUESTIONS[(idx + turn) % len(QUESTIONS)]
+            t = time.perf_counter()
+            try:
+                resp = await client.post("/main", json={"question": question})
+                resp.raise_for_status()
+                latencies.append((time.perf_counter() - t) * 1000)
+            except httpx.HTTPStatusError as e:
+                errors.append(f"HTTP {e.response.status_code}")
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+            turn += 1
+
+
+async def _probe(url: str, path: str, stop_at: float, latencies) -> None:
+    async with httpx.AsyncClient(base_url=url, timeout=30.0) as client:
+        while time.monotonic() < stop_at:
+            t = time.perf_counter()
+            try:
+                await client.get(path)
+                latencies.append((time.perf_counter() - t) * 1000)
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.05)
+
+
+def _pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_load(url: str, clients: int, duration: float, probe_path: str) -> None:
+    latencies, errors, probes = [], [], []
+    start = time.monotonic()
+    stop_at = start + duration
+    await asyncio.gather(
+        *(_client(url, i, stop_at, latencies, errors) for i in range(clients)),
+        _probe(url, probe_path, stop_at, probes),
+    )
+    elapsed = time.monotonic() - start
+
+    print(f"POST /main: {clients} client per {duration:.0f}s")
+    print(f"  richieste ok   {len(latencies)}  ({len(latencies) / elapsed:.1f} req/s), errori {len(errors)}")
+    if latencies:
+        print(f"  latenza ms     p50 {statistics.median(latencies):.1f}  p95 {_pct(latencies, 0.95):.1f}"
+              f"  p99 {_pct(latencies, 0.99):.1f}  max {max(latencies):.1f}")
+    if probes:
+        print(f"GET {probe_path} durante il carico: p50 {statistics.median(probes):.1f} ms"
+              f"  p95 {_pct(probes, 0.95):.1f} ms  max {max(probes):.1f} ms")
+    if errors:
+        print("  tipi di errore:", {e: errors.count(e) for e in set(errors)})
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--clients", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--probe-path", default="/admin/memory_stores")
+    ap.add_argument("--spawn", action="store_true", help="avvia Regolo finto + API in locale")
+    ap.add_argument("--fake-latency", type=float, default=0.5, help="secondi per risposta del Regolo finto")
+    args = ap.parse_args()
+
+    if not args.spawn:
+        asyncio.run(run_load(args.url, args.clients, args.duration, args.probe_path))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server, api, url = spawn_stack(tmp, args.fake_latency)
+        try:
+            asyncio.run(run_load(url, args.clients, args.duration, args.probe_path))
+        finally:
+            api.terminate()
+            api.wait(timeout=30)
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
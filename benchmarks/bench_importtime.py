@@ -0,0 +1,79 @@
+"""
+Tempo di import dei moduli di avvio (python -X importtime), da tenere come controllo di regressione:
+l'import di backend.main deve restare senza effetti collaterali (niente DB, file dati, rete)
+e non deve caricare i moduli pesanti usati solo a runtime.
+
+    python benchmarks/bench_importtime.py
+    python benchmarks/bench_importtime.py --module backend.autocv --budget-ms 1500 --repeat 7
+
+Esce con codice 1 se la mediana supera --budget-ms o se viene importato un modulo di --forbid.
+L'import avviene senza REGOLO_API_KEY: il controllo della chiave è nel lifespan, non all'import.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Caricati solo quando servono (prima sessione, prima stima token, primo endpoint async)
+DEFAULT_FORBIDDEN = ["langgraph", "tiktoken", "aiosqlite", "asyncpg"]
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str):
+    """Una misura in un interprete nuovo: ritorna ({modulo: (self_us, cumulative_us)}, cumulativo del target)."""
+    env = {k: v for k, v in os.environ.items() if k != "REGOLO_API_KEY"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise SystemExit(f"import di {module} fallito:\n{tail}")
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules, modules.get(module, (0, 0))[1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--module", default="backend.main")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--budget-ms", type=float, default=None)
+    ap.add_argument("--forbid", nargs="*", default=DEFAULT_FORBIDDEN)
+    args = ap.parse_args()
+
+    totals, last = [], {}
+    for _ in range(args.repeat):
+        last, total = measure(args.module)
+        totals.append(total / 1000)
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: mediana {median:.1f} ms su {args.repeat} esecuzioni "
+          f"(min {min(totals):.1f}, max {max(totals):.1f}), {len(last)} moduli")
+    print(f"\nmoduli con più tempo proprio (ultima esecuzione):")
+    for name, (self_us, cumulative_us) in sorted(last.items(), key=lambda kv: -kv[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  (cumulativo {cumulative_us / 1000:8.1f} ms)  {name}")
+
+    failed = False
+    loaded = sorted(f for f in args.forbid if any(m == f or m.startswith(f + ".") for m in last))
+    if loaded:
+        print(f"\nERRORE: importati all'avvio moduli da caricare solo a runtime: {', '.join(loaded)}")
+        failed = True
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"\nERRORE: {median:.1f} ms oltre il budget di {args.budget_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark della tabella messages: schema vecchio (indici su id, session_id, type e message)
+contro schema nuovo (solo indice composito session_id, id); "session_type" è la variante
+(session_id, type, id), tenuta per confronto.
+
+Misura la latenza della query dello storico (history.load_turns) e dell'inserimento di un
+turno (User + System) su un DB SQLite con N righe, di default 1M.
+
+    python benchmarks/bench_messages_index.py --rows 1000000 --message-chars 1500
+
+Il DB viene creato in una cartella temporanea (usa --dir per sceglierla: servono circa
+rows * message-chars byte per schema).
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import string
+import tempfile
+import time
+
+COMMON_DDL = """
+CREATE TABLE messages (
+    id INTEGER NOT NULL PRIMARY KEY,
+    session_id VARCHAR,
+    type VARCHAR,
+    message VARCHAR,
+    created_at DATETIME
+)
+"""
+
+SCHEMAS = {
+    "old": [
+        "CREATE INDEX ix_messages_id ON messages (id)",
+        "CREATE INDEX ix_messages_session_id ON messages (session_id)",
+        "CREATE INDEX ix_messages_type ON messages (type)",
+        "CREATE INDEX ix_messages_message ON messages (message)",
+    ],
+    "session_type": [
+        "CREATE INDEX ix_messages_session_type_id ON messages (session_id, type, id)",
+    ],
+    "new": [
+        "CREATE INDEX ix_messages_session_id_id ON messages (session_id, id)",
+    ],
+}
+
+HISTORY_SQL = (
+    "SELECT type, message FROM messages WHERE session_id = ? AND type != 'System' "
+    "ORDER BY id DESC LIMIT 30"
+)
+INSERT_SQL = "INSERT INTO messages (session_id, type, message, created_at) VALUES (?, ?, ?, datetime('now'))"
+
+TYPES = ["User", "System", "Assistant", "Judge"]
+# Lunghezza relativa per tipo: i System sono prompt interi (esempio + storico), gli User poche righe
+TYPE_SCALE = {"User": 0.2, "System": 3.0, "Assistant": 1.0, "Judge": 0.4}
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    # Testo vario (non comprimibile in modo banale) come contratti e prompt veri
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(64)]
+    out, size = [], 0
+    while size < chars:
+        w = rng.choice(words)
+        out.append(w)
+        size += len(w) + 1
+    return " ".join(out)[:chars]
+
+
+def build(path: str, schema: str, rows: int, sessions: int, chars: int, seed: int) -> None:
+    rng = random.Random(seed)
+    corpus = {t: [_text(rng, int(chars * TYPE_SCALE[t])) for _ in range(64)] for t in TYPES}
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(COMMON_DDL)
+    for ddl in SCHEMAS[schema]:
+        conn.execute(ddl)
+    batch = []
+    start = time.perf_counter()
+    for i in range(rows):
+        sid = f"sess-{rng.randrange(sessions):06d}"
+        # Prefisso unico: i messaggi veri differiscono tutti, l'indice su message non si comprime
+        kind = TYPES[i % 4]
+        batch.append((sid, kind, f"{i} " + rng.choice(corpus[kind])))
+        if len(batch) == 10000:
+            conn.executemany(INSERT_SQL, batch)
+            conn.commit()
+            batch.clear()
+    if batch:
+        conn.executemany(INSERT_SQL, batch)
+        conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    print(f"  [{schema}] {rows} righe in {time.perf_counter() - start:.1f}s, "
+          f"{os.path.getsize(path) / 1e6:.0f} MB")
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def measure(path: str, sessions: int, queries: int, inserts: int, chars: int, seed: int) -> dict:
+    rng = random.Random(seed + 1)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    plan = " | ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + HISTORY_SQL, ("sess-000000",)))
+
+    lookups = []
+    for _ in range(queries):
+        sid = f"sess-{rng.randrange(sessions):06d}"
+        t = time.perf_counter()
+        conn.execute(HISTORY_SQL, (sid,)).fetchall()
+        lookups.append((time.perf_counter() - t) * 1000)
+
+    writes = []
+    for i in range(inserts):
+        sid = f"sess-{rng.randrange(sessions):06d}"
+        user = _text(rng, int(chars * TYPE_SCALE["User"]))
+        system = f"bench-{i} " + _text(rng, int(chars * TYPE_SCALE["System"]))
+        t = time.perf_counter()
+        conn.execute(INSERT_SQL, (sid, "User", user))
+        conn.execute(INSERT_SQL, (sid, "System", system))
+        conn.commit()
+        writes.append((time.perf_counter() - t) * 1000)
+    conn.close()
+    return {
+        "plan": plan,
+        "lookup_p50": statistics.median(lookups), "lookup_p95": _pct(lookups, 0.95),
+        "insert_p50": statistics.median(writes), "insert_p95": _pct(writes, 0.95),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--sessions", type=int, default=50_000)
+    ap.add_argument("--message-chars", type=int, default=1500)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--inserts", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--dir", default=None)
+    ap.add_argument("--schemas", nargs="+", choices=list(SCHEMAS), default=list(SCHEMAS))
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        results = {}
+        for schema in args.schemas:
+            path = os.path.join(tmp, f"messages_{schema}.db")
+            build(path, schema, args.rows, args.sessions, args.message_chars, args.seed)
+            results[schema] = measure(path, args.sessions, args.queries, args.inserts,
+                                      args.message_chars, args.seed)
+
+    print(f"\nmessages: {args.rows} righe, {args.sessions} sessioni, messaggi da {args.message_chars} caratteri")
+    print(f"{'schema':<14}{'storico p50':>14}{'storico p95':>14}{'insert p50':>14}{'insert p95':>14}  (ms)")
+    for schema, r in results.items():
+        print(f"{schema:<14}{r['lookup_p50']:>14.3f}{r['lookup_p95']:>14.3f}"
+              f"{r['insert_p50']:>14.3f}{r['insert_p95']:>14.3f}")
+    for schema, r in results.items():
+        print(f"  piano [{schema}]: {r['plan']}")
+
+
+if __name__ == "__main__":
+    main()
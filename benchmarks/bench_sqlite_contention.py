@@ -0,0 +1,177 @@
+"""
+Benchmark di contesa su SQLite: 7 x N thread scrittori (una run da 7 sezioni per "worker"),
+come i task di sezione Celery che aggiornano la tabella workflow, più un lettore che fa
+polling dello stato come /task_status.
+
+Confronta la configurazione di prima (rollback journal, synchronous=FULL, timeout di 5s del
+driver) con quella di backend/db.py (WAL, synchronous=NORMAL, busy_timeout, mmap).
+
+    python benchmarks/bench_sqlite_contention.py --runs 4 --rounds 20
+
+Ogni scrittore fa `rounds` cicli generato -> giudicato sulla propria riga, con un testo di
+sezione di --text-chars caratteri.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend.db import SQLITE_BUSY_TIMEOUT_MS, sqlite_pragmas  # noqa: E402
+
+# "tuned" usa gli stessi PRAGMA di backend/db.py (variabili SQLITE_* comprese)
+CONFIGS = {
+    "before": {"timeout": 5.0, "pragmas": ["PRAGMA journal_mode=DELETE", "PRAGMA synchronous=FULL"]},
+    "tuned": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000, "pragmas": sqlite_pragmas()},
+}
+
+DDL = """
+CREATE TABLE workflow (
+    id INTEGER NOT NULL PRIMARY KEY,
+    run_id VARCHAR,
+    section INTEGER,
+    status VARCHAR,
+    text VARCHAR,
+    score FLOAT,
+    notes VARCHAR,
+    weighted_score FLOAT,
+    retry_count INTEGER
+)
+"""
+INDEXES = [
+    "CREATE INDEX ix_workflow_run_id ON workflow (run_id)",
+    "CREATE INDEX ix_workflow_section ON workflow (section)",
+    "CREATE INDEX ix_workflow_status ON workflow (status)",
+]
+
+
+def connect(path: str, config: dict) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=config["timeout"], check_same_thread=False)
+    for pragma in config["pragmas"]:
+        conn.execute(pragma)
+    return conn
+
+
+def setup(path: str, config: dict, runs: int) -> None:
+    conn = connect(path, config)
+    conn.execute(DDL)
+    for ddl in INDEXES:
+        conn.execute(ddl)
+    conn.executemany(
+        "INSERT INTO workflow (run_id, section, status, retry_count) VALUES (?, ?, 'da_generare', 0)",
+        [(f"run-{r}", s) for r in range(runs) for s in range(1, 8)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def writer(path, config, run_id, section, rounds, text, latencies, errors, barrier):
+    conn = connect(path, config)
+    barrier.wait()
+    for i in range(rounds):
+        for status, score in (("generato", None), ("giudicato", 7.0 + (i % 3))):
+            t = time.perf_counter()
+            try:
+                row = conn.execute(
+                    "SELECT id, retry_count FROM workflow WHERE run_id = ? AND section = ?", (run_id, section)
+                ).fetchone()
+                conn.execute(
+                    "UPDATE workflow SET status = ?, text = ?, score = ?, retry_count = ? WHERE id = ?",
+                    (status, text, score, (row[1] or 0) + 1, row[0]),
+                )
+                conn.commit()
+                latencies.append((time.perf_counter() - t) * 1000)
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                errors.append(str(e))
+    conn.close()
+
+
+def poller(path, config, runs, stop, reads, errors):
+    conn = connect(path, config)
+    rng = random.Random(0)
+    while not stop.is_set():
+        t = time.perf_counter()
+        try:
+            conn.execute(
+                "SELECT section, status, score FROM workflow WHERE run_id = ? ORDER BY section",
+                (f"run-{rng.randrange(runs)}",),
+            ).fetchall()
+            reads.append((time.perf_counter() - t) * 1000)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+        time.sleep(0.01)
+    conn.close()
+
+
+def _pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(name: str, runs: int, rounds: int, text_chars: int, tmp: str) -> dict:
+    config = CONFIGS[name]
+    path = os.path.join(tmp, f"key_flow_{name}.db")
+    setup(path, config, runs)
+    text = "".join(random.Random(1).choices(string.ascii_letters + " ", k=text_chars))
+
+    latencies, reads, errors = [], [], []
+    barrier = threading.Barrier(runs * 7 + 1)
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=writer, args=(path, config, f"run-{r}", s, rounds, text, latencies, errors, barrier))
+        for r in range(runs) for s in range(1, 8)
+    ]
+    reader = threading.Thread(target=poller, args=(path, config, runs, stop, reads, errors))
+    for th in threads:
+        th.start()
+    reader.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    reader.join()
+    return {
+        "writes": len(latencies),
+        "writes_s": len(latencies) / elapsed,
+        "write_p50": _pct(latencies, 0.50),
+        "write_p95": _pct(latencies, 0.95),
+        "write_max": max(latencies) if latencies else float("nan"),
+        "read_p95": _pct(reads, 0.95),
+        "errors": len(errors),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=4, help="run concorrenti (N): 7 thread scrittori ciascuna")
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--text-chars", type=int, default=4000)
+    ap.add_argument("--dir", default=None)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        results = {name: run(name, args.runs, args.rounds, args.text_chars, tmp) for name in CONFIGS}
+
+    print(f"workflow: {args.runs} run x 7 sezioni = {args.runs * 7} scrittori, {args.rounds} cicli ciascuno")
+    print(f"{'config':<8}{'scritture':>10}{'scr/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"
+          f"{'lett p95':>10}{'errori':>8}")
+    for name, r in results.items():
+        print(f"{name:<8}{r['writes']:>10}{r['writes_s']:>10.0f}{r['write_p50']:>10.2f}{r['write_p95']:>10.2f}"
+              f"{r['write_max']:>10.1f}{r['read_p95']:>10.2f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
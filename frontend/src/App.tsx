@@ -75,10 +75,38 @@ function ZeroHRDocGenerator() {
       }
     };
 
-    poll();
+    // Avanzamento push via SSE: un solo /task_status a fine run; polling solo come fallback.
+    let source: EventSource | null = null;
+    if (typeof EventSource !== "undefined") {
+      source = new EventSource("/progress/" + encodeURIComponent(taskId), {
+        withCredentials: true,
+      });
+      source.addEventListener("status", (ev) => {
+        const data = JSON.parse((ev as MessageEvent).data);
+        const score = data.score != null ? " (" + data.score + ")" : "";
+        setStatus("Sezione " + data.section + ": " + data.status + score);
+      });
+      const finish = () => {
+        source?.close();
+        source = null;
+        if (!cancelled) poll();
+      };
+      source.addEventListener("done", finish);
+      source.addEventListener("failed", finish);
+      source.addEventListener("cancelled", () => {
+        source?.close();
+        source = null;
+      });
+      source.onerror = () => {
+        if (source) finish();
+      };
+    } else {
+      poll();
+    }
 
     return () => {
       cancelled = true;
+      source?.close();
       if (timerRef.current) {
         clearTimeout(timerRef.current);
         timerRef.current = null;
@@ -129,7 +157,7 @@ function ZeroHRDocGenerator() {
     }
   };
 
-  // Solo annulla: interrompe polling, resetta backend e NON riparte.
+  // Solo annulla: interrompe polling, annulla la run di questa sessione e NON riparte.
   const handleCancelOnly = async () => {
     // stop polling
     if (timerRef.current) {
@@ -142,19 +170,16 @@ function ZeroHRDocGenerator() {
     setStatus("Annullamento in corso…");
 
     try {
-      // reset completo lato backend (kill + purge + flush + reseed)
-      await fetch("/admin/reset", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        credentials: "include",
-        body: JSON.stringify({
-          reseed: true,
-          status_all: "da_generare",
-          purge: true,
-          flush_backend: true,
-          kill_mode: "soft"
-        }),
-      });
+      // Solo la run corrente della sessione: le run degli altri utenti non si toccano
+      if (currentTask) {
+        const res = await fetch("/cancel/" + encodeURIComponent(currentTask), {
+          method: "POST",
+          credentials: "include",
+        });
+        if (!res.ok && res.status !== 404) {
+          throw new Error("cancel failed: " + res.status);
+        }
+      }
       setStatus(currentTask ? `Task ${currentTask} annullata.` : "Operazione annullata.");
     } catch (_e) {
       setStatus("Annullamento fallito (verifica backend).");
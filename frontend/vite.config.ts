@@ -8,6 +8,9 @@ export default defineConfig({
     proxy: {
       "/main": "http://127.0.0.1:8000",
       "/task_status": "http://127.0.0.1:8000",
+      "/progress": "http://127.0.0.1:8000",
+      "/stream": "http://127.0.0.1:8000",
+      "/cancel": "http://127.0.0.1:8000",
     },
   },
 });
\ No newline at end of file
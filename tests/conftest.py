@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import sqdb, sqdb_pipe
+
+
+def _file_session(base, path):
+    # Un file per test: i thread (asyncio.to_thread) hanno ognuno la propria connessione
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+
+@pytest.fixture
+def db2_factory(tmp_path):
+    """Sessioni su un key_flow.db temporaneo (tabelle Workflow, AllData, snapshot)."""
+    return _file_session(sqdb_pipe.Base, tmp_path / "key_flow.db")
+
+
+@pytest.fixture
+def db2(db2_factory):
+    session = db2_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def db_factory(tmp_path):
+    """Sessioni su un assunzioni.db temporaneo (messaggi, blob, sessioni)."""
+    return _file_session(sqdb.Base, tmp_path / "assunzioni.db")
+
+
+@pytest.fixture
+def db(db_factory):
+    session = db_factory()
+    yield session
+    session.close()
@@ -0,0 +1,75 @@
+import asyncio
+
+from backend import autocv
+
+
+def test_document_accepted_uses_weighted_rule():
+    assert autocv._document_accepted([10.0] * 7)
+    # Una sezione sotto 5 blocca il documento anche con media alta
+    assert not autocv._document_accepted([4.9] + [10.0] * 6)
+    # Sezione 3 (peso più alto) bassa: tutte >= 5 ma media ponderata insufficiente
+    assert not autocv._document_accepted([10.0, 10.0, 6.0, 10.0, 10.0, 10.0, 10.0])
+
+
+def _fake_sections(monkeypatch, scores_by_attempt):
+    """_pipeline_section finto: il punteggio dipende da sezione e numero di chiamata della sezione."""
+    calls = {}
+
+    async def fake(section, user_info, history, semaphore, feedback, cache=True):
+        n = calls.setdefault(section, [])
+        n.append(feedback)
+        score = scores_by_attempt[min(len(n), len(scores_by_attempt)) - 1][section - 1]
+        return f"testo {section}.{len(n)}", f"Punteggio: {score}", score
+
+    monkeypatch.setattr(autocv, "_pipeline_section", fake)
+    return calls
+
+
+def test_pipelined_retries_only_low_sections(monkeypatch):
+    calls = _fake_sections(monkeypatch, [
+        [10.0, 10.0, 6.0, 10.0, 10.0, 10.0, 10.0],
+        [10.0, 10.0, 10.0, 10.0, 10.0, 10.0, 10.0],
+    ])
+    texts, judges, scores, attempts = asyncio.run(
+        autocv._run_pipelined("u", [""] * 7, max_attempts=3)
+    )
+    assert attempts == 2
+    assert autocv._document_accepted(scores)
+    # Solo la sezione 3 è stata rigenerata, con il proprio giudizio come feedback
+    assert len(calls[3]) == 2 and calls[3][1] == "Punteggio: 6.0"
+    assert all(len(calls[s]) == 1 for s in autocv.SECTIONS if s != 3)
+    assert texts[2] == "testo 3.2"
+
+
+def test_pipelined_gives_up_after_max_attempts(monkeypatch):
+    # Una sezione resta sotto 5 a ogni tentativo: il documento non è mai accettato
+    calls = _fake_sections(monkeypatch, [[4.0, 10.0, 10.0, 10.0, 10.0, 10.0, 10.0]])
+    _, _, scores, attempts = asyncio.run(autocv._run_pipelined("u", [""] * 7, max_attempts=3))
+    assert attempts == 3
+    assert not autocv._document_accepted(scores)
+    assert len(calls[1]) == 3
+
+
+def test_pipeline_section_prompts_go_through_templates(monkeypatch):
+    """I prompt di /autocv passano da prompt_templates e compaiono in /admin/prompt_templates."""
+    calls = []
+
+    def compose(kind, section, prefix, dynamic):
+        calls.append((kind, section))
+        return kind
+
+    monkeypatch.setattr(autocv.prompt_templates, "_compose", compose)
+    monkeypatch.setattr(autocv.prompt_templates, "_prefix", lambda kind, section: None)
+    monkeypatch.setattr(autocv, "prejudge", lambda *a: None)
+    monkeypatch.setattr(autocv, "sample_text", lambda section: "")
+    monkeypatch.setattr(autocv.llm_cache, "record_prejudge", lambda result: None)
+
+    async def fake_call(model, prompt, temperature=0.7, cache=True):
+        return "Punteggio: 9" if prompt == "judge" else "testo"
+
+    monkeypatch.setattr(autocv, "call_regolo_completion_async", fake_call)
+    text, judge_text, score = asyncio.run(
+        autocv._pipeline_section(3, "u", "", asyncio.Semaphore(1), None, cache=False)
+    )
+    assert (text, score) == ("testo", 9.0)
+    assert calls == [("cv", 3), ("judge", 3)]
@@ -0,0 +1,55 @@
+import pytest
+
+from backend import blobs
+from backend.history import load_turns
+from backend.sqdb import Blob, ChatSession
+
+TEXT = "Contratto di assunzione a tempo indeterminato. " * 200 + "Firma: Mario Rossi, è tutto"
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(blobs, "_cache", blobs.OrderedDict())
+
+
+@pytest.mark.parametrize("codec", ["zstd", "zlib"])
+def test_blob_round_trip(db, monkeypatch, codec):
+    if codec == "zlib":
+        monkeypatch.setattr(blobs, "zstandard", None)
+    elif blobs.zstandard is None:
+        pytest.skip("zstandard non installato")
+    h = blobs.put_blob(db, TEXT)
+    db.commit()
+
+    row = db.get(Blob, h)
+    assert row.codec == codec
+    assert row.size == len(TEXT.encode("utf-8"))
+    assert len(row.data) < row.size // 10
+
+    # Dal DB, non dalla cache in RAM
+    blobs._cache.clear()
+    assert blobs.get_blobs(db, [h]) == {h: TEXT}
+
+
+def test_same_text_is_stored_once(db):
+    assert blobs.put_blob(db, TEXT) == blobs.put_blob(db, TEXT)
+    db.commit()
+    assert db.query(Blob).count() == 1
+
+
+def test_messages_with_shared_prefix_round_trip(db):
+    prefix = "Template statico del prompt. " * 100
+    for question in ("prima richiesta", "seconda richiesta"):
+        blobs.add_message(db, "s1", "User", question)
+        blobs.add_message(db, "s1", "Assistant", prefix + question, blobs.split_prefix(prefix + question, prefix))
+    db.commit()
+
+    # Prefisso comune salvato una volta: 1 blob per il prefisso + 1 per ciascun resto
+    assert db.query(Blob).count() == 3
+    assert db.query(ChatSession).filter(ChatSession.type == "User").first().blob_hashes is None
+
+    blobs._cache.clear()
+    assert load_turns(db, "s1") == [
+        ("User", "prima richiesta"), ("Assistant", prefix + "prima richiesta"),
+        ("User", "seconda richiesta"), ("Assistant", prefix + "seconda richiesta"),
+    ]
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    cancelled = []
+
+    async def fake_acancel_run(run_id):
+        cancelled.append(run_id)
+        return {"run_id": run_id, "revoked": 1, "forgotten": 0, "sections_cancelled": 7}
+
+    monkeypatch.setattr(main, "current_run", lambda token: {"tok-a": "run-a"}.get(token))
+    monkeypatch.setattr(main, "unregister_run", lambda token, run_id: None)
+    monkeypatch.setattr(main, "acancel_run", fake_acancel_run)
+    # Senza "with": niente lifespan (DB su file, Regolo)
+    yield TestClient(main.app), cancelled
+
+
+def test_cancel_own_run(client):
+    http, cancelled = client
+    http.cookies.set("session_token", "tok-a")
+    resp = http.post("/cancel/run-a")
+    assert resp.status_code == 200
+    assert resp.json()["sections_cancelled"] == 7
+    assert cancelled == ["run-a"]
+
+
+def test_cancel_other_session_run_is_refused(client):
+    http, cancelled = client
+    http.cookies.set("session_token", "tok-b")
+    assert http.post("/cancel/run-a").status_code == 404
+    assert cancelled == []
+
+
+def test_cancel_without_session_is_refused(client):
+    http, cancelled = client
+    assert http.post("/cancel/run-a").status_code == 404
+    assert cancelled == []
+
+
+def test_acancel_run_writes_through_sync_session(db2_factory, monkeypatch):
+    from backend import events, sqdb_pipe
+    from backend.sqdb_pipe import Workflow, seed_runs
+
+    async def apublish(run_id, event):
+        pass
+
+    monkeypatch.setattr(sqdb_pipe, "SessionLocal", db2_factory)
+    monkeypatch.setattr(main, "EXECUTION_ENGINE", "inline")
+    monkeypatch.setattr(events, "apublish", apublish)
+    db2 = db2_factory()
+    seed_runs(db2, ["run-a"])
+    db2.query(Workflow).filter(Workflow.section == 1).update({Workflow.status: "giudicato"})
+    db2.commit()
+
+    stats = asyncio.run(main.acancel_run("run-a"))
+    assert stats["sections_cancelled"] == 6
+    statuses = {r.section: r.status for r in db2.query(Workflow)}
+    assert statuses[1] == "giudicato"
+    assert {statuses[s] for s in range(2, 8)} == {"annullato"}
+    db2.close()
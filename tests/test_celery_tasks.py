@@ -0,0 +1,50 @@
+import pytest
+from celery.exceptions import Ignore
+
+from backend import events, main
+from backend.sqdb_pipe import AllData, Workflow, seed_runs
+
+
+@pytest.fixture
+def section_row(db2_factory, monkeypatch):
+    """Riga della sezione 1 di una run, con DB in RAM e Regolo/eventi finti."""
+    monkeypatch.setattr(main, "get_db2", lambda: iter([db2_factory()]))
+    monkeypatch.setattr(events, "publish_status", lambda *a, **k: None)
+    monkeypatch.setattr(main, "regolo_call_sync", lambda *a, **k: "Testo della sezione")
+    monkeypatch.setattr(main, "generation_prompt", lambda *a, **k: "prompt")
+    monkeypatch.setattr(main.complete_creation, "update_state", lambda **k: None)
+    db2 = db2_factory()
+    seed_runs(db2, ["run-1"])
+    row_id = db2.query(Workflow.id).filter(Workflow.section == 1).scalar()
+    db2.close()
+    return row_id
+
+
+def _status(db2_factory, row_id):
+    db2 = db2_factory()
+    try:
+        return db2.get(Workflow, row_id).status, db2.query(AllData).count()
+    finally:
+        db2.close()
+
+
+def test_section_accepted(section_row, db2_factory, monkeypatch):
+    monkeypatch.setattr(main, "judge_section_sync", lambda *a, **k: (9.8, "ok"))
+    out = main.complete_creation(task_id=section_row, user_info="u", conversation_history="")
+    assert out["status"] == "ok"
+    assert _status(db2_factory, section_row) == ("giudicato", 1)
+
+
+def test_cancel_during_judging_is_kept(section_row, db2_factory, monkeypatch):
+    def judge_then_cancel(*args, **kwargs):
+        # Nuova richiesta della stessa sessione mentre il giudice lavora
+        other = db2_factory()
+        other.get(Workflow, section_row).status = "annullato"
+        other.commit()
+        other.close()
+        return 9.8, "ok"
+
+    monkeypatch.setattr(main, "judge_section_sync", judge_then_cancel)
+    with pytest.raises(Ignore):
+        main.complete_creation(task_id=section_row, user_info="u", conversation_history="")
+    assert _status(db2_factory, section_row) == ("annullato", 0)
@@ -0,0 +1,55 @@
+import pytest
+
+from backend import history
+from backend.tokens import estimate_tokens
+
+
+def _turns(n, words=40):
+    return [("User", f"messaggio {i} " + "parola " * words) for i in range(n)]
+
+
+@pytest.mark.parametrize("keep", ["head", "tail"])
+def test_truncate_to_tokens_respects_budget(keep):
+    text = " ".join(f"parola{i}" for i in range(500))
+    cut = history.truncate_to_tokens(text, 50, keep=keep)
+    assert estimate_tokens(cut) <= 50
+    assert cut.startswith("parola0") if keep == "head" else cut.endswith("parola499")
+    assert history.truncate_to_tokens("breve", 50) == "breve"
+    assert history.truncate_to_tokens(text, 0) == ""
+
+
+def test_history_keeps_most_recent_turns_within_budget():
+    turns = _turns(30)
+    out = history.build_history(turns, budget=200)
+    assert estimate_tokens(out) <= 200
+    assert "messaggio 29" in out
+    assert "messaggio 0 " not in out
+    # Ordine cronologico: il turno più recente resta in fondo
+    assert out.split("\n\n")[-1].startswith("User: messaggio 29")
+
+
+def test_oldest_kept_turn_is_truncated_not_dropped():
+    turns = [("User", "vecchio " + "dettaglio " * 200), ("User", "recente")]
+    out = history.build_history(turns, budget=100)
+    assert out.startswith("User: vecchio") and "[…]" in out
+    assert out.endswith("User: recente")
+    assert estimate_tokens(out) <= 100
+
+
+def test_previous_text_replaces_generated_documents():
+    turns = [("User", "prima richiesta"), ("Assistant", "DOCUMENTO " * 300), ("User", "cambia lo stipendio")]
+    out = history.build_history(turns, budget=300, previous_text="Sezione precedente " * 200)
+    assert out.startswith("Testo precedente di questa sezione:")
+    assert "DOCUMENTO" not in out
+    assert "User: cambia lo stipendio" in out
+    assert estimate_tokens(out) <= 300
+
+
+def test_section_histories_use_per_section_budgets(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_TOKENS", 400)
+    out = history.section_histories(_turns(50))
+    assert len(out) == 7
+    for section, text in zip(history.SECTIONS, out):
+        assert estimate_tokens(text) <= history.section_budget(section)
+    # La sezione 3 (dettagli del contratto) ha tutto il budget, la 2 (oggetto) un quarto
+    assert estimate_tokens(out[2]) > estimate_tokens(out[1])
@@ -0,0 +1,47 @@
+from backend.incremental import load_snapshot, reuse_sections, save_snapshot, sections_to_regenerate
+from backend.sqdb_pipe import Workflow, seed_runs
+
+
+def _accept_run(db2, run_id):
+    rows = db2.query(Workflow).filter(Workflow.run_id == run_id).all()
+    for row in rows:
+        row.text, row.score, row.notes, row.status = f"Sezione {row.section}", 9.8, "ok", "giudicato"
+    db2.commit()
+    return rows
+
+
+def test_first_turn_regenerates_everything(db2):
+    assert sections_to_regenerate("stipendio 30000 euro", load_snapshot(db2, "s1")) == set(range(1, 8))
+
+
+def test_correction_reuses_accepted_sections(db2):
+    seed_runs(db2, ["run-1"])
+    save_snapshot(db2, "s1", "run-1", _accept_run(db2, "run-1"))
+
+    snapshot = load_snapshot(db2, "s1")
+    regenerate = sections_to_regenerate("Porta lo stipendio a 32000 euro lordi", snapshot)
+    assert regenerate == {3}
+
+    seed_runs(db2, ["run-2"])
+    assert reuse_sections(db2, "run-2", snapshot, regenerate) == [1, 2, 4, 5, 6, 7]
+    rows = {r.section: r for r in db2.query(Workflow).filter(Workflow.run_id == "run-2")}
+    assert rows[3].status == "da_generare" and rows[3].text is None
+    assert rows[4].status == "giudicato" and rows[4].text == "Sezione 4" and rows[4].score == 9.8
+
+
+def test_unrecognised_correction_regenerates_everything(db2):
+    seed_runs(db2, ["run-1"])
+    save_snapshot(db2, "s1", "run-1", _accept_run(db2, "run-1"))
+    assert sections_to_regenerate("rifallo meglio", load_snapshot(db2, "s1")) == set(range(1, 8))
+
+
+def test_snapshot_keeps_only_accepted_sections(db2):
+    seed_runs(db2, ["run-1"])
+    rows = _accept_run(db2, "run-1")
+    rows[0].status = "da_generare"
+    db2.commit()
+    save_snapshot(db2, "s1", "run-1", rows)
+    snapshot = load_snapshot(db2, "s1")
+    assert set(snapshot) == set(range(2, 8))
+    # Documento precedente incompleto: si rigenera tutto
+    assert sections_to_regenerate("stipendio 30000 euro", snapshot) == set(range(1, 8))
@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend import events, inline_engine, main
+from backend.sqdb_pipe import Workflow, seed_runs
+
+
+@pytest.fixture
+def engine(db2_factory, monkeypatch):
+    """Motore inline su un DB temporaneo, con Regolo, giudice ed eventi finti."""
+    published = []
+
+    async def apublish(run_id, event):
+        published.append(event)
+
+    async def generate(model, prompt, on_delta=None, cache=True):
+        return "Testo" if "giudizio finale" not in prompt else "Giudizio finale"
+
+    async def judge(section, text, cache=True):
+        return 9.8, "ok"
+
+    monkeypatch.setattr(inline_engine, "get_db2", lambda: iter([db2_factory()]))
+    monkeypatch.setattr(inline_engine, "REGOLO_STREAM", False)
+    monkeypatch.setattr(inline_engine, "JUDGE_MODE", "section")
+    monkeypatch.setattr(inline_engine, "generation_prompt", lambda *a, **k: "prompt")
+    monkeypatch.setattr(inline_engine, "judge_final_prompt", lambda notes: "giudizio finale")
+    monkeypatch.setattr(inline_engine, "regolo_call_async", generate)
+    monkeypatch.setattr(inline_engine, "judge_section_async", judge)
+    monkeypatch.setattr(inline_engine, "save_final_messages", lambda *a: None)
+    monkeypatch.setattr(events, "apublish", apublish)
+    monkeypatch.setattr(events, "publish_status", lambda *a, **k: None)
+    monkeypatch.setattr(inline_engine, "_runs", {})
+
+    db2 = db2_factory()
+    seed_runs(db2, ["run-1"])
+    db2.close()
+    return published
+
+
+def _statuses(db2_factory):
+    db2 = db2_factory()
+    try:
+        return {r.section: r.status for r in db2.query(Workflow).filter(Workflow.run_id == "run-1")}
+    finally:
+        db2.close()
+
+
+def _start():
+    return inline_engine.start_run("run-1", None, "info", [""] * 7)
+
+
+def test_run_completes_and_reports_result(engine, db2_factory):
+    async def scenario():
+        _start()
+        await inline_engine.get_run("run-1").task
+        return main._inline_task_status("run-1", inline_engine.get_run("run-1"))
+
+    status = asyncio.run(scenario())
+    assert status.final_cv
+    assert status.score > 0
+    assert set(_statuses(db2_factory).values()) == {"giudicato"}
+    assert engine[-1]["type"] == "done"
+
+
+def test_cancel_running_run(engine, monkeypatch):
+    async def slow(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(inline_engine, "regolo_call_async", slow)
+
+    async def scenario():
+        _start()
+        await asyncio.sleep(0.1)
+        assert inline_engine.cancel_run("run-1") is True
+        run = inline_engine.get_run("run-1")
+        await asyncio.gather(run.task, return_exceptions=True)
+        return run
+
+    run = asyncio.run(scenario())
+    # Resta nel registro come annullata
+    assert inline_engine.get_run("run-1") is run
+    assert main._inline_task_status("run-1", run).feedback == "Task state: REVOKED"
+
+
+def test_cancel_after_completion_keeps_result(engine):
+    async def scenario():
+        _start()
+        await inline_engine.get_run("run-1").task
+        return inline_engine.cancel_run("run-1")
+
+    assert asyncio.run(scenario()) is False
+    assert main._inline_task_status("run-1", inline_engine.get_run("run-1")).final_cv
+
+
+def test_sections_cancelled_elsewhere_report_revoked(engine, db2_factory, monkeypatch):
+    async def judge_then_cancel(section, text, cache=True):
+        # Nuova richiesta della stessa sessione (anche da un altro processo): righe "annullato"
+        db2 = db2_factory()
+        db2.query(Workflow).update({Workflow.status: "annullato"})
+        db2.commit()
+        db2.close()
+        return 9.8, "ok"
+
+    monkeypatch.setattr(inline_engine, "judge_section_async", judge_then_cancel)
+
+    async def scenario():
+        _start()
+        run = inline_engine.get_run("run-1")
+        await asyncio.gather(run.task, return_exceptions=True)
+        return run
+
+    run = asyncio.run(scenario())
+    assert isinstance(run.task.exception(), inline_engine.RunCancelled)
+    assert main._inline_task_status("run-1", run).feedback == "Task state: REVOKED"
+    assert set(_statuses(db2_factory).values()) == {"annullato"}
+
+
+def test_failure_marks_open_sections_and_publishes_failed(engine, db2_factory, monkeypatch):
+    async def judge_down(section, text, cache=True):
+        raise RuntimeError("giudice giù")
+
+    monkeypatch.setattr(inline_engine, "judge_section_async", judge_down)
+
+    async def scenario():
+        _start()
+        run = inline_engine.get_run("run-1")
+        await asyncio.gather(run.task, return_exceptions=True)
+        return run
+
+    run = asyncio.run(scenario())
+    assert set(_statuses(db2_factory).values()) == {"failed"}
+    assert engine[-1] == {"type": "failed", "detail": "giudice giù"}
+    with pytest.raises(HTTPException) as exc:
+        main._inline_task_status("run-1", run)
+    assert exc.value.status_code == 500
+
+
+def test_run_generates_only_sections_not_reused(engine, db2_factory, monkeypatch):
+    prompts = []
+
+    def prompt(section, *args, **kwargs):
+        prompts.append(section)
+        return "prompt"
+
+    monkeypatch.setattr(inline_engine, "generation_prompt", prompt)
+    db2 = db2_factory()
+    db2.query(Workflow).filter(Workflow.run_id == "run-1", Workflow.section != 3).update(
+        {Workflow.text: "Riusata", Workflow.score: 9.8, Workflow.status: "giudicato"}, synchronize_session=False
+    )
+    db2.commit()
+    db2.close()
+
+    async def scenario():
+        _start()
+        await inline_engine.get_run("run-1").task
+
+    asyncio.run(scenario())
+    assert prompts == [3]
+    assert set(_statuses(db2_factory).values()) == {"giudicato"}
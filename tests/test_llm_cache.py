@@ -0,0 +1,14 @@
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from backend import llm_cache
+
+
+def test_stats_without_redis_reports_unavailable(monkeypatch):
+    # Porta chiusa: ogni comando solleva ConnectionError
+    down = redis.Redis(host="127.0.0.1", port=1, socket_connect_timeout=0.2, retry=Retry(NoBackoff(), 0))
+    monkeypatch.setattr(llm_cache, "_redis_cache", down)
+    out = llm_cache.stats()
+    assert out["available"] is False
+    assert out["enabled"] == llm_cache.LLM_CACHE_ENABLED
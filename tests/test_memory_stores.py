@@ -0,0 +1,34 @@
+import threading
+
+from backend.memory_stores import SessionMemoryStores
+
+
+def test_concurrent_puts_keep_byte_accounting_consistent():
+    stores = SessionMemoryStores(max_sessions=4, max_bytes=20_000, idle_ttl=0)
+    sessions = [f"s{i}" for i in range(6)]
+
+    def writer(n: int):
+        for i in range(300):
+            memory = stores.get(sessions[(n + i) % len(sessions)])
+            memory.put(("ns", "memories"), f"k{i % 7}", {"text": "x" * (i % 50 + n)})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with stores._lock:
+        for memory in stores._entries.values():
+            assert memory.nbytes == sum(memory.sizes.values())
+        assert stores._bytes == sum(m.nbytes for m in stores._entries.values())
+        assert len(stores._entries) <= stores.max_sessions
+
+
+def test_overwrite_counts_only_the_difference():
+    stores = SessionMemoryStores(max_sessions=2, max_bytes=10_000, idle_ttl=0)
+    memory = stores.get("s")
+    memory.put(("s", "memories"), "user", {"text": "a" * 100})
+    first = stores.stats()["bytes"]
+    memory.put(("s", "memories"), "user", {"text": "a" * 10})
+    assert stores.stats()["bytes"] == first - 90
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+from backend import pipeline
+
+
+def _response(sezioni, riepilogo="Documento solido"):
+    return "Ecco il giudizio:\n" + json.dumps({"sezioni": sezioni, "riepilogo": riepilogo}) + "\nFine."
+
+
+def test_parse_batch_verdicts_reads_json_inside_text():
+    verdicts, summary = pipeline.parse_batch_verdicts(
+        _response({"1": {"punteggio": 9, "note": "ok"}, "3": {"punteggio": "7.5", "note": "manca il CCNL"}}),
+        [1, 3],
+    )
+    assert verdicts == {1: (9.0, "Punteggio: 9.0\nok"), 3: (7.5, "Punteggio: 7.5\nmanca il CCNL")}
+    assert summary == "Documento solido"
+
+
+def test_parse_batch_verdicts_skips_malformed_items():
+    verdicts, summary = pipeline.parse_batch_verdicts(
+        _response({"1": {"punteggio": "alto"}, "2": "9", "4": {"punteggio": 8}}, riepilogo=["a", "b"]),
+        [1, 2, 3, 4],
+    )
+    assert verdicts == {4: (8.0, "Punteggio: 8.0")}
+    assert summary == "- a\n- b"
+
+
+@pytest.mark.parametrize("text", ["nessun JSON qui", "{non valido}", "[1, 2]", '{"sezioni": [1]}'])
+def test_parse_batch_verdicts_without_usable_json(text):
+    assert pipeline.parse_batch_verdicts(text, [1, 2]) == ({}, "")
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    """Giudice batch con verdetti locali per la sezione 2 e giudizio singolo finto."""
+    calls = {"batch": [], "single": []}
+
+    def local(section, text, cache):
+        return (10.0, "locale") if section == 2 else None
+
+    async def alocal(section, text, cache):
+        return local(section, text, cache)
+
+    def batch_prompt(pending):
+        calls["batch"].append(sorted(pending))
+        return "prompt batch"
+
+    def single(section, text, cache=True):
+        calls["single"].append(section)
+        return 6.0, "singolo"
+
+    async def asingle(section, text, cache=True):
+        return single(section, text, cache)
+
+    response = _response({"1": {"punteggio": 9, "note": "ok"}})
+    monkeypatch.setattr(pipeline, "_local_verdict", local)
+    monkeypatch.setattr(pipeline, "_alocal_verdict", alocal)
+    monkeypatch.setattr(pipeline.prompt_templates, "batch_judge_prompt", batch_prompt)
+    monkeypatch.setattr(pipeline, "regolo_call_sync", lambda *a, **k: response)
+
+    async def acall(*args, **kwargs):
+        return response
+
+    monkeypatch.setattr(pipeline, "regolo_call_async", acall)
+    monkeypatch.setattr(pipeline, "judge_section_sync", single)
+    monkeypatch.setattr(pipeline, "judge_section_async", asingle)
+    return calls
+
+
+EXPECTED = {1: (9.0, "Punteggio: 9.0\nok"), 2: (10.0, "locale"), 3: (6.0, "singolo")}
+
+
+def test_judge_batch_sync_falls_back_for_missing_sections(batch):
+    verdicts, summary = pipeline.judge_batch_sync({1: "a", 2: "b", 3: "c"}, cache=False)
+    assert verdicts == EXPECTED
+    assert summary == "Documento solido"
+    # La sezione decisa localmente resta fuori dal prompt, la 3 (assente) va al giudice singolo
+    assert batch["batch"] == [[1, 3]]
+    assert batch["single"] == [3]
+
+
+def test_judge_batch_async_falls_back_for_missing_sections(batch):
+    verdicts, summary = asyncio.run(pipeline.judge_batch_async({1: "a", 2: "b", 3: "c"}, cache=False))
+    assert verdicts == EXPECTED
+    assert batch["batch"] == [[1, 3]] and batch["single"] == [3]
+
+
+def test_judge_batch_skips_call_when_all_local(batch):
+    assert pipeline.judge_batch_sync({2: "b"}, cache=False) == ({2: (10.0, "locale")}, "")
+    assert batch["batch"] == []
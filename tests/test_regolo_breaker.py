@@ -0,0 +1,97 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend import ratelimit, regolo
+from backend.resilience import AdaptiveLimiter, CircuitBreaker
+
+
+@pytest.fixture
+def half_open(monkeypatch):
+    """Circuito appena passato a half_open: la prossima chiamata è la prova."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    monkeypatch.setattr(regolo, "breaker", breaker)
+    monkeypatch.setattr(regolo, "limiter", AdaptiveLimiter(4, 1, 8))
+    monkeypatch.setattr(regolo, "REGOLO_MAX_RETRIES", 0)
+    return breaker
+
+
+def _client(handler) -> httpx.Client:
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def _ok(request):
+    return httpx.Response(200, json={"choices": [{"text": " ok "}]})
+
+
+def test_probe_success_closes_circuit(half_open):
+    assert regolo.regolo_call_sync("m", "p", client=_client(_ok), cache=False) == "ok"
+    assert half_open.state == "closed"
+
+
+def test_quota_timeout_resolves_probe(half_open, monkeypatch):
+    def _timeout(tokens):
+        raise ratelimit.RateLimitTimeout("quota")
+
+    monkeypatch.setattr(ratelimit, "acquire", _timeout)
+    with pytest.raises(regolo.RegoloUnavailable):
+        regolo.regolo_call_sync("m", "p", client=_client(_ok), cache=False)
+    assert half_open.state == "open"
+    assert regolo.limiter.in_flight == 0
+
+    monkeypatch.undo()
+    monkeypatch.setattr(regolo, "breaker", half_open)
+    assert regolo.regolo_call_sync("m", "p", client=_client(_ok), cache=False) == "ok"
+    assert half_open.state == "closed"
+
+
+def test_quota_timeout_is_not_a_failure_when_closed(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    monkeypatch.setattr(regolo, "breaker", breaker)
+    monkeypatch.setattr(regolo, "limiter", AdaptiveLimiter(4, 1, 8))
+    monkeypatch.setattr(regolo, "REGOLO_MAX_RETRIES", 0)
+
+    def _timeout(tokens):
+        raise ratelimit.RateLimitTimeout("quota")
+
+    monkeypatch.setattr(ratelimit, "acquire", _timeout)
+    # Con soglia 1 un solo errore contato aprirebbe il circuito
+    for _ in range(3):
+        with pytest.raises(regolo.RegoloUnavailable):
+            regolo.regolo_call_sync("m", "p", client=_client(_ok), cache=False)
+    assert breaker.snapshot() == {"state": "closed", "failures": 0}
+    assert regolo.limiter.limit == 4
+
+
+def test_unexpected_error_resolves_probe(half_open):
+    def _not_json(request):
+        return httpx.Response(200, content=b"<html>gateway</html>")
+
+    with pytest.raises(ValueError):
+        regolo.regolo_call_sync("m", "p", client=_client(_not_json), cache=False)
+    assert half_open.state == "open"
+    assert regolo.limiter.in_flight == 0
+    assert regolo.regolo_call_sync("m", "p", client=_client(_ok), cache=False) == "ok"
+
+
+def test_cancelled_probe_is_resolved(half_open):
+    async def _hang(request):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(_hang))
+        call = asyncio.ensure_future(regolo.regolo_call_async("m", "p", client=client, cache=False))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert half_open.state == "open"
+    assert regolo.limiter.in_flight == 0
+    # Il limite non si dimezza per una chiamata annullata
+    assert regolo.limiter.limit == 4
+    assert regolo.regolo_call_sync("m", "p", client=_client(_ok), cache=False) == "ok"
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from backend import resilience
+from backend.resilience import AdaptiveLimiter, CircuitBreaker, CircuitOpen
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", fake)
+    return fake
+
+
+# --- CircuitBreaker ---
+
+def _open(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow() is False
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_admits_a_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock.now += 29
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    clock.now += 1
+    assert breaker.allow() is True
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_probe_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow() is True
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() is False
+
+
+def test_probe_failure_reopens_and_probes_again_later(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow() is True
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    clock.now += 30
+    assert breaker.allow() is True
+
+
+# --- AdaptiveLimiter ---
+
+def _finish(limiter: AdaptiveLimiter, latency: float = 1.0, ok=True) -> None:
+    limiter._try_acquire()
+    limiter.release(latency, ok=ok)
+
+
+def test_limiter_bounds_in_flight():
+    limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=10)
+    assert limiter._try_acquire()
+    assert limiter._try_acquire()
+    assert not limiter._try_acquire()
+    limiter.release(1.0, ok=None)
+    assert limiter._try_acquire()
+
+
+def test_limiter_additive_increase(clock):
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=10)
+    for _ in range(4):
+        _finish(limiter)
+    assert limiter.limit == pytest.approx(5.0, abs=0.1)
+
+
+def test_limiter_increase_stops_at_maximum(clock):
+    limiter = AdaptiveLimiter(initial=3, minimum=1, maximum=3)
+    for _ in range(10):
+        _finish(limiter)
+    assert limiter.limit == 3
+
+
+def test_limiter_halves_on_error_once_per_window(clock):
+    limiter = AdaptiveLimiter(initial=8, minimum=1, maximum=10, decrease_window=1.0)
+    _finish(limiter, ok=False)
+    assert limiter.limit == 4
+    _finish(limiter, ok=False)
+    assert limiter.limit == 4
+    clock.now += 1.0
+    _finish(limiter, ok=False)
+    assert limiter.limit == 2
+
+
+def test_limiter_never_below_minimum(clock):
+    limiter = AdaptiveLimiter(initial=2, minimum=2, maximum=10, decrease_window=0)
+    for _ in range(3):
+        _finish(limiter, ok=False)
+    assert limiter.limit == 2
+
+
+def test_limiter_backs_off_on_latency_spike(clock):
+    limiter = AdaptiveLimiter(initial=10, minimum=1, maximum=20, latency_tolerance=2.0)
+    for _ in range(5):
+        _finish(limiter, latency=1.0)
+    before = limiter.limit
+    _finish(limiter, latency=10.0)
+    assert limiter.limit == pytest.approx(before * 0.9)
+
+
+def test_limiter_cancelled_call_leaves_limit_unchanged(clock):
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=10)
+    _finish(limiter, ok=None)
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+def test_limiter_async_acquire_waits_for_release():
+    limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1)
+
+    async def scenario():
+        await limiter.acquire_async()
+        waiter = asyncio.ensure_future(limiter.acquire_async(poll=0.01))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        limiter.release(0.1, ok=True)
+        await asyncio.wait_for(waiter, timeout=1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,35 @@
+import datetime
+import json
+
+from backend import sessions
+from backend.sqdb import SessionToken
+
+
+def test_init_session_store_migrates_once_at_startup(db_factory, tmp_path, monkeypatch):
+    legacy = tmp_path / "names_tokens.json"
+    legacy.write_text(json.dumps(["t1", "t2", "t1"]))
+    monkeypatch.setattr(sessions, "LEGACY_TOKENS_PATH", legacy)
+    monkeypatch.setattr(sessions, "SessionLocal", db_factory)
+    monkeypatch.setattr(sessions, "_store_ready", False)
+
+    db = db_factory()
+    past = datetime.datetime.now() - datetime.timedelta(days=1)
+    db.add(SessionToken(token="scaduto", created_at=past, expires_at=past))
+    db.commit()
+
+    sessions.init_session_store()
+    assert {t for (t,) in db.query(SessionToken.token)} == {"t1", "t2"}
+    assert not legacy.exists() and legacy.with_name("names_tokens.json.migrated").exists()
+
+    # Già fatto per questo processo: un nuovo file non viene più letto
+    legacy.write_text(json.dumps(["t3"]))
+    sessions.init_session_store()
+    assert db.get(SessionToken, "t3") is None
+    db.close()
+
+
+def test_resolve_session_token_reuses_valid_token(db):
+    token, created = sessions.resolve_session_token(db, None)
+    assert created
+    assert sessions.resolve_session_token(db, token) == (token, False)
+    assert sessions.resolve_session_token(db, "sconosciuto")[1] is True
@@ -0,0 +1,22 @@
+import datetime
+
+from backend.sqdb_pipe import Workflow, purge_expired_runs, seed_runs
+
+
+def test_seed_runs_inserts_seven_rows_per_run(db2):
+    assert seed_runs(db2, ["a", "b"]) == 14
+    rows = db2.query(Workflow).filter(Workflow.run_id == "a").order_by(Workflow.section).all()
+    assert [r.section for r in rows] == list(range(1, 8))
+    assert all(r.status == "da_generare" and r.created_at is not None for r in rows)
+
+
+def test_purge_removes_only_expired_runs(db2):
+    seed_runs(db2, ["old", "new"])
+    db2.query(Workflow).filter(Workflow.run_id == "old").update(
+        {Workflow.created_at: datetime.datetime.now() - datetime.timedelta(hours=2), Workflow.status: "annullato"},
+        synchronize_session=False,
+    )
+    db2.commit()
+
+    assert purge_expired_runs(db2, ttl_seconds=3600) == 7
+    assert {r.run_id for r in db2.query(Workflow)} == {"new"}
@@ -0,0 +1,38 @@
+from backend.validators import REJECT_SCORE, outcome, prejudge
+
+SAMPLE_SECTION_3 = """Luogo di lavoro: Milano, Via Roma 1
+Mansione: impiegato amministrativo
+Livello: 4 CCNL Commercio
+Orario di lavoro: 40 ore settimanali
+"""
+
+
+def test_synonymous_labels_are_deferred_to_the_llm_judge():
+    text = """Sede di lavoro: Torino, Corso Francia 10
+Mansione: impiegato amministrativo
+Inquadramento: 4 livello CCNL Commercio
+Orario: 30 ore settimanali (part-time)
+"""
+    assert prejudge(3, text, SAMPLE_SECTION_3) is None
+    assert outcome(prejudge(3, text, SAMPLE_SECTION_3)) == "deferred"
+
+
+def test_same_labels_as_sample_are_deferred():
+    assert prejudge(3, SAMPLE_SECTION_3, SAMPLE_SECTION_3) is None
+
+
+def test_section_without_any_field_is_rejected():
+    text = "Il lavoratore sarà assunto come impiegato amministrativo a Milano, a tempo pieno."
+    verdict = prejudge(3, text, SAMPLE_SECTION_3)
+    assert verdict is not None
+    assert verdict.score == REJECT_SCORE
+    assert "Luogo di lavoro" in verdict.notes
+
+
+def test_empty_section_is_rejected():
+    verdict = prejudge(6, "   \n", SAMPLE_SECTION_3)
+    assert verdict is not None and verdict.score == REJECT_SCORE
+
+
+def test_missing_sample_defers():
+    assert prejudge(4, "Testo libero senza voci.", "") is None